@@ -1,12 +1,70 @@
+import re
+
+from django.conf import settings
+from django.http import Http404
+from django.urls import get_script_prefix, set_script_prefix
+
+from world import cache, journal
 from world.models import World
 
 
+# URL prefix used to address a world by its name (e.g., `/worlds/speed/api/...`)
+WORLD_URL_PREFIX = re.compile(r'^/worlds/(?P<name>[-a-zA-Z0-9_]+)/')
+
+
+def resolve_world(request):
+    """
+    Determines the world addressed by a request.
+
+    The world is addressed by the URL prefix `/worlds/<name>/`, by the host name, or otherwise the default world is used.
+    The worlds are taken from the process-local cache, so that usually no queries are required (see `world.cache`).
+
+    :return: The world and the matched URL prefix (or `None`).
+    """
+    match = WORLD_URL_PREFIX.match(request.path_info)
+    if match is not None:
+        name  = match.group('name')
+        world = cache.find_world(('name', name), lambda: World.objects.filter(name = name).first())
+        if world is None:
+            raise Http404(f'No world named "{name}"')
+        return world, match.group(0)
+    host = request.get_host().split(':')[0]
+    return cache.find_world(('host', host), lambda: World.objects.filter(host = host).first() or World.objects.order_by('id').first()), None
+
+
 class WorldTickMiddleware:
+    """
+    Routes a request to the addressed world (`request.world`), and processes the pending ticks of that world before handling the request.
+    The changes made by the request are journaled (see `world.journal`).
+
+    If a world is addressed by its URL prefix, then the prefix is stripped from the path and added to the URLs generated while handling the request.
+
+    If a tick daemon is responsible for processing the ticks (`settings.TICK_DAEMON`), then this only checks whether the world is stale.
+    Pending ticks are then only processed if the world is overdue by more than `settings.TICK_DAEMON_GRACE_SECONDS` (e.g., if the daemon is not running).
+    """
 
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        world = World.objects.get()
-        world.do_pending_ticks()
-        return self.get_response(request)
+        world, prefix = resolve_world(request)
+        request.world = world
+        if world is not None and (not settings.TICK_DAEMON or world.overdue_seconds > settings.TICK_DAEMON_GRACE_SECONDS):
+            world.do_pending_ticks()
+
+        if world is None:
+            return self.get_response(request)
+
+        # Journal the changes made by the request as a single batch
+        with journal.recording(world, 'action'):
+            if prefix is None:
+                return self.get_response(request)
+
+            # Strip the prefix of the world from the path, and add it to the generated URLs
+            script_prefix = get_script_prefix()
+            request.path_info = request.path_info[len(prefix) - 1:]
+            set_script_prefix(script_prefix + prefix[1:])
+            try:
+                return self.get_response(request)
+            finally:
+                set_script_prefix(script_prefix)
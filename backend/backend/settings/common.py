@@ -133,3 +133,31 @@ REST_FRAMEWORK = {
 
 # Add random delays via middleware to simulate network jitter
 SIMUL_NETWORK_JITTER = False
+
+
+# Whether the ticks are processed by the tick daemon (`python manage.py tickdaemon`) instead of the requests
+TICK_DAEMON = False
+
+# Number of seconds a tick can be overdue before a request processes it, even though the tick daemon is responsible
+TICK_DAEMON_GRACE_SECONDS = 10
+
+# Number of seconds after which the lease for processing the ticks of a world expires (e.g., if the process holding it died)
+TICK_LEASE_SECONDS = 600
+
+# Lock file which ensures that only a single tick daemon is running
+TICK_DAEMON_LOCKFILE = BASE_DIR / 'tickdaemon.lock'
+
+# Number of seconds after which a world cached by a process is validated against the database, even if no tick is due (see `world.cache`)
+WORLD_CACHE_SECONDS = 5
+
+# Number of the most recent tick profiles kept in the database (0 disables storing them)
+TICK_PROFILE_SIZE = 1000
+
+# Whether the changes of the worlds are journaled (see `world.journal`)
+JOURNAL = True
+
+# Number of ticks between the snapshots of a world (0 disables periodic snapshots)
+JOURNAL_SNAPSHOT_INTERVAL = 1000
+
+# Number of the most recent snapshots kept per world (the journal is kept since the oldest of them)
+JOURNAL_SNAPSHOTS = 3
@@ -12,3 +12,5 @@ DEBUG = False
 ALLOWED_HOSTS = ['respublica.evoid.de']
 
 STATIC_ROOT = BASE_DIR / '../deployed'
+
+TICK_DAEMON = True
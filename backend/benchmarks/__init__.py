@@ -0,0 +1,45 @@
+"""
+Benchmarks for performance-critical parts of the backend.
+
+Run from the directory which contains `manage.py`, e.g.:
+```bash
+python -m benchmarks.hexgrid
+```
+"""
+
+import contextlib
+import os
+import time
+
+
+def measure(func, repeat=5):
+    """
+    Runs `func` repeatedly and returns the best wall time (in seconds).
+    """
+    timings = list()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+    return min(timings)
+
+
+@contextlib.contextmanager
+def test_database():
+    """
+    Sets up Django with a throwaway test database (for benchmarks which need the models).
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings.development')
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity = 0, autoclobber = True, serialize = False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity = 0)
+        teardown_test_environment()
@@ -0,0 +1,103 @@
+"""
+Compares the per-cell enumeration of hex sets with the vectorized one, the step-wise trajectory computation with the closed-form one, and the membership test of lazy unions with the run-length representation.
+"""
+
+import math
+
+import numpy as np
+
+from world import hexgrid
+from benchmarks import measure
+
+
+def explicit_per_cell(hexset):
+    """
+    Reference implementation which tests each cell of the bounding box individually.
+    """
+    result = list()
+    x_min, x_max, y_min, y_max = hexset.bbox()
+    for q in np.ndindex(x_max - x_min + 1, y_max - y_min + 1):
+        p = np.add((x_min, y_min), q)
+        if np.sum(p) % 2 == 0 and p in hexset:
+            result.append(p)
+    return result
+
+
+def explicit_vectorized(hexset):
+    candidates = hexgrid.bbox_hex_coordinates(hexset.bbox())
+    return list(candidates[hexset.contains_many(candidates)])
+
+
+def make_sets(radius):
+    set1 = hexgrid.DistanceSet((0, 0), radius)
+    set2 = hexgrid.DistanceSet((radius, radius % 2), radius)
+    return {
+        'DistanceSet' : set1,
+        'Union'       : hexgrid.Union([set1, set2]),
+        'Intersection': hexgrid.Intersection([set1, set2]),
+    }
+
+
+def trajectory_stepwise(position, destination, speed):
+    """
+    Reference implementation which computes each move by iterating over its steps.
+    """
+    trajectory = list()
+    pos = np.array(position)
+    while (pos != destination).any():
+        for _ in range(math.ceil(speed)):
+            d = np.subtract(destination, pos).clip(-2, +2)
+            if abs(d[1]) >= 1:
+                d = d.clip(-1, +1)
+                if np.sum(pos + d) % 2 == 1: d[0] -= 1
+            pos += d
+        trajectory.append(pos.copy())
+    return trajectory
+
+
+def trajectory_closed_form(position, destination, speed):
+    hexgrid._get_trajectory_towards.cache_clear()
+    return hexgrid.get_trajectory_towards(position, destination, speed)
+
+
+def main_explicit():
+    print(f'{"set":<14}{"radius":>8}{"cells":>10}{"per-cell [s]":>15}{"vectorized [s]":>16}{"speedup":>10}')
+    for radius in (1, 10, 100):
+        for name, hexset in make_sets(radius).items():
+            cells = len(explicit_vectorized(hexset))
+            t_ref = measure(lambda: explicit_per_cell(hexset), repeat = 1 if radius >= 100 else 3)
+            t_vec = measure(lambda: explicit_vectorized(hexset))
+            print(f'{name:<14}{radius:>8}{cells:>10}{t_ref:>15.6f}{t_vec:>16.6f}{t_ref / t_vec:>9.1f}x')
+
+
+def main_trajectory():
+    print(f'{"distance":>8}{"speed":>8}{"step-wise [s]":>15}{"closed-form [s]":>17}{"cached [s]":>12}')
+    for distance in (1, 10, 100):
+        for speed in (1, 3):
+            args = ((0, 0), (distance, distance), speed)
+            t_ref    = measure(lambda: trajectory_stepwise(*args))
+            t_closed = measure(lambda: trajectory_closed_form(*args))
+            t_cached = measure(lambda: hexgrid.get_trajectory_towards(*args))
+            print(f'{distance:>8}{speed:>8}{t_ref:>15.6f}{t_closed:>17.6f}{t_cached:>12.6f}')
+
+
+def main_run_length():
+    rng = np.random.default_rng(0)
+    print(f'{"sets":>6}{"Union [s]":>12}{"RunLengthSet [s]":>18}{"runs":>8}')
+    for num_sets in (10, 200):
+        centers = rng.integers(-50, 50, size = (num_sets, 2))
+        centers[:, 0] += np.sum(centers, axis=1) % 2
+        union_set = hexgrid.Union([hexgrid.DistanceSet(c, 1) for c in centers])
+        rls = hexgrid.RunLengthSet.from_hexset(union_set)
+        points = hexgrid.bbox_hex_coordinates((-52, 52, -52, 52))
+        t_union = measure(lambda: [p in union_set for p in points[:1000]], repeat = 1)
+        t_rls   = measure(lambda: [p in rls       for p in points[:1000]], repeat = 1)
+        print(f'{num_sets:>6}{t_union:>12.6f}{t_rls:>18.6f}{rls.num_runs:>8}')
+
+
+if __name__ == '__main__':
+    main_explicit()
+    print()
+    main_trajectory()
+    print()
+    main_run_length()
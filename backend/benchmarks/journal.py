@@ -0,0 +1,58 @@
+"""
+Compares restoring a world from the latest snapshot and the tail of the journal with restoring a full dump of the database.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from benchmarks import measure, test_database
+
+
+def setup(num_movables, num_ticks):
+    """
+    Generates a world with `num_movables` moving movables, takes a snapshot, and then processes `num_ticks` ticks (which are journaled).
+    """
+    from world import journal
+    from world.generator import generate_test_world
+    from world.models import Movable
+    from game.models import Empire, Blueprint, Ship
+    world = generate_test_world(radius = 30, density = 0.5, seed = 0)
+    blueprint = Blueprint.objects.get(empire = Empire.objects.get(), base_id = 'ships/colony-ship')
+    rng = np.random.default_rng(0)
+    for _ in range(num_movables):
+        position, destination = rng.integers(-30, 30, size = (2, 2))
+        position[0]    += np.sum(position)    % 2
+        destination[0] += np.sum(destination) % 2
+        movable = Movable.objects.create(position_x = position[0], position_y = position[1])
+        Ship.objects.create(movable = movable, blueprint = blueprint)
+        movable.move_to(destination)
+    journal.take_snapshot(world)
+    for _ in range(num_ticks):
+        world.tick()
+    return world
+
+
+def main():
+    from django.core.management import call_command
+    from world import journal
+    from world.models import JournalEntry, WorldSnapshot
+    world = setup(num_movables = 200, num_ticks = 50)
+    snapshot = WorldSnapshot.objects.filter(world = world).latest('id')
+    entries = JournalEntry.objects.filter(world = world)
+    print(f'snapshot: {len(snapshot.data) / 1024:.1f} KiB, journal: {entries.count()} entries, {sum(len(data) for data in entries.values_list("data", flat = True)) / 1024:.1f} KiB')
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, 'dump.json')
+        call_command('dumpdata', 'world.Sector', 'world.Celestial', 'world.Movable', 'world.Unveiled', 'world.TerritoryCell', 'game', 'processes', output = path, verbosity = 0)
+        print(f'dump: {os.path.getsize(path) / 1024:.1f} KiB')
+        t_dump    = measure(lambda: call_command('loaddata', path, verbosity = 0), repeat = 3)
+        t_journal = measure(lambda: journal.restore(world), repeat = 3)
+    print(f'{"loaddata [s]":>14}{"snapshot + journal [s]":>24}')
+    print(f'{t_dump:>14.3f}{t_journal:>24.3f}')
+
+
+if __name__ == '__main__':
+    with test_database():
+        main()
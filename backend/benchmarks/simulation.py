@@ -0,0 +1,238 @@
+"""
+Measures how the processing of the ticks scales with the size of the world and the number of players.
+
+For each scenario (radius and density of the world), a world is generated by `generate_world`, and `--empires` empires with `--fleets` fleets each are spawned.
+Then `--ticks` ticks are processed, and between the ticks the empires issue random orders (`move_to`, `build`, and `colonize`).
+The ticks per second, the percentiles of the tick time, the number of database queries, and the peak memory are reported.
+
+Each scenario runs in a separate process (so that the peak memory is measured per scenario), and the results can be written as JSON to compare them between commits, e.g.:
+```bash
+python -m benchmarks.simulation --radius 10 20 --density 0.2 0.5 --ticks 200 --output before.json
+python -m benchmarks.simulation --radius 10 20 --density 0.2 0.5 --ticks 200 --compare before.json
+```
+"""
+
+import argparse
+import json
+import logging
+import resource
+import subprocess
+import sys
+import time
+
+from django.db import connection, transaction
+import numpy as np
+
+from benchmarks import test_database
+
+
+ORDERS = ('move_to', 'build', 'colonize')
+
+
+def spawn_empires(world, rng, num_empires, num_fleets):
+    """
+    Spawns empires in randomly chosen sectors, each with a shipyard and `num_fleets` fleets of a colony ship.
+    """
+    from django.contrib.auth.models import User
+    from game.models import Empire, Blueprint, Construction, Ship
+    from world.models import Movable, Celestial, Unveiled
+    habitable = dict()
+    for celestial in Celestial.objects.filter(sector__world = world, features__capacity__gte = 2).select_related('sector').order_by('id'):
+        habitable.setdefault(celestial.sector_id, celestial)
+    assert len(habitable) >= num_empires, f'only {len(habitable)} sectors for {num_empires} empires'
+
+    empires = list()
+    for idx, sector_id in enumerate(rng.choice(sorted(habitable.keys()), size = num_empires, replace = False)):
+        celestial = habitable[sector_id]
+        empire = Empire.objects.create(
+            world     = world,
+            name      = f'Empire {idx + 1}',
+            player    = User.objects.create_user(username = f'player{idx + 1}', password = 'password'),
+            origin_x  = celestial.sector.position_x,
+            origin_y  = celestial.sector.position_y,
+            color_hue = idx / num_empires)
+        celestial.habitated_by = empire
+        celestial.save()
+        Construction.objects.create(blueprint = Blueprint.objects.get(empire = empire, base_id = 'constructions/shipyard'), celestial = celestial)
+        for fleet_idx in range(num_fleets):
+            Ship.objects.create(
+                blueprint = Blueprint.objects.get(empire = empire, base_id = 'ships/colony-ship'),
+                movable   = Movable.objects.create(world = world, name = f'Fleet {fleet_idx + 1}', position_x = celestial.sector.position_x, position_y = celestial.sector.position_y))
+        Unveiled.unveil(empire, celestial.sector.position, 1)
+        empires.append(empire)
+    return empires
+
+
+def issue_order(world, empire, order, rng, sector_positions):
+    """
+    Issues a random order of an empire.
+
+    :return: `True` if the order was issued, and `False` if it was rejected (e.g., no movable is in a sector with a free celestial).
+    """
+    from world import spatial
+    from world.models import Movable, Celestial
+    movables = list(Movable.objects.filter(world = world, owner = empire).order_by('id'))
+
+    if order == 'move_to':
+        if len(movables) == 0:
+            return False
+        movable = movables[rng.integers(len(movables))]
+        return movable.move_to(sector_positions[rng.integers(len(sector_positions))]) is not None
+
+    elif order == 'build':
+        celestials = list(Celestial.objects.filter(habitated_by = empire).select_related('sector').order_by('id'))
+        celestial  = celestials[rng.integers(len(celestials))]
+        blueprints = list(empire.blueprint_set.order_by('id'))
+        if celestial.sector.process is not None:
+            return False
+        return blueprints[rng.integers(len(blueprints))].build(celestial) is not None
+
+    else:
+        index = spatial.get_index(world.id, world.now)
+        for movable in rng.permutation(movables):
+            sector_id = index.sector_at(index.movable_positions.get(movable.id, movable.position))
+            if sector_id is None:
+                continue
+            celestial = Celestial.objects.filter(sector = sector_id, habitated_by = None).first()
+            if celestial is None or not movable.ship_set.filter(blueprint__base_id = 'ships/colony-ship').exists():
+                continue
+            try:
+                with transaction.atomic():
+                    celestial.colonize(empire, movable)
+                return True
+            except AssertionError:  ## e.g., the sector is colonized or claimed by another empire
+                pass
+        return False
+
+
+def run_scenario(radius, density, num_empires, num_fleets, num_ticks, order_rate, seed):
+    """
+    Generates a world, spawns the empires, and processes the ticks.
+
+    :return: The results of the scenario (as a dictionary).
+    """
+    from world import journal
+    from world.generator import generate_world
+    from world.models import Sector, Celestial
+    rng = np.random.default_rng(seed)
+    world = generate_world(radius, density, seed)
+    empires = spawn_empires(world, rng, num_empires, num_fleets)
+    sector_positions = [np.array(position) for position in Sector.objects.filter(world = world).order_by('id').values_list('position_x', 'position_y')]
+
+    queries = list()
+    def count_query(execute, sql, params, many, context):
+        queries[-1] += 1
+        return execute(sql, params, many, context)
+
+    orders = {order: dict(issued = 0, rejected = 0) for order in ORDERS}
+    tick_seconds = list()
+    for _ in range(num_ticks):
+
+        # Issue the orders of the players (as the requests would do)
+        for empire in empires:
+            if rng.random() < order_rate:
+                order = ORDERS[rng.integers(len(ORDERS))]
+                with journal.recording(world, 'action'):
+                    issued = issue_order(world, empire, order, rng, sector_positions)
+                orders[order]['issued' if issued else 'rejected'] += 1
+
+        queries.append(0)
+        t0 = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            world.tick()
+        tick_seconds.append(time.perf_counter() - t0)
+
+    tick_seconds = np.array(tick_seconds)
+    peak_memory_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform == 'darwin' else 1)
+    return dict(
+        radius     = radius,
+        density    = density,
+        sectors    = Sector   .objects.filter(world = world).count(),
+        celestials = Celestial.objects.filter(sector__world = world).count(),
+        empires    = num_empires,
+        fleets     = num_fleets,
+        ticks      = num_ticks,
+        orders     = orders,
+        ticks_per_second = num_ticks / tick_seconds.sum(),
+        tick_seconds = dict(
+            mean = tick_seconds.mean(),
+            p50  = np.percentile(tick_seconds, 50),
+            p99  = np.percentile(tick_seconds, 99),
+            max  = tick_seconds.max()),
+        queries = dict(
+            total = sum(queries),
+            mean  = np.mean(queries),
+            max   = max(queries)),
+        peak_memory_mib = peak_memory_kib / 1024)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.strip().split('\n')[0])
+    parser.add_argument('--radius' , type = int  , nargs = '+', default = [10, 20], help = 'Radii of the generated worlds.')
+    parser.add_argument('--density', type = float, nargs = '+', default = [0.5]   , help = 'Densities of the generated worlds.')
+    parser.add_argument('--empires', type = int  , default = 4  , help = 'Number of empires.')
+    parser.add_argument('--fleets' , type = int  , default = 5  , help = 'Number of fleets per empire.')
+    parser.add_argument('--ticks'  , type = int  , default = 100, help = 'Number of ticks.')
+    parser.add_argument('--order-rate', type = float, default = 0.5, help = 'Probability of an empire to issue an order before a tick.')
+    parser.add_argument('--seed'   , type = int  , default = 0)
+    parser.add_argument('--output' , default = None, help = 'Path of the JSON file which the results are written to.')
+    parser.add_argument('--compare', default = None, help = 'Path of a JSON file with previous results, which the results are compared to.')
+    parser.add_argument('--scenario', default = None, help = argparse.SUPPRESS)  ## used internally to run a single scenario
+    args = parser.parse_args()
+
+    # Run a single scenario (in a child process), and write its results to stdout
+    if args.scenario is not None:
+        logging.disable(logging.INFO)
+        with test_database():
+            results = run_scenario(**json.loads(args.scenario))
+        print(json.dumps(results, default = lambda value: value.item()))
+        return
+
+    parameters = dict(empires = args.empires, fleets = args.fleets, ticks = args.ticks, order_rate = args.order_rate, seed = args.seed)
+    scenarios = list()
+    print(f'{"radius":>7}{"density":>9}{"sectors":>9}{"ticks/s":>9}{"p50 [ms]":>10}{"p99 [ms]":>10}{"queries/tick":>14}{"peak [MiB]":>12}')
+    for radius in args.radius:
+        for density in args.density:
+            scenario = dict(radius = radius, density = density, num_empires = args.empires, num_fleets = args.fleets, num_ticks = args.ticks, order_rate = args.order_rate, seed = args.seed)
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.simulation', '--scenario', json.dumps(scenario)], capture_output = True, text = True, check = True).stdout
+            results = json.loads(output.strip().split('\n')[-1])
+            scenarios.append(results)
+            print(f'{radius:>7}{density:>9}{results["sectors"]:>9}{results["ticks_per_second"]:>9.1f}{1000 * results["tick_seconds"]["p50"]:>10.2f}{1000 * results["tick_seconds"]["p99"]:>10.2f}{results["queries"]["mean"]:>14.1f}{results["peak_memory_mib"]:>12.1f}')
+
+    if args.output is not None:
+        with open(args.output, 'w') as fp:
+            json.dump(dict(commit = git_commit(), parameters = parameters, scenarios = scenarios), fp, indent = 2)
+
+    if args.compare is not None:
+        compare(args.compare, parameters, scenarios)
+
+
+def compare(path, parameters, scenarios):
+    """
+    Prints the relative changes of the results with respect to previous results (of the scenarios which were run with the same parameters).
+    """
+    with open(path) as fp:
+        previous = json.load(fp)
+    if previous['parameters'] != parameters:
+        print(f'Parameters differ from {path}: {previous["parameters"]}')
+        return
+    previous_scenarios = {(results['radius'], results['density']): results for results in previous['scenarios']}
+    print(f'Compared to {path} (commit {previous["commit"]}):')
+    print(f'{"radius":>7}{"density":>9}{"ticks/s":>9}{"p50":>10}{"p99":>10}{"queries/tick":>14}{"peak":>12}')
+    for results in scenarios:
+        before = previous_scenarios.get((results['radius'], results['density']))
+        if before is None:
+            continue
+        change = lambda key, stat = None: (results[key] if stat is None else results[key][stat]) / (before[key] if stat is None else before[key][stat]) - 1
+        print(f'{results["radius"]:>7}{results["density"]:>9}{change("ticks_per_second"):>+9.1%}{change("tick_seconds", "p50"):>+10.1%}{change("tick_seconds", "p99"):>+10.1%}{change("queries", "mean"):>+14.1%}{change("peak_memory_mib"):>+12.1%}')
+
+
+if __name__ == '__main__':
+    main()
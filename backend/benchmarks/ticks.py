@@ -0,0 +1,82 @@
+"""
+Compares the tick time for a growing number of due movement processes, when finishing the processes one by one and in batches grouped by their handlers.
+"""
+
+from django.db import connection, transaction
+
+from benchmarks import measure, test_database
+
+
+class Rollback(Exception):
+    pass
+
+
+def setup(num_movables):
+    """
+    Creates a world with `num_movables` movables, which all have a movement process due in the next tick.
+    """
+    from django.contrib.auth.models import User
+    from game.models import Empire, Blueprint, Ship
+    from world.models import World, Movable
+    from processes.models import Process
+    world  = World.objects.get() if World.objects.exists() else World.objects.create()
+    Process.objects.all().delete()
+    Ship.objects.all().delete()
+    player = User.objects.create(username = f'benchmark{num_movables}')
+    empire = Empire.objects.create(name = f'Benchmark {num_movables}', player = player, origin_x = 0, origin_y = 0, color_hue = 0)
+    blueprint = Blueprint.objects.get(empire = empire, base_id = 'ships/colony-ship')
+    for idx in range(num_movables):
+        movable = Movable.objects.create(position_x = 2 * idx, position_y = 0)
+        Ship.objects.create(movable = movable, blueprint = blueprint)
+        movable.move_to((2 * idx, 100))
+    world.refresh_from_db()
+    return world
+
+
+def tick_per_process(world):
+    from processes.models import Process
+    world.now += 1
+    world.save()
+    for process in [process for process in Process.objects.filter(end_tick = world.now)]:
+        process.handler.finish(process)
+
+
+def tick_batched(world):
+    world.tick()
+
+
+def run(tick, world):
+    """
+    Performs a tick and rolls it back, so that it can be repeated on the same state.
+
+    :return: The number of queries performed during the tick.
+    """
+    queries = list()
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    now = world.now
+    try:
+        with transaction.atomic(), connection.execute_wrapper(count_query):
+            tick(world)
+            raise Rollback()
+    except Rollback:
+        world.now = now
+    return len(queries)
+
+
+def main():
+    print(f'{"processes":>10}{"per-process [s]":>17}{"queries":>9}{"batched [s]":>13}{"queries":>9}')
+    for num_movables in (10, 100, 1000):
+        world = setup(num_movables)
+        t_ref     = measure(lambda: run(tick_per_process, world), repeat = 3)
+        t_batched = measure(lambda: run(tick_batched,     world), repeat = 3)
+        q_ref     = run(tick_per_process, world)
+        q_batched = run(tick_batched,     world)
+        print(f'{num_movables:>10}{t_ref:>17.4f}{q_ref:>9}{t_batched:>13.4f}{q_batched:>9}')
+
+
+if __name__ == '__main__':
+    with test_database():
+        main()
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from game.models import Empire
+
+
+class Command(BaseCommand):
+    help = 'Re-computes the materialized territories of all empires (e.g., after migrating an existing database).'
+
+    @transaction.atomic()
+    def handle(self, *args, **options):
+        for empire in Empire.objects.all():
+            empire.update_territory()
+            self.stdout.write(f'{empire.name}: {empire.territory_cells.count()} hex fields')
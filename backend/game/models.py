@@ -1,20 +1,33 @@
 from django.core.exceptions import PermissionDenied
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 import numpy as np
 
-from world import hexgrid
+from world import cache, hexgrid, journal
+from world.models import default_world
+from world.pathfinding import CostMap, PathFinder
 from game.blueprints import base_blueprints
 
 
+# Cost of entering a hex field within the territory of another empire, when routing around foreign territory
+FOREIGN_TERRITORY_COST = 10
+
+# Path finders of the empires, along with the territory revisions of the worlds they were created for
+_pathfinders = dict()
+
+
 class Empire(models.Model):
 
-    name      = models.CharField(max_length = 100, unique = True)
-    player    = models.OneToOneField('auth.User', on_delete = models.SET_NULL, null = True)
+    world     = models.ForeignKey('world.World', on_delete = models.CASCADE, related_name = 'empires', default = default_world)
+    name      = models.CharField(max_length = 100)
+    player    = models.ForeignKey('auth.User', on_delete = models.SET_NULL, related_name = 'empires', null = True)
     origin_x  = models.IntegerField();
     origin_y  = models.IntegerField();
     color_hue = models.FloatField()
 
     class Meta:
+        unique_together = (('world', 'name'), ('world', 'player'))
         constraints = (
             models.CheckConstraint(
                 check = models.Q(color_hue__gte = 0) & models.Q(color_hue__lte = 1),
@@ -32,15 +45,67 @@ class Empire(models.Model):
 
     @property
     def territory(self):
+        return hexgrid.RunLengthSet.from_points(list(self.territory_cells.values_list('position_x', 'position_y')))
+
+    def update_territory(self):
+        """
+        Re-computes the materialized territory from the habitated sectors.
+        """
+        from world.models import TerritoryCell
         atoms = list()
-        for sector in self.habitated_sectors:
+        for sector in self.habitated_sectors.distinct():
             atom = hexgrid.DistanceSet(center = sector.position, radius = 1)
             atoms.append(atom)
-        return hexgrid.Union(atoms)
+        territory = hexgrid.RunLengthSet.from_hexset(hexgrid.Union(atoms))
+        previous_territory = self.territory
+        changed_cells = list(territory.difference(previous_territory).union(previous_territory.difference(territory)).explicit())
+        self.territory_cells.all().delete()
+        cells = TerritoryCell.objects.bulk_create([
+            TerritoryCell(position_x = c[0], position_y = c[1], owner = self) for c in territory.explicit()
+        ])
+        journal.record_deleted(TerritoryCell, owner_id = self.id)
+        journal.record_saved(TerritoryCell, cells)
+        if len(changed_cells) == 0:
+            return
+
+        # Invalidate the path finders of the other empires (also the revision, so that other processes reload the cached world)
+        from world.models import World
+        World.objects.filter(id = self.world_id).update(territory_revision = models.F('territory_revision') + 1, revision = models.F('revision') + 1)
+        cache.evict_world(self.world_id)
+
+        # Re-plan the routes of the movables of other empires, which avoid foreign territory and pass by the changed hex fields
+        from world.models import Movable
+        from processes.models import MovementHandler
+        now = cache.get_world(self.world_id).now
+        movables = [
+            movable for movable in Movable.objects.filter(world = self.world_id, avoid_foreign_territory = True, departure_tick__isnull = False).exclude(owner = self)
+            if movable.passes_by(changed_cells, now)
+        ]
+        if len(movables) > 0:
+            MovementHandler.replan(movables, now)
+
+    @property
+    def pathfinder(self):
+        """
+        Path finder which routes around the territory of other empires.
+
+        The path finder (and thus the paths it has cached) is re-used as long as the territory revision of the world does not change.
+        """
+        from world.models import Sector
+        territory_revision = cache.get_world(self.world_id).territory_revision
+        if self.id not in _pathfinders or _pathfinders[self.id][0] != territory_revision:
+            foreign_sectors = list(Sector.objects.filter(world = self.world_id, celestial__habitated_by__isnull = False).exclude(celestial__habitated_by = self.id).values_list('position_x', 'position_y').distinct())
+            foreign_territory = hexgrid.RunLengthSet.from_hexset(hexgrid.Union([hexgrid.DistanceSet(center = s, radius = 1) for s in foreign_sectors]))
+            cost_map = CostMap(foreign_territory.bbox() if len(foreign_sectors) > 0 else (0, 0, 0, 0))
+            cost_map.set_costs(foreign_territory, FOREIGN_TERRITORY_COST)
+            _pathfinders[self.id] = (territory_revision, PathFinder(cost_map))
+        return _pathfinders[self.id][1]
 
     def save(self, *args, **kwargs):
         is_newly_created = not self.pk
         super(Empire, self).save(*args, **kwargs)
+        if is_newly_created:
+            _pathfinders.pop(self.id, None)  ## the id might be re-used (e.g., after a rollback)
 
         # If the empire is newly created, then also create its base blueprints
         if is_newly_created:
@@ -54,12 +119,32 @@ class Empire(models.Model):
     @property
     def movables(self):
         from world.models import Movable
-        return Movable.objects.filter(ship__blueprint__empire = self).all()
+        return Movable.objects.filter(owner = self).all()
 
     @property
     def ships(self):
         return Ship.objects.filter(blueprint__empire = self).all()
 
+    def build_eligibility(self):
+        """
+        Determines which blueprints can be built on which celestials habitated by the empire (using three queries).
+
+        :return: Dictionary which maps the ids of the celestials to dictionaries, which map the ids of the blueprints to `True` or `False`.
+        """
+        from world.models import Celestial
+        celestials = list(Celestial.objects.filter(habitated_by = self).order_by('id'))
+        blueprints = list(self.blueprint_set.order_by('id'))
+        constructed = dict()
+        for celestial_id, base_id in Construction.objects.filter(celestial__habitated_by = self).values_list('celestial', 'blueprint__base_id'):
+            constructed.setdefault(celestial_id, set()).add(base_id)
+        return {
+            celestial.id: {
+                blueprint.id: blueprint.requirements_satisfied(celestial.remaining_capacity, constructed.get(celestial.id, frozenset()))
+                for blueprint in blueprints
+            }
+            for celestial in celestials
+        }
+
 
 class Blueprint(models.Model):
 
@@ -77,20 +162,26 @@ class Blueprint(models.Model):
         return self.base.get('requirements', list())
 
     def requirements_ok(self, celestial):
-        if celestial.habitated_by != self.empire:
+        if celestial.habitated_by_id != self.empire_id:
             raise PermissionDenied()
-        if celestial.remaining_capacity < self.data.get('size', 0):
+        constructed = frozenset(celestial.construction_set.values_list('blueprint__base_id', flat = True))
+        return self.requirements_satisfied(celestial.remaining_capacity, constructed)
+
+    def requirements_satisfied(self, remaining_capacity, constructed):
+        """
+        Checks whether the blueprint can be built on a celestial habitated by the empire.
+
+        :param remaining_capacity: The remaining capacity of the celestial.
+        :param constructed: The base ids of the constructions on the celestial.
+        """
+        if remaining_capacity < self.data.get('size', 0):
             return False
-        for requirement in self.requirements:
-            if celestial.construction_set.filter(blueprint__base_id = requirement).count() == 0:
-                return False
-        return True
+        return all((requirement in constructed for requirement in self.requirements))
 
     def build(self, celestial):
         if not self.requirements_ok(celestial): return None
         from processes.models import BuildingHandler
-        from world.models import World
-        return BuildingHandler.create_process(World.objects.get().now, self, celestial)
+        return BuildingHandler.create_process(cache.get_world(self.empire.world_id).now, self, celestial)
 
 
 class Construction(models.Model):
@@ -98,12 +189,43 @@ class Construction(models.Model):
     blueprint = models.ForeignKey('Blueprint', on_delete = models.PROTECT)
     celestial = models.ForeignKey('world.Celestial', on_delete = models.CASCADE)
 
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super(Construction, self).save(*args, **kwargs)
+        if adding:
+            self.celestial.update_occupied_capacity()
+
+    @receiver(post_delete, sender = 'game.Construction')
+    def update_occupied_capacity_on_delete(sender, instance, **kwargs):
+        from world.models import Celestial
+        for celestial in Celestial.objects.filter(id = instance.celestial_id):
+            celestial.update_occupied_capacity()
+
 
 class Ship(models.Model):
 
     blueprint = models.ForeignKey('Blueprint', on_delete = models.PROTECT)
     movable   = models.ForeignKey('world.Movable', on_delete = models.PROTECT)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Ship, cls).from_db(db, field_names, values)
+        instance._movable_id_db = instance.__dict__.get('movable_id')
+        return instance
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        super(Ship, self).save(*args, **kwargs)
+
+        # Update the owners and speeds of the involved movables (the ship might have been transferred to another movable)
+        from world.models import Movable
+        previous_movable_id = getattr(self, '_movable_id_db', None)
+        if previous_movable_id is not None and previous_movable_id != self.movable_id:
+            Movable.objects.get(id = previous_movable_id).update_ships()
+        self.movable.update_ships()
+        self._movable_id_db = self.movable_id
+
     @property
     def owner(self):
         return self.blueprint.empire
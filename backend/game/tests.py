@@ -63,6 +63,44 @@ class EmpireTest(TestCase):
         self.assertSequenceEqual(actual, expected)
 
 
+    def test_territory_update(self):
+        from world.models import TerritoryCell
+        sector3 = Sector.objects.get(name = 'S3')
+        self.assertNotIn((3,-1), self.empire.territory)
+
+        # Habitating a celestial extends the territory
+        celestial = Celestial.objects.create(sector = sector3, position = 0, features = dict())
+        self.assertNotIn((3,-1), self.empire.territory)
+        celestial.habitated_by = self.empire
+        celestial.save()
+        self.assertIn((3,-1), self.empire.territory)
+        self.assertEqual(TerritoryCell.owners_at((3,-1)), {self.empire.id})
+
+        # Deleting the celestial shrinks the territory
+        celestial.delete()
+        self.assertNotIn((3,-1), self.empire.territory)
+        self.assertEqual(TerritoryCell.owners_at((3,-1)), frozenset())
+
+    def test_territory_num_queries(self):
+        with self.assertNumQueries(1):
+            self.assertIn((0,0), self.empire.territory)
+
+    def test_pathfinder(self):
+        player = User.objects.create(username = 'testuser2', password = 'password')
+        empire2 = Empire.objects.create(name = 'Bars', player = player, origin_x = 0, origin_y = 0, color_hue = 0)
+        pathfinder = empire2.pathfinder
+
+        # The path finder is re-used without querying the database, as long as the territories do not change
+        with self.assertNumQueries(0):
+            self.assertIs(empire2.pathfinder, pathfinder)
+
+        # Changing the territory of another empire invalidates the path finder
+        celestial = Celestial.objects.create(sector = Sector.objects.get(name = 'S3'), position = 0, features = dict())
+        celestial.habitated_by = self.empire
+        celestial.save()
+        self.assertIsNot(empire2.pathfinder, pathfinder)
+
+
 class BlueprintTest(TestCase):
 
     def setUp(self):
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from game.models import Empire, Blueprint
+from processes.models import Process, MovementHandler
+from world.models import Movable, Celestial
+
+
+class Command(BaseCommand):
+    help = 'Populates the target columns of the processes from their data, and plans the routes of the movements (e.g., after migrating an existing database).'
+
+    @transaction.atomic()
+    def handle(self, *args, **options):
+        columns = dict(
+            movable   = Movable,
+            celestial = Celestial,
+            empire    = Empire,
+            blueprint = Blueprint)
+
+        # Determine the existing targets
+        processes = list(Process.objects.all())
+        existing_ids = dict()
+        for column, model in columns.items():
+            target_ids = [process.data.get(f'{column}_id') for process in processes]
+            existing_ids[column] = frozenset(model.objects.filter(id__in = [target_id for target_id in target_ids if target_id is not None]).values_list('id', flat = True))
+
+        # Processes with missing targets could not be finished anyway
+        updated, orphaned = list(), list()
+        for process in processes:
+            for column in columns.keys():
+                setattr(process, f'{column}_id', process.data.get(f'{column}_id'))
+            if all((getattr(process, f'{column}_id') in (existing_ids[column] | {None}) for column in columns.keys())):
+                updated.append(process)
+            else:
+                orphaned.append(process.id)
+
+        Process.objects.bulk_update(updated, list(columns.keys()), batch_size = 500)
+        Process.objects.filter(id__in = orphaned).delete()
+
+        # Plan the routes of the movements which move one step per process (keeping the ticks of their next moves)
+        planned = 0
+        for process in Process.objects.filter(handler_id = MovementHandler.__qualname__).select_related('movable', 'world'):
+            if 'events' not in process.data:
+                movable = process.movable
+                MovementHandler.create_process(process.world.now, movable, process.end_tick - max((1, int(1 / movable.speed))))
+                planned += 1
+        self.stdout.write(f'Updated {len(updated)} process(es), deleted {len(orphaned)} orphaned process(es), planned {planned} route(s)')
@@ -1,66 +1,239 @@
 from django.db import models
+from django.db.models import F
+import numpy as np
+
+from world import hexgrid, journal, profiling
+from world import models as world_models
+from . import scheduler
+
+
+# Handler classes by their ids (populated by `BaseHandler.__init_subclass__`)
+handlers = dict()
 
 
 class Process(models.Model):
 
+    world      = models.ForeignKey('world.World', related_name = 'processes', on_delete = models.CASCADE, default = world_models.default_world)
     owner      = models.ForeignKey('game.Empire', related_name = 'processes', on_delete = models.SET_NULL, null = True)
     start_tick = models.PositiveBigIntegerField()
-    end_tick   = models.PositiveBigIntegerField()
+    end_tick   = models.PositiveBigIntegerField(db_index = True)
     data       = models.JSONField()
     handler_id = models.CharField(max_length = 200)
 
+    # Targets of the process (also included in `data`, which is exposed by the API)
+    movable   = models.ForeignKey('world.Movable'  , related_name = 'processes', on_delete = models.CASCADE, null = True, default = None)
+    celestial = models.ForeignKey('world.Celestial', related_name = 'processes', on_delete = models.CASCADE, null = True, default = None)
+    empire    = models.ForeignKey('game.Empire'    , related_name = '+'        , on_delete = models.CASCADE, null = True, default = None)
+    blueprint = models.ForeignKey('game.Blueprint' , related_name = 'processes', on_delete = models.CASCADE, null = True, default = None)
+
     @property
     def handler(self):
-        handler_cls = eval(self.handler_id)
-        return handler_cls()
+        return handlers[self.handler_id]()
 
 
 class BaseHandler:
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        handlers[cls.__qualname__] = cls
+
+        # Instrument the methods which process the processes for profiling
+        for name in ('finish', 'finish_many', 'advance_many', 'cancel'):
+            if name in cls.__dict__:
+                setattr(cls, name, profiling.instrument(cls.__dict__[name]))
+
+    @profiling.instrument
     def finish(self, process):
         process.delete()
 
+    @profiling.instrument
+    def finish_many(self, processes):
+        """
+        Finishes multiple processes which are due in the same tick (handlers can override this to process them in a batch).
+        """
+        for process in processes:
+            self.finish(process)
+
+    @profiling.instrument
     def cancel(self, process):
         process.delete()
 
 
 class MovementHandler(BaseHandler):
     """
-    Updates the position of a Movable to the next position towards its destination after time spent corresponding to its speed.
+    Moves a Movable along the route planned at its departure, with one move per time spent corresponding to its speed.
+
+    The position is derived from the route (see `Movable.position_at`), so the process only finishes at events, instead of after each move:
+    when the movable reaches a position which unveils new hex fields for its owner (determined at the departure, see `data['events']`), and when it arrives.
     """
 
     def finish(self, process):
-        movable = self.movable(process)
-        movable.set_position(movable.next_position)
+        self.advance_many([process], process.end_tick)
+
+    def finish_many(self, processes):
+        self.advance_many(processes, processes[0].end_tick)
+
+    def advance_many(self, processes, tick):
+        """
+        Processes all events which are due until `tick` (inclusive), assuming that nothing else changes in between (e.g., the territories).
+
+        The neighborhoods of the positions visited since the previous events are unveiled, arrived movables are stopped, and the processes of the others are re-scheduled to their next events (using a few queries).
+        """
+        from world.models import Movable, Unveiled
+        from world import spatial
+
+        # Skip processes which were cancelled meanwhile (e.g., by re-planning a route within the same tick)
+        existing = frozenset(Process.objects.filter(id__in = [process.id for process in processes]).values_list('id', flat = True))
+        processes = [process for process in processes if process.id in existing]
+        movables = Movable.objects.select_related('owner').in_bulk([process.movable_id for process in processes])
+        movables = [movables[process.movable_id] for process in processes]
+
+        arrived, finished, rescheduled, unveil_centers = list(), list(), dict(), dict()
+        for process, movable in zip(processes, movables):
+            moves = movable.moves_at(tick)
+            if movable.owner is not None:
+                unveil_centers.setdefault(movable.owner_id, (movable.owner, list()))[1].extend(movable.route[movable.moves_at(process.start_tick):moves])
+            if moves == len(movable.route):
+                self.arrive(movable)
+                arrived.append(movable)
+                finished.append(process.id)
+            else:
+                process.start_tick = movable.departure_tick + max((event for event in process.data['events'] if event <= moves)) * movable.move_ticks
+                process.end_tick   = movable.departure_tick + min((event for event in process.data['events'] if event >  moves)) * movable.move_ticks
+                rescheduled.setdefault((process.start_tick, process.end_tick), list()).append(process)
+
+        # Stop the arrived movables (their destinations are the final positions of their routes)
+        if len(arrived) > 0:
+            Movable.objects.filter(id__in = [movable.id for movable in arrived]).update(
+                position_x = F('destination_x'), position_y = F('destination_y'),
+                destination_x = None, destination_y = None, departure_tick = None, move_ticks = None, route = None)
+
+            # The spatial index and the journal are not notified by `update`, since no signals are sent
+            for movable in arrived:
+                spatial.update_movable(Movable, movable)
+            journal.record_saved(Movable, arrived)
+
+        # Unveil the neighborhoods
+        for owner, centers in unveil_centers.values():
+            if len(centers) > 0:
+                Unveiled.unveil(owner, centers, 1)
+
+        # Delete the processes of the arrived movables, and re-schedule the others to their next events (one query per distinct previous and next event)
+        Process.objects.filter(id__in = finished).delete()
+        for (start_tick, end_tick), processes in rescheduled.items():
+            Process.objects.filter(id__in = [process.id for process in processes]).update(start_tick = start_tick, end_tick = end_tick)
+            for process in processes:
+
+                # The scheduler is not notified by `update`, since no signals are sent
+                scheduler.reschedule(process.world_id, process.id, process.end_tick)
+            journal.record_saved(Process, processes)
 
-        if (movable.destination == movable.position).all():
+    @staticmethod
+    def arrive(movable):
+        """
+        Updates a movable which arrived at its destination (in memory).
+        """
+        from world.models import Positionable
+        Positionable.set_position(movable, movable.route[-1])
+        movable.destination_x  = None
+        movable.destination_y  = None
+        movable.departure_tick = None
+        movable.move_ticks     = None
+        movable.route          = None
+
+    @staticmethod
+    def stop(movable, tick):
+        """
+        Stops a moving movable at the position reached at `tick`, and unveils the neighborhoods of the positions visited since the previous event.
+        """
+        from world.models import Positionable, Unveiled
+        process = Process.objects.filter(movable = movable, handler_id = MovementHandler.__qualname__).first()
+        if movable.is_moving:
+            visited = movable.route[movable.moves_at(movable.departure_tick if process is None else process.start_tick):movable.moves_at(tick)]
+            position = movable.position_at(tick)
+            Positionable.set_position(movable, position)
+            movable.departure_tick = None
+            movable.move_ticks     = None
+            movable.route          = None
+            if (movable.position == movable.destination).all():
+                movable.destination_x = None
+                movable.destination_y = None
+            movable.save()
+            if len(visited) > 0 and movable.owner_id is not None:
+                Unveiled.unveil(movable.owner, visited, 1)
+        if process is not None:
             process.delete()
-        else:
-            process.start_tick = process.end_tick
-            process.end_tick = process.start_tick + max((1, int(1 / movable.speed)))
-            process.save()
+
+    @staticmethod
+    def replan(movables, tick):
+        """
+        Re-plans the routes of moving movables from the positions reached at `tick` (e.g., if the territories changed), keeping the ticks of their moves.
+        """
+        for movable in movables:
+            departure_tick = movable.departure_tick + movable.moves_at(tick) * movable.move_ticks
+            MovementHandler.stop(movable, tick)
+            MovementHandler.create_process(tick, movable, departure_tick)
 
     def cancel(self, process):
         movable = self.movable(process)
 
-        # The method `move_to` calls `MovementHandler.create_process` which deletes the process
+        # The method `move_to` stops the movable and calls `MovementHandler.create_process`, which deletes the process
         movable.move_to(movable.position)
 
     def movable(self, process):
         from world.models import Movable
-        return Movable.objects.get(id = process.data['movable_id'])
+        return Movable.objects.get(id = process.movable_id)
+
+    @staticmethod
+    def events(owner_id, route):
+        """
+        Determines the moves along a route after which new hex fields are unveiled for the owner, including the last move.
+        """
+        from world.models import Unveiled
+        if owner_id is None or len(route) == 0:
+            return [len(route)]
+        route = np.asarray(route, dtype=int).reshape(-1, 2)
+        (x_min, y_min), (x_max, y_max) = route.min(axis = 0) - (2, 1), route.max(axis = 0) + (2, 1)
+        known = set(Unveiled.objects.filter(
+            by_whom = owner_id,
+            position_x__range = (x_min, x_max),
+            position_y__range = (y_min, y_max)).values_list('position_x', 'position_y'))
+        events = list()
+        offsets = np.concatenate(([(0, 0)], hexgrid.HEX_NEIGHBORS))
+        for move, position in enumerate(route, start = 1):
+            neighborhood = set(map(tuple, (position + offsets).tolist()))
+            if not neighborhood <= known:
+                events.append(move)
+                known |= neighborhood
+        if len(events) == 0 or events[-1] != len(route):
+            events.append(len(route))
+        return events
 
     @staticmethod
-    def create_process(start_tick, movable):
-        Process.objects.filter(data__movable_id = movable.id).delete()
+    def create_process(start_tick, movable, departure_tick = None):
+        """
+        Plans the route of a movable towards its destination, and schedules the first event of the movement.
+
+        :param departure_tick: The tick of the departure (defaults to `start_tick`).
+        """
+        Process.objects.filter(movable = movable).delete()
         if (movable.destination == movable.position).all():
+            movable.save()
             return None
+        route = movable.plan_trajectory()
+        events = MovementHandler.events(movable.owner_id, route)
+        movable.departure_tick = start_tick if departure_tick is None else departure_tick
+        movable.move_ticks     = max((1, int(1 / movable.speed)))
+        movable.route          = np.asarray(route, dtype=int).tolist()
+        movable.save()
         return Process.objects.create(
+            world_id   = movable.world_id,
             start_tick = start_tick,
-            end_tick   = start_tick + max((1, int(1 / movable.speed))),
-            owner      = movable.owner,
+            end_tick   = movable.departure_tick + events[0] * movable.move_ticks,
+            owner_id   = movable.owner_id,
             handler_id = MovementHandler.__qualname__,
-            data = dict(movable_id = movable.id))
+            movable    = movable,
+            data = dict(movable_id = movable.id, events = events))
 
 
 class BuildingHandler(BaseHandler):
@@ -71,8 +244,8 @@ class BuildingHandler(BaseHandler):
     def finish(self, process):
         from world.models import Celestial, Movable
         from game.models import Blueprint, Construction, Ship
-        celestial = Celestial.objects.get(id = process.data['celestial_id'])
-        blueprint = Blueprint.objects.get(id = process.data['blueprint_id'])
+        celestial = Celestial.objects.get(id = process.celestial_id)
+        blueprint = Blueprint.objects.get(id = process.blueprint_id)
         if blueprint.base_id.startswith('constructions/'):
             Construction.objects.create(
                 blueprint = blueprint,
@@ -80,21 +253,65 @@ class BuildingHandler(BaseHandler):
         elif blueprint.base_id.startswith('ships/'):
             Ship.objects.create(
                 blueprint = blueprint,
-                movable   = Movable.objects.create(position_x = celestial.sector.position_x, position_y = celestial.sector.position_y))
+                movable   = Movable.objects.create(world_id = process.world_id, position_x = celestial.sector.position_x, position_y = celestial.sector.position_y, owner = blueprint.empire, ship_speed = blueprint.data['speed']))
         else:
             raise ValueError(f'invalid blueprint {blueprint.id} with base_id: "{blueprint.base_id}"')
         process.delete()
 
+    def finish_many(self, processes):
+        from world.models import Celestial, Movable
+        from world import spatial
+        from game.models import Blueprint, Construction, Ship
+        celestials = Celestial.objects.select_related('sector').in_bulk([process.celestial_id for process in processes])
+        blueprints = Blueprint.objects.in_bulk([process.blueprint_id for process in processes])
+        constructions, ships = list(), list()
+        for process in processes:
+            celestial = celestials[process.celestial_id]
+            blueprint = blueprints[process.blueprint_id]
+            if blueprint.base_id.startswith('constructions/'):
+                constructions.append(Construction(
+                    blueprint = blueprint,
+                    celestial = celestial))
+            elif blueprint.base_id.startswith('ships/'):
+                ships.append(Ship(
+                    blueprint = blueprint,
+                    movable   = Movable(world_id = process.world_id, position_x = celestial.sector.position_x, position_y = celestial.sector.position_y, owner_id = blueprint.empire_id, ship_speed = blueprint.data['speed'])))
+            else:
+                raise ValueError(f'invalid blueprint {blueprint.id} with base_id: "{blueprint.base_id}"')
+
+        # Requires a database backend which sets the primary keys of the created objects (e.g., PostgreSQL or SQLite 3.35+)
+        Construction.objects.bulk_create(constructions)
+        Movable.objects.bulk_create([ship.movable for ship in ships])
+
+        # Update the occupied capacities of the celestials (the signals are not sent by `bulk_create`)
+        occupied = dict()
+        for construction in constructions:
+            construction.celestial.occupied_capacity += construction.blueprint.data['size']
+            occupied[construction.celestial.id] = construction.celestial
+        Celestial.objects.bulk_update(occupied.values(), ['occupied_capacity'])
+
+        for ship in ships:
+            spatial.update_movable(Movable, ship.movable)
+        Ship.objects.bulk_create(ships)
+        journal.record_saved(Construction, constructions)
+        journal.record_saved(Celestial, list(occupied.values()))
+        journal.record_saved(Movable, [ship.movable for ship in ships])
+        journal.record_saved(Ship, ships)
+        Process.objects.filter(id__in = [process.id for process in processes]).delete()
+
     @staticmethod
     def create_process(start_tick, blueprint, celestial):
         process = celestial.sector.process
         if process is not None:
             process.handler.cancel(process)
         return Process.objects.create(
+            world_id   = celestial.sector.world_id,
             start_tick = start_tick,
             end_tick   = start_tick + blueprint.data['cost'],
             owner      = celestial.habitated_by,
             handler_id = BuildingHandler.__qualname__,
+            blueprint  = blueprint,
+            celestial  = celestial,
             data = dict(
                 blueprint_id = blueprint.id,
                 celestial_id = celestial.id))
@@ -112,8 +329,8 @@ class ColonizationHandler(BaseHandler):
         from game.models import Empire
 
         # Spawn the colony
-        celestial = Celestial.objects.get(id = process.data['celestial_id'])
-        empire    = Empire   .objects.get(id = process.data[   'empire_id'])
+        celestial = Celestial.objects.get(id = process.celestial_id)
+        empire    = Empire   .objects.get(id = process.   empire_id)
         assert celestial.habitated_by is None
         celestial.habitated_by = empire
         celestial.save()
@@ -127,17 +344,50 @@ class ColonizationHandler(BaseHandler):
             assert ships_qs.count() >= 1
             ships_qs[0].delete()
 
+    def finish_many(self, processes):
+        from world.models import Celestial
+        from game.models import Empire, Ship
+        celestials = Celestial.objects.in_bulk([process.celestial_id for process in processes])
+        empires    = Empire   .objects.in_bulk([process.   empire_id for process in processes])
+
+        # Spawn the colonies
+        for process in processes:
+            celestial = celestials[process.celestial_id]
+            assert celestial.habitated_by_id is None
+            celestial.habitated_by = empires[process.empire_id]
+        Celestial.objects.bulk_update(celestials.values(), ['habitated_by'])
+        journal.record_saved(Celestial, celestials.values())
+
+        # Update the territories (done by `Celestial.save` otherwise)
+        for empire in empires.values():
+            empire.update_territory()
+        for celestial in celestials.values():
+            celestial._habitated_by_id_db = celestial.habitated_by_id
+
+        # Delete the processes
+        Process.objects.filter(id__in = [process.id for process in processes]).delete()
+
+        # Consume the colony ships, if any were used (one per colonization)
+        movable_ids = [process.movable_id for process in processes if process.movable_id is not None]
+        if len(movable_ids) > 0:
+            colony_ships = dict()
+            for ship in Ship.objects.filter(movable_id__in = movable_ids, blueprint__base_id = 'ships/colony-ship').order_by('id'):
+                colony_ships.setdefault(ship.movable_id, list()).append(ship)
+            for movable_id in movable_ids:
+                assert len(colony_ships.get(movable_id, list())) >= 1
+                colony_ships[movable_id].pop(0).delete()
+
     def movable(self, process):
         from world.models import Movable
-        movable_id = process.data.get('movable_id', None)
-        if movable_id is None:
+        if process.movable_id is None:
             return None
         else:
-            return Movable.objects.get(id = movable_id)
+            return Movable.objects.get(id = process.movable_id)
 
     @staticmethod
     def create_process(start_tick, empire, celestial, movable):
-        from game.models import Blueprint, Empire
+        from world.models import TerritoryCell
+        from game.models import Blueprint
         data = dict(
             celestial_id = celestial.id,
             empire_id    = empire.id)
@@ -149,7 +399,7 @@ class ColonizationHandler(BaseHandler):
         assert all((c.habitated_by is None or c.habitated_by == empire for c in celestial.sector.celestial_set.all()))
 
         # Ensure that the celestial is not in the territory of a different empire
-        assert all((celestial.sector.position not in e.territory for e in Empire.objects.all() if e.id != empire.id))
+        assert TerritoryCell.owners_at(celestial.sector.position, celestial.sector.world_id) <= {empire.id}
 
         # Cancel any previous build process in the sector
         process = celestial.sector.process
@@ -159,9 +409,10 @@ class ColonizationHandler(BaseHandler):
         # Cancel any previous order of the movable (if a colony ship is used)
         if movable is not None:
             assert (movable.position == celestial.sector.position).all()
-            assert  movable.owner.id == empire.id
+            assert  movable.owner_id == empire.id
             assert  movable.ship_set.filter(blueprint__base_id = 'ships/colony-ship').count() >= 1
-            Process.objects.filter(data__movable_id = movable.id).delete()
+            MovementHandler.stop(movable, start_tick)
+            Process.objects.filter(movable = movable).delete()
             data['movable_id'] = movable.id
 
         # Determine how long it is gonna take (1 tick for colony ships, or the cost of the cheapest available colony ship otherwise)
@@ -175,8 +426,12 @@ class ColonizationHandler(BaseHandler):
 
         # Spawn the process
         return Process.objects.create(
+            world_id   = empire.world_id,
             start_tick = start_tick,
             end_tick   = start_tick + cost,
             owner      = empire,
             handler_id = ColonizationHandler.__qualname__,
+            celestial  = celestial,
+            empire     = empire,
+            movable    = movable,
             data       = data)
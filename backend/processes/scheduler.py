@@ -0,0 +1,149 @@
+"""
+Implements a per-process scheduler, which keeps the end ticks of the processes in a priority queue (one per world).
+
+The scheduler is hydrated from the database (or when a new world is created), and kept up to date by the signals emitted when processes are saved or deleted within this process.
+Processes created by other processes are picked up by their ids, which are larger than any known one.
+Since concurrent transactions might commit their ids in a different order (e.g., with PostgreSQL), the ids skipped meanwhile are checked again for `GAP_SECONDS`.
+Since modifications which bypass the signals (e.g., `QuerySet.update`) are not noticed, such code must either call `reschedule` or invalidate the scheduler.
+"""
+
+import heapq
+import time
+
+from django.db.models import Max, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+
+# Number of seconds after which skipped ids are no longer expected to be committed (e.g., since the transaction was rolled back, or they belong to another world)
+GAP_SECONDS = 60
+
+# Maximum number of separately checked ranges of skipped ids (more are merged into a single range, e.g. if the ids are skipped since they belong to other worlds)
+MAX_GAPS = 20
+
+
+class Scheduler:
+
+    def __init__(self, world_id):
+        self.world_id = world_id
+        self.now = None
+        self.queue = list()  ## heap of `(end_tick, process_id)`, including stale entries
+        self.end_ticks = dict()  ## process id -> end tick
+        self.max_id = 0
+        self.gaps = list()  ## `(first_id, last_id, timestamp)` of the ids skipped below `max_id`
+
+    @property
+    def is_built(self):
+        return self.now is not None
+
+    def hydrate(self, now):
+        """
+        Loads the processes which finish after the tick `now` from the database (two queries).
+        """
+        from processes.models import Process
+        processes = Process.objects.filter(world = self.world_id)
+        self.end_ticks = dict(processes.filter(end_tick__gt = now).values_list('id', 'end_tick'))
+        self.queue = [(end_tick, process_id) for process_id, end_tick in self.end_ticks.items()]
+        heapq.heapify(self.queue)
+        self.max_id = processes.aggregate(Max('id'))['id__max'] or 0
+        self.gaps = list()
+        self.now = now
+
+    def sync(self):
+        """
+        Loads the processes created by other processes from the database (one query).
+        """
+        from processes.models import Process
+        self.gaps = [gap for gap in self.gaps if gap[2] > time.time() - GAP_SECONDS]
+        query = Q(id__gt = self.max_id)
+        for first_id, last_id, _ in self.gaps:
+            query |= Q(id__range = (first_id, last_id))
+        for process_id, end_tick in Process.objects.filter(query, world = self.world_id, end_tick__gt = self.now).values_list('id', 'end_tick'):
+            if self.end_ticks.get(process_id) != end_tick:
+                self.schedule(process_id, end_tick)
+
+    def invalidate(self):
+        self.now = None
+
+    def schedule(self, process_id, end_tick):
+        self.end_ticks[process_id] = end_tick
+        if process_id > self.max_id + 1:
+            self.gaps.append((self.max_id + 1, process_id - 1, time.time()))
+            if len(self.gaps) > MAX_GAPS:
+                self.gaps = [(min(gap[0] for gap in self.gaps), max(gap[1] for gap in self.gaps), max(gap[2] for gap in self.gaps))]
+        self.max_id = max((self.max_id, process_id))
+        heapq.heappush(self.queue, (end_tick, process_id))
+
+    def cancel(self, process_id):
+        self.end_ticks.pop(process_id, None)
+
+    def _is_stale(self, entry):
+        end_tick, process_id = entry
+        return self.end_ticks.get(process_id) != end_tick
+
+    def pop_due(self, now):
+        """
+        Removes the processes which finish until the tick `now` (inclusive) from the queue.
+
+        :return: The ids of the processes which finish in the tick `now` (in ascending order).
+        """
+        process_ids = list()
+        while len(self.queue) > 0 and self.queue[0][0] <= now:
+            entry = heapq.heappop(self.queue)
+            if self._is_stale(entry):
+                continue
+            del self.end_ticks[entry[1]]
+            if entry[0] == now:
+                process_ids.append(entry[1])
+        self.now = now
+        return sorted(process_ids)
+
+    def next_event_tick(self):
+        """
+        Returns the next tick when a process finishes (or `None`).
+        """
+        while len(self.queue) > 0 and self._is_stale(self.queue[0]):
+            heapq.heappop(self.queue)
+        return self.queue[0][0] if len(self.queue) > 0 else None
+
+
+_schedulers = dict()  ## world id -> scheduler
+
+
+def get_scheduler(world_id, now):
+    """
+    Returns the scheduler of a world, which is (re-)hydrated if it is not valid for the tick `now` (otherwise processes created by other processes are loaded).
+    """
+    scheduler = _schedulers.setdefault(world_id, Scheduler(world_id))
+    if scheduler.now != now:
+        scheduler.hydrate(now)
+    else:
+        scheduler.sync()
+    return scheduler
+
+
+def reschedule(world_id, process_id, end_tick):
+    """
+    Notifies the scheduler of a world of a modified end tick (required for modifications which bypass the signals).
+    """
+    scheduler = _schedulers.get(world_id)
+    if scheduler is not None and scheduler.is_built:
+        scheduler.schedule(process_id, end_tick)
+
+
+@receiver(post_save, sender = 'world.World')
+def invalidate_on_world_created(sender, instance, created, **kwargs):
+    if created:
+        _schedulers.pop(instance.id, None)
+
+
+@receiver(post_save, sender = 'processes.Process')
+def schedule_process(sender, instance, **kwargs):
+    reschedule(instance.world_id, instance.id, instance.end_tick)
+
+
+@receiver(post_delete, sender = 'processes.Process')
+def cancel_process(sender, instance, **kwargs):
+    scheduler = _schedulers.get(instance.world_id)
+    if scheduler is not None and scheduler.is_built:
+        scheduler.cancel(instance.id)
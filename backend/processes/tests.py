@@ -1,3 +1,295 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+import numpy as np
 
-# Create your tests here.
+from game.models import Empire, Blueprint, Construction, Ship
+from world.models import World, Movable, Sector, Celestial, Unveiled, hexgrid
+from processes.models import Process
+from processes import scheduler
+
+
+class BatchedTickTest(TestCase):
+
+    def setUp(self):
+        self.world = World.objects.create()
+        player = User.objects.create(username = 'testuser', password = 'password')
+        self.empire = Empire.objects.create(name = 'Foos', player = player, origin_x = 0, origin_y = 0, color_hue = 0)
+
+    def create_movable(self, position, speed = None):
+        movable = Movable.objects.create(position_x = position[0], position_y = position[1], custom_speed = speed)
+        Ship.objects.create(movable = movable, blueprint = Blueprint.objects.get(empire = self.empire, base_id = 'ships/colony-ship'))
+        return movable
+
+    def test_movement(self):
+        rng = np.random.default_rng(0)
+        movables, trajectories = list(), list()
+        for _ in range(10):
+            position, destination = rng.integers(-6, 6, size = (2, 2))
+            position[0] += position.sum() % 2
+            destination[0] += destination.sum() % 2
+            movable = self.create_movable(position, speed = rng.choice([None, 0.5, 1, 2.5]))
+            movable.move_to(destination)
+            movables.append(movable)
+            trajectories.append([tuple(position)] + [tuple(p) for p in movable.trajectory])
+
+        # Each movable follows its trajectory, one move per `int(1 / speed)` ticks
+        positions = [[trajectory[0]] for trajectory in trajectories]
+        for _ in range(30):
+            self.world.tick()
+            for movable, history in zip(movables, positions):
+                movable.refresh_from_db()
+                if history[-1] != tuple(movable.position):
+                    history.append(tuple(movable.position))
+        for movable, history, trajectory in zip(movables, positions, trajectories):
+            self.assertEqual(history, trajectory)
+            self.assertIsNone(movable.destination_x)
+        self.assertEqual(Process.objects.count(), 0)
+
+        # The neighborhoods of the visited hex fields are unveiled
+        expected = hexgrid.Union([hexgrid.DistanceSet(c, radius = 1) for history in positions for c in history[1:]])
+        actual = Unveiled.objects.filter(by_whom = self.empire).values_list('position_x', 'position_y')
+        self.assertTrue(frozenset(tuple(c) for c in expected.explicit()) <= frozenset(actual))
+
+    def test_movement_num_queries(self):
+        def count_queries(num_movables):
+            Process.objects.all().delete()
+            for idx in range(num_movables):
+                self.create_movable((4 * idx, 0), speed = 1).move_to((4 * idx, 10))
+            with CaptureQueriesContext(connection) as ctx:
+                self.world.tick()
+            return len(ctx.captured_queries)
+        self.assertEqual(count_queries(2), count_queries(20))
+
+    def test_building(self):
+        sector1 = Sector.objects.create(position_x = 0, position_y = 0, name = 'S1')
+        sector2 = Sector.objects.create(position_x = 4, position_y = 0, name = 'S2')
+        celestial1 = Celestial.objects.create(sector = sector1, position = 0, features = dict(capacity = 10), habitated_by = self.empire)
+        celestial2 = Celestial.objects.create(sector = sector2, position = 0, features = dict(capacity = 10), habitated_by = self.empire)
+        shipyard = Blueprint.objects.get(empire = self.empire, base_id = 'constructions/shipyard')
+        Construction.objects.create(blueprint = shipyard, celestial = celestial2)
+
+        # Let both building processes finish in the same tick
+        construction_blueprint = Blueprint.objects.get(empire = self.empire, base_id = 'constructions/digital-cave')
+        ship_blueprint = Blueprint.objects.get(empire = self.empire, base_id = 'ships/colony-ship')
+        construction_blueprint.build(celestial1)
+        ship_blueprint.build(celestial2)
+        Process.objects.update(end_tick = self.world.now + 1)
+        scheduler._schedulers.clear()  ## `update` bypasses the signals
+        self.world.tick()
+
+        self.assertEqual(Process.objects.count(), 0)
+        self.assertEqual(celestial1.construction_set.get().blueprint.id, construction_blueprint.id)
+        celestial1.refresh_from_db()
+        self.assertEqual(celestial1.occupied_capacity, construction_blueprint.data['size'])
+        ship = self.empire.ships.get()
+        self.assertEqual(ship.blueprint.id, ship_blueprint.id)
+        self.assertEqual(ship.movable.position.tolist(), [4, 0])
+
+    def test_colonization(self):
+        sector1 = Sector.objects.create(position_x = 0, position_y = 0, name = 'S1')
+        sector2 = Sector.objects.create(position_x = 8, position_y = 0, name = 'S2')
+        celestial1 = Celestial.objects.create(sector = sector1, position = 0, features = dict(capacity = 1))
+        celestial2 = Celestial.objects.create(sector = sector2, position = 0, features = dict(capacity = 1))
+        movable1 = self.create_movable((0, 0))
+        movable2 = self.create_movable((8, 0))
+        Ship.objects.create(movable = movable2, blueprint = Blueprint.objects.get(empire = self.empire, base_id = 'ships/colony-ship'))
+
+        # Let both colonization processes finish in the same tick
+        celestial1.colonize(self.empire, movable1)
+        celestial2.colonize(self.empire, movable2)
+        self.world.tick()
+
+        self.assertEqual(Process.objects.count(), 0)
+        for celestial in (celestial1, celestial2):
+            celestial.refresh_from_db()
+            self.assertEqual(celestial.habitated_by.id, self.empire.id)
+        self.assertIn((0, 0), self.empire.territory)
+        self.assertIn((8, 0), self.empire.territory)
+
+        # One colony ship is consumed per colonization
+        self.assertFalse(Movable.objects.filter(id = movable1.id).exists())
+        self.assertEqual(movable2.ship_set.count(), 1)
+
+
+class MovementTest(TestCase):
+
+    def setUp(self):
+        self.world = World.objects.create()
+        player1 = User.objects.create(username = 'testuser1', password = 'password')
+        player2 = User.objects.create(username = 'testuser2', password = 'password')
+        self.empire1 = Empire.objects.create(name = 'Foos', player = player1, origin_x = 0, origin_y = 0, color_hue = 0)
+        self.empire2 = Empire.objects.create(name = 'Bars', player = player2, origin_x = 0, origin_y = 0, color_hue = 0)
+        self.movable = Movable.objects.create(position_x = 0, position_y = 0)
+        Ship.objects.create(movable = self.movable, blueprint = Blueprint.objects.get(empire = self.empire1, base_id = 'ships/colony-ship'))
+
+    def test_events(self):
+        # Only the moves which unveil new hex fields are events (the neighborhood of the first half of the route is already unveiled)
+        Unveiled.unveil(self.empire1, [(x, 0) for x in range(0, 12, 2)], 1)
+        process = self.movable.move_to((20, 0))
+        self.assertEqual(process.data['events'], [6, 7, 8, 9, 10])
+        self.assertEqual(process.end_tick, self.world.now + 6)
+
+        # The position is derived from the route, while the movable is only written at the arrival
+        for tick in range(1, 11):
+            self.world.tick()
+            self.movable.refresh_from_db()
+            self.assertEqual(self.movable.position.tolist(), [2 * tick, 0])
+            self.assertEqual(self.movable.position_x, 20 if tick == 10 else 0)
+        self.assertFalse(Process.objects.exists())
+        self.assertIsNone(self.movable.departure_tick)
+        self.assertTrue(Unveiled.objects.filter(by_whom = self.empire1, position_x = 22, position_y = 0).exists())
+
+    def test_stop(self):
+        self.movable.move_to((20, 0))
+        for _ in range(3):
+            self.world.tick()
+
+        # Changing the destination stops the movable at its current position first
+        self.movable.refresh_from_db()
+        self.movable.move_to((6, 4))
+        self.assertEqual((self.movable.position_x, self.movable.position_y), (6, 0))
+        self.assertEqual(self.movable.trajectory.tolist(), hexgrid.get_trajectory_towards((6, 0), (6, 4), 1).tolist())
+        self.assertTrue(Unveiled.objects.filter(by_whom = self.empire1, position_x = 8, position_y = 0).exists())
+
+    def test_replan(self):
+        self.movable.move_to((24, 0), avoid_foreign_territory = True)
+        movable2 = Movable.objects.create(position_x = 0, position_y = 20)
+        Ship.objects.create(movable = movable2, blueprint = Blueprint.objects.get(empire = self.empire1, base_id = 'ships/colony-ship'))
+        process2 = movable2.move_to((24, 20), avoid_foreign_territory = True)
+        self.world.tick()
+
+        # Let empire2 habitate a sector on the route, which is then avoided by the remaining moves
+        sector = Sector.objects.create(position_x = 12, position_y = 0, name = 'S')
+        Celestial.objects.create(sector = sector, position = 0, features = dict(), habitated_by = self.empire2)
+        self.movable.refresh_from_db()
+        self.assertEqual(self.movable.position.tolist(), [2, 0])
+        self.assertEqual(self.movable.trajectory[-1].tolist(), [24, 0])
+        self.assertFalse(any(tuple(c) in self.empire2.territory for c in self.movable.trajectory))
+
+        # The ticks of the moves are kept
+        self.assertEqual(self.movable.next_move_tick, self.world.now + 1)
+
+        # The routes which do not pass by the habitated sector are not re-planned
+        self.assertEqual(movable2.process.id, process2.id)
+
+
+class ProcessTest(TestCase):
+
+    def setUp(self):
+        self.world = World.objects.create()
+        player = User.objects.create(username = 'testuser', password = 'password')
+        self.empire = Empire.objects.create(name = 'Foos', player = player, origin_x = 0, origin_y = 0, color_hue = 0)
+        self.movable = Movable.objects.create(position_x = 0, position_y = 0, custom_speed = 1)
+        sector = Sector.objects.create(position_x = 0, position_y = 0, name = 'S')
+        self.celestial = Celestial.objects.create(sector = sector, position = 0, features = dict(capacity = 1), habitated_by = self.empire)
+
+    def test_handler_registry(self):
+        from processes.models import handlers, BuildingHandler, ColonizationHandler, MovementHandler
+        for handler_cls in (MovementHandler, BuildingHandler, ColonizationHandler):
+            self.assertIs(handlers[handler_cls.__qualname__], handler_cls)
+            self.assertIsInstance(Process(handler_id = handler_cls.__qualname__).handler, handler_cls)
+        with self.assertRaises(KeyError):
+            Process(handler_id = 'print').handler
+
+    def test_target_columns(self):
+        process = self.movable.move_to((4, 0))
+        self.assertEqual(process.movable_id, self.movable.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.movable.process.id, process.id)
+
+        blueprint = Blueprint.objects.get(empire = self.empire, base_id = 'constructions/digital-cave')
+        process = blueprint.build(self.celestial)
+        self.assertEqual((process.celestial_id, process.blueprint_id), (self.celestial.id, blueprint.id))
+        self.assertEqual(self.celestial.sector.process.id, process.id)
+
+        # Processes are deleted along with their targets
+        self.movable.delete()
+        self.assertFalse(Process.objects.filter(handler_id = 'MovementHandler').exists())
+
+    def test_update_processes(self):
+        from django.core.management import call_command
+        from io import StringIO
+        process1 = self.movable.move_to((4, 0))
+        process2 = Blueprint.objects.get(empire = self.empire, base_id = 'constructions/digital-cave').build(self.celestial)
+        process3 = Process.objects.create(start_tick = 1, end_tick = 2, handler_id = 'MovementHandler', data = dict(movable_id = self.movable.id + 1))
+        Process.objects.update(movable = None, celestial = None, blueprint = None)
+
+        # Movements which move one step per process are planned as routes
+        movable = Movable.objects.create(position_x = 0, position_y = 0, custom_speed = 0.5, destination_x = 6, destination_y = 0)
+        Process.objects.create(start_tick = 1, end_tick = 3, handler_id = 'MovementHandler', data = dict(movable_id = movable.id))
+
+        call_command('update_processes', stdout = StringIO())
+        process1.refresh_from_db()
+        process2.refresh_from_db()
+        self.assertEqual(process1.movable_id, self.movable.id)
+        self.assertEqual((process2.celestial_id, process2.blueprint_id), (self.celestial.id, process2.data['blueprint_id']))
+        self.assertFalse(Process.objects.filter(id = process3.id).exists())
+        movable.refresh_from_db()
+        self.assertEqual((movable.route, movable.next_move_tick), ([[2, 0], [4, 0], [6, 0]], 3))
+        self.assertEqual(movable.process.end_tick, 7)  ## arrival
+
+
+class SchedulerTest(TestCase):
+
+    def setUp(self):
+        self.world = World.objects.create()
+        self.movables = [Movable.objects.create(position_x = 0, position_y = 0, custom_speed = speed) for speed in (1, 0.5, 0.25)]
+
+    def test_pop_due(self):
+        processes = [movable.move_to((4, 0)) for movable in self.movables]  ## arrival after two moves
+        s = scheduler.get_scheduler(self.world.id, self.world.now)
+        self.assertEqual(s.next_event_tick(), 3)
+
+        # Cancelled processes are skipped
+        processes[0].delete()
+        self.assertEqual(s.next_event_tick(), 5)
+        self.assertEqual(s.pop_due(4), [])
+        self.assertEqual(s.pop_due(5), [processes[1].id])
+        self.assertEqual(s.next_event_tick(), 9)
+
+        # Re-scheduled processes are moved
+        processes[2].end_tick = 11
+        processes[2].save()
+        self.assertEqual(s.next_event_tick(), 11)
+        self.assertEqual(s.pop_due(10), [])
+        self.assertEqual(s.pop_due(11), [processes[2].id])
+        self.assertIsNone(s.next_event_tick())
+
+    def test_sync(self):
+        s = scheduler.get_scheduler(self.world.id, self.world.now)
+
+        # Processes created by other processes are picked up (`bulk_create` bypasses the signals)
+        Process.objects.bulk_create([Process(start_tick = 1, end_tick = 4, handler_id = 'MovementHandler', movable = self.movables[0], data = dict(movable_id = self.movables[0].id))])
+        self.assertIsNone(s.next_event_tick())
+        self.assertEqual(scheduler.get_scheduler(self.world.id, self.world.now).next_event_tick(), 4)
+
+        # Processes committed after processes with larger ids are picked up as well
+        max_id = s.max_id
+        for process_id, end_tick in ((max_id + 3, 6), (max_id + 1, 5)):
+            Process.objects.bulk_create([Process(id = process_id, start_tick = 1, end_tick = end_tick, handler_id = 'MovementHandler', movable = self.movables[0], data = dict(movable_id = self.movables[0].id))])
+            self.assertEqual(scheduler.get_scheduler(self.world.id, self.world.now).end_ticks[process_id], end_tick)
+        self.assertEqual(s.pop_due(5), [max_id + 1])
+
+        # The ranges of skipped ids (e.g., of the processes of other worlds) are merged, if there are too many of them
+        max_id = s.max_id
+        for process_id in range(max_id + 2, max_id + 4 * scheduler.MAX_GAPS, 2):
+            s.schedule(process_id, 100)
+        self.assertLessEqual(len(s.gaps), scheduler.MAX_GAPS)
+        Process.objects.bulk_create([Process(id = max_id + 3, start_tick = 1, end_tick = 7, handler_id = 'MovementHandler', movable = self.movables[0], data = dict(movable_id = self.movables[0].id))])
+        self.assertEqual(scheduler.get_scheduler(self.world.id, self.world.now).end_ticks[max_id + 3], 7)
+
+        # The scheduler is hydrated if it is not valid for the tick
+        s.invalidate()
+        self.assertEqual(scheduler.get_scheduler(self.world.id, self.world.now).next_event_tick(), 4)
+
+    def test_tick(self):
+        self.movables[2].move_to((4, 0))
+        self.world.tick()
+        with self.assertNumQueries(3), override_settings(TICK_PROFILE_SIZE = 0):
+            self.world.tick()  ## look up new processes, save the world and read its revision, no process is due
+        self.world.tick()
+        self.world.tick()
+        self.movables[2].refresh_from_db()
+        self.assertEqual(self.movables[2].position.tolist(), [2, 0])
@@ -1,14 +1,17 @@
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.db import models
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 
+from world import hexgrid, spatial
 from world.models import (
     World,
     Movable,
     Sector,
     Celestial,
     Unveiled,
+    TickProfile,
 )
 from game.models import (
     Empire,
@@ -21,14 +24,58 @@ from processes.models import (
 )
 
 
+def unveiled_by(user, world):
+    """
+    Returns a filter expression for objects located at hex fields which are unveiled by the empire of the user in a world.
+    """
+    return models.Exists(Unveiled.objects.filter(
+        by_whom__player = user,
+        by_whom__world  = world,
+        position_x = models.OuterRef('position_x'),
+        position_y = models.OuterRef('position_y')))
+
+
+def movables_unveiled_by(user, world):
+    """
+    Returns a filter expression for movables located at hex fields which are unveiled by the empire of the user in a world.
+
+    The positions of moving movables are derived from their routes (see `Movable.position_at`), so these are looked up in the spatial index of the world (which is built once per tick).
+    """
+    index = spatial.get_index(world.id, world.now)
+    moving_ids = list(Movable.objects.filter(world = world, departure_tick__isnull = False).values_list('id', flat = True))
+
+    # The movables created by other processes since the index was built are not indexed yet
+    positions = {movable_id: index.movable_positions[movable_id] for movable_id in moving_ids if movable_id in index.movable_positions}
+    missing_ids = [movable_id for movable_id in moving_ids if movable_id not in positions]
+    if len(missing_ids) > 0:
+        for movable in Movable.objects.filter(id__in = missing_ids).only('id', 'position_x', 'position_y', 'departure_tick', 'move_ticks', 'route'):
+            positions[movable.id] = tuple(movable.position_at(world.now).tolist())
+
+    if len(positions) > 0:
+        region = hexgrid.RunLengthSet.from_points(list(positions.values()))
+        unveiled = frozenset(Unveiled.unveiled_within(region, by_whom__player = user, by_whom__world = world))
+    else:
+        unveiled = frozenset()
+    moving_ids = [movable_id for movable_id, position in positions.items() if position in unveiled]
+    return (models.Q(departure_tick__isnull = True) & unveiled_by(user, world)) | models.Q(id__in = moving_ids)
+
+
 class UserSerializer(serializers.HyperlinkedModelSerializer):
 
-    empire = serializers.HyperlinkedRelatedField(view_name = 'empire-detail', read_only = True)
+    empire = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ['url', 'username', 'empire']
 
+    def get_empire(self, user):
+        """
+        Returns the URL of the empire of the user in the world addressed by the request (or `None`).
+        """
+        request = self.context.get('request')
+        empire = user.empires.filter(world = request.world).first()
+        return None if empire is None else reverse('empire-detail', kwargs = dict(pk = empire.pk), request = request)
+
 
 class LoginSerializer(serializers.Serializer):
 
@@ -75,7 +122,7 @@ class MovableSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model  = Movable
-        fields = ['url', 'position', 'destination', 'speed', 'next_position', 'ship_set', 'owner', 'process', 'name', 'trajectory']
+        fields = ['url', 'position', 'destination', 'speed', 'next_position', 'next_move_tick', 'ship_set', 'owner', 'process', 'name', 'trajectory']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -138,10 +185,12 @@ class EmpireSerializer(serializers.HyperlinkedModelSerializer):
         """
         Returns the explicit intersection of the territory of the empire, and the area unveiled by the player who called the REST endpoint.
         """
-        request = self.context.get('request')
-        empire2 = request.user.empire  ## the empire of the player who called the REST endpoint
-        unveiled = frozenset((tuple(u.position) for u in empire2.unveiled.all()))
-        return [c for c in empire.territory.explicit() if tuple(c) in unveiled]
+        if hasattr(empire, 'unveiled_territory_cells'):
+            cells = empire.unveiled_territory_cells  ## prefetched by the view
+        else:
+            request = self.context.get('request')
+            cells = empire.territory_cells.filter(unveiled_by(request.user, request.world)).order_by('position_x', 'position_y')
+        return [c.position for c in cells]
 
 
 class PrivateEmpireSerializer(EmpireSerializer):
@@ -198,3 +247,10 @@ class ProcessSerializer(serializers.HyperlinkedModelSerializer):
             else:
                 data[key] = value
         return data
+
+
+class TickProfileSerializer(serializers.HyperlinkedModelSerializer):
+
+    class Meta:
+        model  = TickProfile
+        fields = ['url', 'first_tick', 'last_tick', 'timestamp', 'data']
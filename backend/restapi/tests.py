@@ -125,6 +125,28 @@ class WorldTest(BaseRestTest):
             for obj in objects
         ]
 
+    def test_simulate(self):
+        url = reverse('world-simulate', kwargs = dict(pk = self.object.pk))
+
+        # Only staff users are allowed to simulate
+        response = self.client.post(url, dict(ticks = 10), format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        User.objects.filter(username = 'testuser').update(is_staff = True)
+
+        response = self.client.post(url, dict(ticks = 10), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['now'], 11)
+        self.assertEqual(response.data['ticks'], 10)
+        self.assertGreater(response.data['ticks_per_second'], 0)
+        self.assertEqual(World.objects.get().now, 11)
+
+        # Missing, malformed, and negative numbers of ticks are rejected
+        for data in (dict(), dict(ticks = 'ten'), dict(ticks = None), dict(ticks = -1)):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('ticks', response.data)
+        self.assertEqual(World.objects.get().now, 11)
+
 
 class MovableTest(BaseRestTest):
 
@@ -143,6 +165,7 @@ class MovableTest(BaseRestTest):
                 'destination': obj.destination,
                 'speed': obj.speed,
                 'next_position': obj.next_position,
+                'next_move_tick': obj.next_move_tick,
                 'ship_set': [
                     reverse('ship-detail', kwargs = dict(pk = ship.pk)) for ship in obj.ship_set.all()
                 ],
@@ -160,6 +183,12 @@ class MovableTest(BaseRestTest):
         self.assertEqual(normalize(response.data), normalize(self.expected_details([self.object])[0]))
         self.test_detail()
 
+    def test_move_to_avoid_foreign_territory(self):
+        for value, expected in (('false', False), ('true', True), (False, False)):
+            response = self.client.post(self.move_to_url, dict(x = -3, y = +1, avoid_foreign_territory = value), format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(Movable.objects.get().avoid_foreign_territory, expected)
+
     def setup_different_user_test(self, user):
         blocked_planet = Empire.objects.get().habitat.get()
         celestial = Celestial.objects.exclude(sector = blocked_planet.sector).filter(features__capacity__gte = 1).all()[0]
@@ -180,12 +209,44 @@ class MovableTest(BaseRestTest):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
         # Unveil the object
-        Unveiled.objects.create(by_whom = user.empire, position_x = self.object.position_x, position_y = self.object.position_y)
+        Unveiled.objects.create(by_whom = user.empires.get(), position_x = self.object.position_x, position_y = self.object.position_y)
 
         # Check forbidden access to "move_to" action on a foreign unveiled object
         response = self.client.post(self.move_to_url, dict(x = -3, y = +1), format='json')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_different_user_moving(self):
+        self.object.move_to((-3, 1))
+        user = super(MovableTest, self).test_different_user()
+
+        # A moving object is visible where it is located currently (its position is derived from its route)
+        position = self.object.trajectory[0]
+        Unveiled.objects.create(by_whom = user.empires.get(), position_x = position[0], position_y = position[1])
+        response = self.client.get(self.object_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        World.objects.get().tick()
+        response = self.client.get(self.object_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['position'].tolist(), position.tolist())
+        response = self.client.get(reverse('ship-list'), format='json')
+        self.assertEqual(len(response.data), 1)
+
+    def test_moving_unveiled_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from restapi.serializers import movables_unveiled_by
+        from world import spatial
+        self.object.move_to((-3, 1))
+        world = World.objects.get()
+        user = self.object.owner.player
+        spatial.get_index(world.id, world.now)
+
+        # The positions of the moving movables are looked up in the spatial index (their routes are not loaded)
+        with CaptureQueriesContext(connection) as context:
+            unveiled = movables_unveiled_by(user, world)
+        self.assertFalse(any('"route"' in query['sql'] for query in context.captured_queries))
+        self.assertEqual(list(Movable.objects.filter(unveiled, world = world)), [self.object])
+
 
 class SectorTest(BaseRestTest):
 
@@ -303,6 +364,28 @@ class EmpireTest(BaseRestTest):
         ]
 
 
+    def test_list_num_queries(self):
+        def count_queries():
+            from django.db import connection
+            from django.test.utils import CaptureQueriesContext
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(self.list_url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context.captured_queries)
+
+        count_queries()  ## the first request caches the world
+        num_queries = count_queries()
+
+        # Add more empires with territory
+        for idx, celestial in enumerate(Celestial.objects.filter(habitated_by = None).exclude(sector__celestial__habitated_by__isnull = False)[:3]):
+            empire = Empire.objects.create(name = f'Empire {idx}', player = None, origin_x = 0, origin_y = 0, color_hue = 0)
+            celestial.habitated_by = empire
+            celestial.save()
+
+        count_queries()  ## the territory updates have evicted the cached world
+        self.assertEqual(count_queries(), num_queries)
+
+
 class PrivateEmpireTest(BaseRestTest):
 
     model = Empire
@@ -389,6 +472,42 @@ class BlueprintTest(BaseRestTest):
         response = self.client.post(self.build_url, dict(celestial = self.celestial_url), format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_eligibility(self):
+        def get_eligibility():
+            from django.db import connection
+            from django.test.utils import CaptureQueriesContext
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('blueprint-eligibility'), format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            eligibility = {urlparse(url1).path: {urlparse(url2).path: buildable for url2, buildable in row.items()} for url1, row in response.data.items()}
+            return eligibility, len(context.captured_queries)
+
+        get_eligibility()  ## the first request caches the world
+        eligibility, num_queries = get_eligibility()
+        celestial = self.empire.habitat.get()
+        self.assertEqual(eligibility, {
+            reverse('celestial-detail', kwargs = dict(pk = celestial.pk)): {
+                reverse('blueprint-detail', kwargs = dict(pk = blueprint.pk)): blueprint.requirements_ok(celestial)
+                for blueprint in self.empire.blueprint_set.all()
+            }
+        })
+
+        # Habitate more celestials and add constructions (the number of queries does not change)
+        shipyard = self.empire.blueprint_set.get(base_id = 'constructions/shipyard')
+        for celestial in Celestial.objects.filter(habitated_by = None, features__capacity__gte = 1)[:3]:
+            celestial.habitated_by = self.empire
+            celestial.save()
+            Construction.objects.create(blueprint = shipyard, celestial = celestial)
+        get_eligibility()  ## the territory updates have evicted the cached world
+        eligibility, num_queries2 = get_eligibility()
+        self.assertEqual(num_queries2, num_queries)
+        self.assertEqual(len(eligibility), 4)
+        for celestial in self.empire.habitat.all():
+            for blueprint in self.empire.blueprint_set.all():
+                url1 = reverse('celestial-detail', kwargs = dict(pk = celestial.pk))
+                url2 = reverse('blueprint-detail', kwargs = dict(pk = blueprint.pk))
+                self.assertEqual(eligibility[url1][url2], blueprint.requirements_ok(celestial))
+
     def test_celestial_of_different_user(self):
         celestial = Celestial.objects \
             .filter(features__capacity__gte = 1) \
@@ -503,5 +622,91 @@ class ProcessTest(BaseRestTest):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+class TickProfileTest(APITestCase):
+
+    def setUp(self):
+        generate_test_world(radius = 10, density = 0.5, seed = 0)
+        self.client.login(username='testuser', password='password')
+        Movable.objects.get().move_to((-3, +1))
+        world = World.objects.get()
+        for _ in range(3):
+            world.tick()
+
+    def test_list(self):
+        url = reverse('tickprofile-list')
+
+        # Only staff users are allowed to access the profiles
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        User.objects.filter(username = 'testuser').update(is_staff = True)
+
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([profile['last_tick'] for profile in response.data[:3]], [4, 3, 2])
+        self.assertIn('MovementHandler', response.data[2]['data']['handlers'])
+
+    def test_summary(self):
+        User.objects.filter(username = 'testuser').update(is_staff = True)
+        response = self.client.get(reverse('tickprofile-summary'), dict(last = 3), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['profiles'], 3)
+        self.assertEqual(response.data['ticks'], 3)
+        self.assertEqual(response.data['handlers']['MovementHandler']['processes'], 3)
+        self.assertEqual(response.data['empires'][str(Empire.objects.get().id)]['processes'], 3)
+
+        # The number of profiles must be a positive integer
+        for last in ('three', '', 0, -1):
+            response = self.client.get(reverse('tickprofile-summary'), dict(last = last), format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('last', response.data)
+
+
+class MultipleWorldsTest(APITestCase):
+
+    def setUp(self):
+        from world.generator import generate_world
+        generate_test_world(radius = 10, density = 0.5, seed = 0)
+        self.world2 = generate_world(radius = 5, density = 0.5, seed = 1, name = 'speed')
+        self.client.login(username='testuser', password='password')
+
+        # The player joins the second world
+        user = User.objects.get(username = 'testuser')
+        sector = self.world2.sectors.all()[0]
+        self.empire2 = Empire.objects.create(world = self.world2, name = 'Foos', player = user, origin_x = sector.position_x, origin_y = sector.position_y, color_hue = 0)
+        Unveiled.unveil(self.empire2, sector.position, 1)
+
+    def test_scoping(self):
+        empire1 = Empire.objects.get(world = World.objects.get(name = 'default'))
+        for prefix, empire in (('', empire1), ('/worlds/speed', self.empire2)):
+            response = self.client.get(f'{prefix}/api/users/', format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(urlparse(response.data[0]['empire']).path, f'{prefix}/api/empires/{empire.id}/')
+
+            # Only the sectors of the addressed world are listed, and linked within that world
+            response = self.client.get(f'{prefix}/api/sectors/', format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertGreater(len(response.data), 0)
+            for sector in response.data:
+                path = urlparse(sector['url']).path
+                self.assertTrue(path.startswith(f'{prefix}/api/sectors/'))
+                self.assertEqual(Sector.objects.get(id = int(path.split('/')[-2])).world_id, empire.world_id)
+
+    def test_build(self):
+        celestial = Celestial.objects.filter(sector__world = self.world2, features__capacity__gte = 1)[0]
+        celestial.habitated_by = self.empire2
+        celestial.save()
+        blueprint = self.empire2.blueprint_set.get(base_id = 'constructions/digital-cave')
+        response = self.client.post(
+            f'/worlds/speed/api/blueprints/{blueprint.id}/build/',
+            dict(celestial = f'http://testserver/worlds/speed/api/celestials/{celestial.id}/'),
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Process.objects.get(blueprint = blueprint).world_id, self.world2.id)
+
+        # The blueprint is not found in the other world
+        response = self.client.post(f'/api/blueprints/{blueprint.id}/build/', dict(celestial = ''), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
 # Do not run the base class as a test
 del BaseRestTest
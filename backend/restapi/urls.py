@@ -21,6 +21,8 @@ router.register(r'ships'        , views.ShipViewSet        , basename = 'ship')
 
 router.register(r'processes', views.ProcessViewSet, basename = 'process')
 
+router.register(r'tickprofiles', views.TickProfileViewSet, basename = 'tickprofile')
+
 urlpatterns = [
     path('', include(router.urls)),
     path('login/', views.LoginView.as_view()),
@@ -1,15 +1,21 @@
+import time
 from urllib.parse import urlparse
 
 from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.db import models
-from django.urls import resolve
-from rest_framework import permissions, views, viewsets, mixins, status
+from django.urls import get_script_prefix, resolve
+from rest_framework import permissions, serializers, views, viewsets, mixins, status
 from rest_framework.decorators import action
+from rest_framework.fields import empty
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 
 from restapi.permissions import IsObjectOwner
 from restapi.serializers import (
+    unveiled_by,
+    movables_unveiled_by,
+
     UserSerializer,
     LoginSerializer,
 
@@ -26,13 +32,17 @@ from restapi.serializers import (
     ShipSerializer,
 
     ProcessSerializer,
+
+    TickProfileSerializer,
 )
 from world.models import (
     World,
     Movable,
     Sector,
     Celestial,
+    TerritoryCell,
     Unveiled,
+    TickProfile,
 )
 from game.models import (
     Empire,
@@ -45,6 +55,17 @@ from processes.models import (
 )
 
 
+def resolve_url(url):
+    """
+    Resolves the URL of an object (the URL prefix of the world addressed by the request, if any, is stripped).
+    """
+    path = urlparse(url).path
+    script_prefix = get_script_prefix()
+    if path.startswith(script_prefix):
+        path = '/' + path[len(script_prefix):]
+    return resolve(path)
+
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
 
     serializer_class = UserSerializer
@@ -71,6 +92,20 @@ class WorldViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = World.objects.all()
     serializer_class = WorldSerializer
 
+    @action(detail = True, methods = ['post'], permission_classes = [permissions.IsAdminUser])
+    def simulate(self, request, pk = None):
+        world = self.get_object()
+        try:
+            ticks = serializers.IntegerField(min_value = 0).run_validation(request.data.get('ticks', empty))
+        except serializers.ValidationError as error:
+            return Response(dict(ticks = error.detail), status = status.HTTP_400_BAD_REQUEST)
+        t0 = time.perf_counter()
+        if not world.simulate(ticks):
+            return Response(dict(detail = 'The ticks of the world are being processed by another process'), status = status.HTTP_409_CONFLICT)
+        seconds = time.perf_counter() - t0
+        serializer = self.get_serializer(world)
+        return Response(dict(serializer.data, ticks = ticks, seconds = seconds, ticks_per_second = ticks / max((seconds, 1e-6))))
+
 
 class MovableViewSet(viewsets.ReadOnlyModelViewSet):
 
@@ -78,11 +113,7 @@ class MovableViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        unveiled_qs = Unveiled.objects.filter(
-            by_whom__player = self.request.user,
-            position_x = models.OuterRef('position_x'),
-            position_y = models.OuterRef('position_y'))
-        return Movable.objects.filter(models.Exists(unveiled_qs))
+        return Movable.objects.filter(movables_unveiled_by(self.request.user, self.request.world), world = self.request.world)
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -94,7 +125,7 @@ class MovableViewSet(viewsets.ReadOnlyModelViewSet):
         movable = self.get_object()
         x = request.data['x']
         y = request.data['y']
-        movable.move_to((x, y))
+        movable.move_to((x, y), avoid_foreign_territory = serializers.BooleanField().to_internal_value(request.data.get('avoid_foreign_territory', False)))
         serializer = self.get_serializer(movable)
         return Response(serializer.data)
 
@@ -107,9 +138,10 @@ class SectorViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         unveiled_qs = Unveiled.objects.filter(
             by_whom__player = self.request.user,
+            by_whom__world  = self.request.world,
             position_x = models.OuterRef('position_x'),
             position_y = models.OuterRef('position_y'))
-        return Sector.objects.filter(models.Exists(unveiled_qs))
+        return Sector.objects.filter(models.Exists(unveiled_qs), world = self.request.world)
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -125,15 +157,16 @@ class CelestialViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         unveiled_qs = Unveiled.objects.filter(
             by_whom__player = self.request.user,
+            by_whom__world  = self.request.world,
             position_x = models.OuterRef('sector__position_x'),
             position_y = models.OuterRef('sector__position_y'))
-        return Celestial.objects.filter(models.Exists(unveiled_qs))
+        return Celestial.objects.filter(models.Exists(unveiled_qs), sector__world = self.request.world).select_related('sector')
 
     @action(detail = True, methods = ['post'], permission_classes = [permissions.IsAuthenticated])
     def colonize(self, request, pk = None):
         celestial = self.get_object()
-        empire    = request.user.empire
-        movable   = Movable.objects.get(**resolve(urlparse(request.data['movable']).path).kwargs) if len(request.data.get('movable', '')) > 0 else None
+        empire    = request.user.empires.get(world = request.world)
+        movable   = Movable.objects.get(world = request.world, **resolve_url(request.data['movable']).kwargs) if len(request.data.get('movable', '')) > 0 else None
         process   = celestial.colonize(empire, movable)
         assert process is not None
         if movable is not None:
@@ -150,15 +183,20 @@ class UnveiledViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Unveiled.objects.filter(by_whom__player = self.request.user)
+        return Unveiled.objects.filter(by_whom__player = self.request.user, by_whom__world = self.request.world)
 
 
 class EmpireViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
 
-    queryset = Empire.objects.all()
     serializer_class = EmpireSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return Empire.objects.filter(world = self.request.world).prefetch_related(
+            models.Prefetch('territory_cells',
+                queryset = TerritoryCell.objects.filter(unveiled_by(self.request.user, self.request.world)).order_by('position_x', 'position_y'),
+                to_attr = 'unveiled_territory_cells'))
+
 
 class PrivateEmpireViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
 
@@ -166,7 +204,7 @@ class PrivateEmpireViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Empire.objects.filter(player = self.request.user)
+        return Empire.objects.filter(player = self.request.user, world = self.request.world)
 
 
 class BlueprintViewSet(viewsets.ReadOnlyModelViewSet):
@@ -175,19 +213,34 @@ class BlueprintViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Blueprint.objects.filter(empire__player = self.request.user)
+        return Blueprint.objects.filter(empire__player = self.request.user, empire__world = self.request.world).select_related('empire')
 
     @action(detail = True, methods = ['post'])
     def build(self, request, pk = None):
         from world.models import Celestial
         from restapi.serializers import ProcessSerializer
         blueprint = self.get_object()
-        celestial = Celestial.objects.get(**resolve(urlparse(request.data['celestial']).path).kwargs)
+        celestial = Celestial.objects.get(sector__world = request.world, **resolve_url(request.data['celestial']).kwargs)
         process = blueprint.build(celestial)
         assert process is not None
         serializer = ProcessSerializer(process, context = dict(request = request))
         return Response(serializer.data)
 
+    @action(detail = False)
+    def eligibility(self, request):
+        """
+        Determines which blueprints can be built on which celestials habitated by the empire of the user (by their URLs).
+        """
+        empire = request.user.empires.get(world = request.world)
+        eligibility = empire.build_eligibility()
+        return Response({
+            reverse('celestial-detail', kwargs = dict(pk = celestial_id), request = request): {
+                reverse('blueprint-detail', kwargs = dict(pk = blueprint_id), request = request): buildable
+                for blueprint_id, buildable in buildable_blueprints.items()
+            }
+            for celestial_id, buildable_blueprints in eligibility.items()
+        })
+
 
 class ConstructionViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
 
@@ -195,7 +248,7 @@ class ConstructionViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixi
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Construction.objects.filter(blueprint__empire__player = self.request.user)
+        return Construction.objects.filter(blueprint__empire__player = self.request.user, blueprint__empire__world = self.request.world)
 
 
 class ShipViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
@@ -204,12 +257,8 @@ class ShipViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.Destr
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        unveiled_qs = Unveiled.objects.filter(
-            by_whom__player = self.request.user,
-            position_x = models.OuterRef('movable__position_x'),
-            position_y = models.OuterRef('movable__position_y'))
-        qs_unveiled = Ship.objects.filter(models.Exists(unveiled_qs))
-        qs_owned = Ship.objects.filter(blueprint__empire__player = self.request.user)
+        qs_unveiled = Ship.objects.filter(movable__in = Movable.objects.filter(movables_unveiled_by(self.request.user, self.request.world)), movable__world = self.request.world)
+        qs_owned = Ship.objects.filter(blueprint__empire__player = self.request.user, blueprint__empire__world = self.request.world)
         return qs_unveiled | qs_owned
 
 
@@ -219,7 +268,7 @@ class ProcessViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Process.objects.filter(owner__player = self.request.user)
+        return Process.objects.filter(owner__player = self.request.user, world = self.request.world)
 
     def destroy(self, request, *args, **kwargs):
         process = self.get_object()
@@ -227,3 +276,37 @@ class ProcessViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.
         process.handler.cancel(process)
         assert Process.objects.filter(id = process_id).count() == 0
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TickProfileViewSet(viewsets.ReadOnlyModelViewSet):
+
+    serializer_class = TickProfileSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_queryset(self):
+        return TickProfile.objects.filter(world = self.request.world).order_by('-id')
+
+    @action(detail = False)
+    def summary(self, request):
+        """
+        Aggregates the measurements of the most recent profiles (`?last=...`, defaults to all stored profiles) per handler and per empire.
+        """
+        profiles = self.get_queryset()
+        if 'last' in request.query_params:
+            try:
+                last = serializers.IntegerField(min_value = 1).run_validation(request.query_params['last'])
+            except serializers.ValidationError as error:
+                return Response(dict(last = error.detail), status = status.HTTP_400_BAD_REQUEST)
+            profiles = profiles[:last]
+        summary = dict(profiles = 0, ticks = 0, wall_seconds = 0., queries = 0, db_seconds = 0., handlers = dict(), empires = dict())
+        for data in profiles.values_list('data', flat = True):
+            summary['profiles'] += 1
+            summary['ticks'] += data['last_tick'] - data['first_tick'] + 1
+            for key in ('wall_seconds', 'queries', 'db_seconds'):
+                summary[key] += data[key]
+            for group in ('handlers', 'empires'):
+                for name, stats in data[group].items():
+                    total = summary[group].setdefault(name, dict())
+                    for key, value in stats.items():
+                        total[key] = total.get(key, 0) + value
+        return Response(summary)
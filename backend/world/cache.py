@@ -0,0 +1,98 @@
+"""
+Implements a process-local cache of the worlds, so that handling a request usually does not query the world from the database.
+
+A cached world is trusted until a tick is due by the clock, or until it was validated more than `settings.WORLD_CACHE_SECONDS` ago.
+Then it is validated against the `revision` of the world in the database (a single query), and reloaded if the revision changed (e.g., if the ticks were processed by the tick daemon).
+
+The worlds saved by this process are evicted immediately, and cached again after the transaction is committed (unless only some fields were saved).
+Only copies of the cached worlds are handed out, so that modifying a world does not affect the cache (nor other threads).
+"""
+
+import copy
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+
+_worlds = dict()   ## world id -> (world, timestamp of the validation)
+_lookups = dict()  ## key of the lookup -> (world id, timestamp of the lookup)
+
+
+def _store(world):
+    _worlds[world.id] = (copy.copy(world), time.time())
+
+
+def get_world(world_id):
+    """
+    Returns the world with the id `world_id` (or `None`, if it does not exist).
+    """
+    from world.models import World
+    entry = _worlds.get(world_id)
+    if entry is not None:
+        world, timestamp = entry
+        if world.pending_ticks == 0 and time.time() - timestamp < settings.WORLD_CACHE_SECONDS:
+            return copy.copy(world)
+
+        # Validate the cached world against the database
+        revision = World.objects.filter(id = world_id).values_list('revision', flat = True).first()
+        if revision == world.revision:
+            _worlds[world_id] = (world, time.time())
+            return copy.copy(world)
+
+    world = World.objects.filter(id = world_id).first()
+    if world is None:
+        _worlds.pop(world_id, None)
+    else:
+        _store(world)
+    return world
+
+
+def find_world(key, query):
+    """
+    Returns the world found by a lookup (e.g., by the host name), which is cached for `settings.WORLD_CACHE_SECONDS`.
+
+    :param key: Key which identifies the lookup, e.g. `('host', 'example.com')`.
+    :param query: Function which queries the world from the database (or returns `None`).
+    """
+    entry = _lookups.get(key)
+    if entry is not None and time.time() - entry[1] < settings.WORLD_CACHE_SECONDS:
+        world = get_world(entry[0])
+        if world is not None:
+            return world
+
+    world = query()
+    if world is None:
+        _lookups.pop(key, None)
+    else:
+        _lookups[key] = (world.id, time.time())
+        _store(world)
+    return world
+
+
+def evict_world(world_id):
+    """
+    Evicts the world with the id `world_id`, e.g. after it was updated in the database without saving it.
+    """
+    _worlds.pop(world_id, None)
+
+
+@receiver(post_save, sender = 'world.World')
+def update_on_world_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        _lookups.clear()  ## e.g., the new world might be addressed by a host name which previously resolved to the default world
+    _worlds.pop(instance.id, None)
+
+    # The territory revision of the instance might be stale, if it was not saved (see `World.save`)
+    if update_fields is not None and 'territory_revision' not in update_fields:
+        return
+    world = copy.copy(instance)
+    transaction.on_commit(lambda: _worlds.__setitem__(world.id, (world, time.time())))
+
+
+@receiver(post_delete, sender = 'world.World')
+def evict_on_world_deleted(sender, instance, **kwargs):
+    _lookups.clear()
+    _worlds.pop(instance.id, None)
@@ -0,0 +1,147 @@
+"""
+Implements the tick daemon, which advances the worlds independently of incoming requests.
+"""
+
+import concurrent.futures
+import fcntl
+import logging
+import multiprocessing
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, connections
+
+from .models import World
+
+
+logger = logging.getLogger(__name__)
+
+
+def tick_world(world_id, max_sleep_seconds):
+    """
+    Processes the pending ticks of a world (also used by the worker processes of the daemon).
+
+    :return: The number of seconds until the next tick of the world is due.
+    """
+    close_old_connections()
+    try:
+        world = World.objects.get(id = world_id)
+    except World.DoesNotExist:
+        return max_sleep_seconds
+
+    if world.tickrate == 0:
+        return max_sleep_seconds
+
+    pending_ticks = world.pending_ticks
+    t0 = time.perf_counter()
+    if pending_ticks > 0 and world.do_pending_ticks():
+        logger.info(f'Processed {pending_ticks} tick(s) of world "{world.name}" up to tick {world.now} in {time.perf_counter() - t0:.3f} seconds')
+
+    # Sleep until the next tick is due, even if no process finishes then (an idle tick only saves the world), so that the world is never stale for the requests
+    next_tick_timestamp = world.last_tick_timestamp + world.seconds_between_ticks
+    return min((max_sleep_seconds, max((0, next_tick_timestamp - time.time()))))
+
+
+class TickDaemon:
+    """
+    Processes the pending ticks of the worlds whenever a tick is due.
+
+    The worlds are either processed one after another, or in parallel by `workers` worker processes (so that a slow world does not delay the others).
+
+    Only one daemon can be running at a time (leadership is determined by an exclusive lock on `settings.TICK_DAEMON_LOCKFILE`).
+    """
+
+    # Maximum number of seconds between checks whether the daemon was stopped, when running with worker processes
+    poll_seconds = 1
+
+    def __init__(self, lockfile = None, max_sleep_seconds = 60, workers = 0):
+        self.lockfile = lockfile or settings.TICK_DAEMON_LOCKFILE
+        self.max_sleep_seconds = max_sleep_seconds
+        self.workers = workers
+        self.stop_event = threading.Event()
+        self._lock_fp = None
+
+    def acquire_leadership(self):
+        """
+        Tries to become the only running tick daemon.
+
+        :return: `True` if the leadership was acquired, and `False` if another daemon is running.
+        """
+        fp = open(self.lockfile, 'a')
+        try:
+            fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            fp.close()
+            return False
+        self._lock_fp = fp
+        return True
+
+    def release_leadership(self):
+        if self._lock_fp is not None:
+            fcntl.flock(self._lock_fp, fcntl.LOCK_UN)
+            self._lock_fp.close()
+            self._lock_fp = None
+
+    def stop(self, *args):
+        """
+        Requests the daemon to stop after the current tick (can be used as a signal handler).
+        """
+        self.stop_event.set()
+
+    def active_world_ids(self):
+        close_old_connections()
+        return list(World.objects.exclude(tickrate = 0).order_by('id').values_list('id', flat = True))
+
+    def run_once(self):
+        """
+        Processes the pending ticks of all worlds, one after another.
+
+        :return: The number of seconds until the next tick is due, when a process finishes.
+        """
+        sleep_seconds = [tick_world(world_id, self.max_sleep_seconds) for world_id in self.active_world_ids()]
+        return min(sleep_seconds + [self.max_sleep_seconds])
+
+    def run(self):
+        """
+        Processes the pending ticks whenever a tick is due, until `stop` is called.
+        """
+        if self.workers > 0:
+            self.run_parallel()
+            return
+        while not self.stop_event.is_set():
+            sleep_seconds = self.run_once()
+            self.stop_event.wait(timeout = sleep_seconds)
+
+    def run_parallel(self):
+        """
+        Processes the pending ticks of each world in a worker process whenever a tick of that world is due, until `stop` is called.
+
+        A world is processed by at most one worker at a time, while the other worlds are processed independently.
+        """
+        due, running = dict(), dict()  ## world id -> timestamp when the world is due, future -> world id
+        with concurrent.futures.ProcessPoolExecutor(self.workers, mp_context = multiprocessing.get_context('fork')) as executor:
+            while not self.stop_event.is_set():
+                world_ids, now = self.active_world_ids(), time.time()
+                for world_id in world_ids:
+                    if world_id not in running.values() and due.get(world_id, 0) <= now:
+
+                        # Do not share the database connections with the forked worker processes
+                        connections.close_all()
+                        running[executor.submit(tick_world, world_id, self.max_sleep_seconds)] = world_id
+
+                # Wait until a world is processed or the next world is due
+                timeout = min([due[world_id] - now for world_id in world_ids if world_id in due and world_id not in running.values()] + [self.poll_seconds])
+                done, _ = concurrent.futures.wait(running, timeout = max((0, timeout)), return_when = concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    world_id = running.pop(future)
+                    try:
+                        due[world_id] = time.time() + future.result()
+                    except OperationalError as error:
+
+                        # SQLite only permits a single writer at a time, so concurrent ticks may fail (and are retried)
+                        logger.warning(f'Retrying to process the ticks of world {world_id}: {error}')
+                        due[world_id] = time.time() + self.poll_seconds
+                    except Exception:
+                        logger.exception(f'Failed to process the ticks of world {world_id}')
+                        due[world_id] = time.time() + self.max_sleep_seconds
@@ -1,10 +1,8 @@
 import random
 
-from django.db.models import F
-from django.db.models.functions import Sqrt, Power
 from django.contrib.auth.models import User
 
-from world import hexgrid
+from world import hexgrid, journal
 from world.models import (
     World,
     Movable,
@@ -24,12 +22,13 @@ def craete_random_sector_name():
     return f'{part1.capitalize()} {part2.capitalize()}'
 
 
-def create_sector(used_names, x, y):
+def create_sector(world, used_names, x, y):
     name = None
     while name is None or name in used_names:
         name = craete_random_sector_name()
 
     sector = Sector.objects.create(
+        world      = world,
         position_x = x,
         position_y = y,
         name = name)
@@ -38,6 +37,7 @@ def create_sector(used_names, x, y):
         recipes = yaml.safe_load(fp)
 
     num_celestials = random.randint(1, 10)
+    celestials = list()
     for position in range(num_celestials):
 
         compatible_recipes = list()
@@ -66,25 +66,39 @@ def create_sector(used_names, x, y):
             else:
                 features[feature] = recipe[feature]
 
-        Celestial.objects.create(
+        celestials.append(Celestial(
             sector   = sector,
             position = position,
-            features = features)
+            features = features))
+
+    # Accumulate the features of the sector only once (the celestials are created in bulk)
+    Celestial.objects.bulk_create(celestials)
+    sector.features = Sector.accumulate_features([celestial.features for celestial in celestials])
+    sector.save(update_fields = ['features'])
 
     return sector
 
 
-def generate_world(radius, density, seed, exist_ok=False, tickrate=60):
+def generate_world(radius, density, seed, exist_ok=False, tickrate=60, name=None, host=None):
+    """
+    Generates a random world.
+
+    :param name: If `None`, the database is flushed and the default world is generated. Otherwise, a world with that name is added to the existing ones.
+    :param host: Host name used to address the world (optional).
+    """
     assert isinstance(radius, int) and radius > 0, radius
     assert 0 < density < 1, density
-    assert exist_ok or Sector.objects.count() == 0
 
-    from django.core.management import call_command
-    call_command('flush', interactive=False)
+    if name is None:
+        assert exist_ok or Sector.objects.count() == 0
+        from django.core.management import call_command
+        call_command('flush', interactive=False)
+    else:
+        assert not World.objects.filter(name = name).exists(), name
 
     random.seed(seed)
 
-    world = World.objects.create(id = 1, tickrate = tickrate)
+    world = World.objects.create(name = name or 'default', host = host, tickrate = tickrate)
 
     used_names = set()
     world_size = 2 * radius + 1
@@ -93,9 +107,10 @@ def generate_world(radius, density, seed, exist_ok=False, tickrate=60):
         if not hexgrid.are_hex_coordinates((x, y)): continue
         if random.random() <= density:
 
-            sector = create_sector(used_names, x, y)
+            sector = create_sector(world, used_names, x, y)
             used_names.add(sector.name)
 
+    journal.take_snapshot(world)
     return world
 
 
@@ -106,11 +121,12 @@ def generate_test_world(*args, empire2 = False, **kwargs):
         password='password')
 
     # Find a habitable planet
-    celestial = Celestial.objects.filter(features__capacity__gte = 1)[0]
+    celestial = Celestial.objects.filter(sector__world = world, features__capacity__gte = 1)[0]
 
     # Create empire
     from game.models import Empire, Blueprint, Ship
     empire = Empire.objects.create(
+        world     = world,
         name      = 'Foos',
         player    = user,
         origin_x  = celestial.sector.position_x,
@@ -126,6 +142,7 @@ def generate_test_world(*args, empire2 = False, **kwargs):
             empire = empire,
             base_id = 'ships/colony-ship'),
         movable = Movable.objects.create(
+            world = world,
             name = 'Group 1',
             position_x = celestial.sector.position_x,
             position_y = celestial.sector.position_y))
@@ -137,13 +154,12 @@ def generate_test_world(*args, empire2 = False, **kwargs):
     if empire2:
 
         # Determine closest celestial in other sector
-        celestial2 = Celestial.objects.exclude(sector = celestial.sector).filter(features__capacity__gte = 1).annotate(
-            dist_x = F('sector__position_x') - celestial.sector.position_x,
-            dist_y = F('sector__position_y') - celestial.sector.position_y).annotate(
-                dist = Sqrt(Power('sector__position_x', 2) + Power('sector__position_y', 2))
-            ).order_by('dist')[0]
+        candidates = list(Celestial.objects.filter(sector__world = world).exclude(sector = celestial.sector).filter(features__capacity__gte = 1).select_related('sector'))
+        idx, _ = hexgrid.nearest(celestial.sector.position, [c.sector.position for c in candidates])
+        celestial2 = candidates[idx]
 
         empire2 = Empire.objects.create(
+            world     = world,
             name      = 'Bars',
             player    = None,
             origin_x  = celestial2.sector.position_x,
@@ -158,6 +174,10 @@ def generate_test_world(*args, empire2 = False, **kwargs):
                 empire = empire2,
                 base_id = 'ships/colony-ship'),
             movable = Movable.objects.create(
+                world = world,
                 name = 'Group 1',
                 position_x = celestial2.sector.position_x,
                 position_y = celestial2.sector.position_y))
+
+    journal.take_snapshot(world)
+    return world
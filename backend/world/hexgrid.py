@@ -10,12 +10,33 @@ This implies the following adjacencies:
 ```
 u ~ v  iff  |d.y| ≤ 1  or  |d.x| ≤ 2
 ```
+
+and the following distance function:
+```
+dist(u, v) = max(|d.y|, (|d.x| + |d.y|) / 2)
+```
 """
 
+import functools
 import math
 
 import numpy as np
-from sklearn.cluster import DBSCAN
+import scipy.sparse
+import scipy.sparse.csgraph
+
+
+# Offsets of the six hex fields adjacent to a hex field
+HEX_NEIGHBORS = np.array([
+    (-2, 0),
+    (-1, 1),
+    ( 1, 1),
+    ( 2, 0),
+    ( 1,-1),
+    (-1,-1),
+])
+
+# Offsets of the hex fields within a Euclidean distance of 2 to a hex field
+DBSCAN_NEIGHBORS = np.concatenate((HEX_NEIGHBORS, [(0, 2), (0, -2)]))
 
 
 def are_hex_coordinates(c):
@@ -26,31 +47,143 @@ def check_hex_coordinates(c):
     assert are_hex_coordinates(c), f'hex coordinates {tuple(c)} are invalid'
 
 
-def get_next_position_towards(position, destination, speed):
-    u = position
-    check_hex_coordinates(u)
-    for _ in range(math.ceil(speed)):
-        v = np.asarray(destination, dtype=int)
-        check_hex_coordinates(v)
-        d = v - u
-        d = d.clip(-2, +2)
-        if abs(d[1]) >= 1:
-            d = d.clip(-1, +1)
-            if np.sum(u + d) % 2 == 1: d[0] -= 1
-        u += d
-        check_hex_coordinates(u)
-    return u
+def are_hex_coordinates_many(points):
+    """
+    Vectorized version of `are_hex_coordinates` for an array of shape `(n, 2)`.
+    """
+    return np.sum(points, axis=1) % 2 == 0
+
+
+def bbox_hex_coordinates(bbox):
+    """
+    Enumerates the valid hex coordinates within a bounding box.
+
+    :param bbox: `(x_min, x_max, y_min, y_max)`
+    :return: Array of shape `(n, 2)`, ordered by the `x` coordinate first and then by the `y` coordinate.
+    """
+    x_min, x_max, y_min, y_max = bbox
+    if x_min > x_max or y_min > y_max:
+        return np.zeros((0, 2), int)
+    x, y = np.meshgrid(
+        np.arange(x_min, x_max + 1, dtype=int),
+        np.arange(y_min, y_max + 1, dtype=int),
+        indexing = 'ij')
+    points = np.stack((x.ravel(), y.ravel()), axis=1)
+    return points[are_hex_coordinates_many(points)]
+
+
+def hex_distance(u, v):
+    """
+    Computes the number of steps between two hex fields.
 
+    Both arguments can also be arrays of shape `(..., 2)`, in which case the distances are computed element-wise (with broadcasting).
+    """
+    d = np.abs(np.subtract(u, v))
+    return np.maximum(d[..., 1], (d[..., 0] + d[..., 1]) // 2)
 
-def get_trajectory_towards(position, destination, speed):
-    pos = np.asarray(position);
-    trajectory = list()
-    while (pos != destination).any():
-        pos = get_next_position_towards(pos, destination, speed)
-        trajectory.append(pos.copy())
+
+def pairwise_distances(A, B):
+    """
+    Computes the distances between all pairs of hex fields from `A` and `B`.
+
+    :param A: Array of shape `(n, 2)`.
+    :param B: Array of shape `(m, 2)`.
+    :return: Array of shape `(n, m)`.
+    """
+    A = np.asarray(A, dtype=int).reshape(-1, 2)
+    B = np.asarray(B, dtype=int).reshape(-1, 2)
+    return hex_distance(A[:, None, :], B[None, :, :])
+
+
+def nearest(point, candidates):
+    """
+    Finds the candidate closest to a hex field (ties are resolved by the order of the candidates).
+
+    :param candidates: Array of shape `(n, 2)` with `n > 0`.
+    :return: Tuple `idx, distance` where `idx` is the index of the closest candidate.
+    """
+    distances = hex_distance(np.asarray(candidates, dtype=int).reshape(-1, 2), point)
+    idx = int(np.argmin(distances))
+    return idx, int(distances[idx])
+
+
+def get_path_towards(position, destination):
+    """
+    Computes the path of single steps from a hex field towards another one (in closed form).
+
+    The path goes diagonally until either the horizontal or vertical offset is zero, and then straight (or zig-zag, if the remaining offset is vertical).
+    It is a shortest path, so its length equals `hex_distance(position, destination)`.
+
+    :return: Array of shape `(n, 2)` with the visited hex fields, excluding `position` and including `destination`.
+    """
+    check_hex_coordinates(position)
+    check_hex_coordinates(destination)
+    dx, dy = np.subtract(destination, position)
+    sx, sy = np.sign(dx), np.sign(dy)
+    n_diag = min((abs(dx), abs(dy)))
+
+    # Steps in diagonal direction
+    steps = [np.tile((sx, sy), (n_diag, 1))]
+
+    # Remaining steps in horizontal direction
+    if abs(dx) >= abs(dy):
+        steps.append(np.tile((2 * sx, 0), ((abs(dx) - abs(dy)) // 2, 1)))
+
+    # Remaining steps in vertical direction (zig-zag, starting to the left)
+    else:
+        n_vert = abs(dy) - abs(dx)
+        zigzag = np.where(np.arange(n_vert) % 2 == 0, -1, +1)
+        steps.append(np.stack((zigzag, np.full(n_vert, sy)), axis=1))
+
+    steps = np.concatenate(steps).reshape(-1, 2).astype(int)
+    return np.asarray(position, dtype=int) + np.cumsum(steps, axis=0)
+
+
+def get_trajectory_along(path, speed):
+    """
+    Computes the positions after each move along a path of single steps, where each move comprises `ceil(speed)` steps.
+
+    :param path: Array of shape `(n, 2)` with the visited hex fields (as returned by `get_path_towards`).
+    :return: Read-only array of shape `(m, 2)`, which includes the last hex field of the path.
+    """
+    steps_per_move = math.ceil(speed)
+    path = np.asarray(path, dtype=int).reshape(-1, 2)
+    trajectory = path[steps_per_move - 1::steps_per_move]
+    if len(path) % steps_per_move != 0:
+        trajectory = np.concatenate((trajectory, path[-1:]))
+    trajectory.flags.writeable = False
     return trajectory
 
 
+@functools.lru_cache(maxsize = 4096)
+def _get_trajectory_towards(position, destination, steps_per_move):
+    return get_trajectory_along(get_path_towards(position, destination), steps_per_move)
+
+
+def get_trajectory_towards(position, destination, speed):
+    """
+    Computes the positions after each move from a hex field towards another one, where each move comprises `ceil(speed)` steps.
+
+    The results are cached (keyed by the position, destination, and speed).
+
+    :return: Read-only array of shape `(n, 2)`, excluding `position` and including `destination`.
+    """
+    position    = tuple(int(c) for c in position)
+    destination = tuple(int(c) for c in destination)
+    return _get_trajectory_towards(position, destination, math.ceil(speed))
+
+
+def get_next_position_towards(position, destination, speed, moves=1):
+    """
+    Computes the position after a number of moves from a hex field towards another one, where each move comprises `ceil(speed)` steps.
+    """
+    trajectory = get_trajectory_towards(position, destination, speed)
+    if len(trajectory) == 0 or moves < 1:
+        return np.array(position, dtype=int)
+    else:
+        return trajectory[min((moves, len(trajectory))) - 1].copy()
+
+
 class Halfspace:
 
     def __init__(self, normal, distance, normalize=False):
@@ -60,6 +193,15 @@ class Halfspace:
     def __contains__(self, point):
         return np.dot(self.normal, point) <= self.distance
 
+    def contains_many(self, points):
+        """
+        Tests which of the points are contained in the halfspace.
+
+        :param points: Array of shape `(n, 2)`.
+        :return: Boolean mask of shape `(n,)`.
+        """
+        return np.asarray(points) @ np.asarray(self.normal) <= self.distance
+
 
 class HexSet:
     """
@@ -67,11 +209,21 @@ class HexSet:
 
     Realizations must implement the `__contains__` operator to test whether a hex field is contained.
     They also must implement the `bbox` method to obtain a bounding box of the set.
+    Realizations should override the `contains_many` method with a vectorized implementation.
     """
 
     def __contains__(self, point):
         raise NotImplemented()
 
+    def contains_many(self, points):
+        """
+        Tests which of the hex fields are contained in the set.
+
+        :param points: Array of shape `(n, 2)` with valid hex coordinates.
+        :return: Boolean mask of shape `(n,)`.
+        """
+        return np.array([p in self for p in np.asarray(points, dtype=int).reshape(-1, 2)], dtype=bool)
+
     def bbox(self):
         """
         Returns the bounding box of the set.
@@ -87,12 +239,8 @@ class HexSet:
         if hasattr(self, '_explicit'):
             return self._explicit
         else:
-            result = list()
-            x_min, x_max, y_min, y_max = self.bbox()
-            for q in np.ndindex(x_max - x_min + 1, y_max - y_min + 1):
-                p = np.add((x_min, y_min), q)
-                if np.sum(p) % 2 == 0 and p in self:
-                    result.append(p)
+            candidates = bbox_hex_coordinates(self.bbox())
+            result = list(candidates[self.contains_many(candidates)])
             self._explicit = result
             return result
 
@@ -102,8 +250,8 @@ class HexSet:
         """
         x_min, x_max, y_min, y_max = self.bbox()
         out = np.full((y_max - y_min + 1, x_max - x_min + 1), -1, int)
-        for cidx, c in enumerate(self.explicit()):
-            out[c[1] - y_min, c[0] - x_min] = cidx
+        points = np.asarray(self.explicit(), dtype=int).reshape(-1, 2)
+        out[points[:, 1] - y_min, points[:, 0] - x_min] = np.arange(len(points))
         return out
 
     def text(self):
@@ -148,6 +296,11 @@ class DistanceSet(HexSet):
         p = np.subtract(point, self.center)
         return all([p in H for H in self.halfspaces])
 
+    def contains_many(self, points):
+        points = np.asarray(points, dtype=int).reshape(-1, 2)
+        assert are_hex_coordinates_many(points).all(), 'hex coordinates are invalid'
+        return hex_distance(points, self.center) <= self.radius
+
 
 class Union(HexSet):
 
@@ -171,6 +324,13 @@ class Union(HexSet):
     def __contains__(self, point):
         return any([point in s for s in self.sets])
 
+    def contains_many(self, points):
+        points = np.asarray(points, dtype=int).reshape(-1, 2)
+        result = np.zeros(len(points), dtype=bool)
+        for s in self.sets:
+            result[~result] = s.contains_many(points[~result])
+        return result
+
 
 class Intersection(HexSet):
 
@@ -194,47 +354,289 @@ class Intersection(HexSet):
     def __contains__(self, point):
         return all([point in s for s in self.sets])
 
+    def contains_many(self, points):
+        points = np.asarray(points, dtype=int).reshape(-1, 2)
+        result = np.ones(len(points), dtype=bool)
+        for s in self.sets:
+            result[result] = s.contains_many(points[result])
+        return result
+
+
+def _merge_runs(runs):
+    """
+    Merges overlapping or adjacent runs.
+
+    :param runs: Array of shape `(k, 2)` with half-open runs `[start, stop)` of hex fields within the same row.
+    :return: Array of shape `(k', 2)` with disjoint, non-adjacent runs, sorted by their start.
+    """
+    runs = np.asarray(runs, dtype=int).reshape(-1, 2)
+    runs = runs[runs[:, 0] < runs[:, 1]]
+    if len(runs) == 0:
+        return runs
+    runs  = runs[np.argsort(runs[:, 0], kind='stable')]
+    stops = np.maximum.accumulate(runs[:, 1])
+    first = np.ones(len(runs), bool)
+    first[1:] = runs[1:, 0] > stops[:-1]
+    last = np.ones(len(runs), bool)
+    last[:-1] = first[1:]
+    return np.stack((runs[first, 0], stops[last]), axis=1)
+
+
+def _runs_cover(runs, xs):
+    """
+    Tests which of the positions `xs` are covered by the sorted, disjoint runs.
+    """
+    idx = np.searchsorted(runs[:, 0], xs, side='right') - 1
+    return (idx >= 0) & (xs < runs[idx.clip(0), 1])
+
+
+def _combine_runs(runs1, runs2, op):
+    """
+    Combines two sets of sorted, disjoint runs within the same row using a boolean operation.
+    """
+    bounds = np.unique(np.concatenate((runs1.ravel(), runs2.ravel())))
+    starts, stops = bounds[:-1], bounds[1:]
+    keep = op(_runs_cover(runs1, starts), _runs_cover(runs2, starts))
+    return _merge_runs(np.stack((starts[keep], stops[keep]), axis=1))
+
 
-def graph_matrix(hexset):
+class RunLengthSet(HexSet):
+    """
+    Materialized set of hex fields, represented by sorted runs of hex fields per row.
+
+    Each row `y` is mapped to an array of shape `(k, 2)`, where each row is a half-open run `[start, stop)` of the hex fields `start, start + 2, ..., stop - 2`.
+    The runs of a row are disjoint, non-adjacent, and sorted.
+    Set operations are performed in time proportional to the number of runs.
+    """
+
+    def __init__(self, rows=None):
+        self.rows = {y: runs for y, runs in (rows or dict()).items() if len(runs) > 0}
+
+    @staticmethod
+    def from_points(points):
+        """
+        Creates the set from an array of shape `(n, 2)` with hex coordinates.
+        """
+        points = np.asarray(points, dtype=int).reshape(-1, 2)
+        assert are_hex_coordinates_many(points).all(), 'hex coordinates are invalid'
+        rows = dict()
+        for y in np.unique(points[:, 1]):
+            xs = points[points[:, 1] == y, 0]
+            rows[int(y)] = _merge_runs(np.stack((xs, xs + 2), axis=1))
+        return RunLengthSet(rows)
+
+    @staticmethod
+    def from_hexset(hexset):
+        """
+        Converts any hex set into a run-length representation.
+
+        Distance sets, unions, and intersections are converted without enumerating the hex fields.
+        """
+        if isinstance(hexset, RunLengthSet):
+            return hexset
+        elif isinstance(hexset, DistanceSet):
+            rows = dict()
+            cx, cy = hexset.center
+            for dy in range(-hexset.radius, hexset.radius + 1):
+                half_width = 2 * hexset.radius - abs(dy)
+                rows[int(cy + dy)] = np.array([(cx - half_width, cx + half_width + 2)], dtype=int)
+            return RunLengthSet(rows)
+        elif isinstance(hexset, Union):
+            return RunLengthSet().union(*hexset.sets)
+        elif isinstance(hexset, Intersection) and len(hexset.sets) > 0:
+            return RunLengthSet.from_hexset(hexset.sets[0]).intersection(*hexset.sets[1:])
+        else:
+            return RunLengthSet.from_points(hexset.explicit())
+
+    @property
+    def num_runs(self):
+        return sum(len(runs) for runs in self.rows.values())
+
+    def __len__(self):
+        return sum(int(np.sum(runs[:, 1] - runs[:, 0])) // 2 for runs in self.rows.values())
+
+    def __iter__(self):
+        return iter(self.explicit())
+
+    def union(self, *others):
+        """
+        Returns the union with other hex sets.
+        """
+        others = [RunLengthSet.from_hexset(other) for other in others]
+        rows = dict()
+        for s in [self] + others:
+            for y, runs in s.rows.items():
+                rows.setdefault(y, list()).append(runs)
+        return RunLengthSet({y: _merge_runs(np.concatenate(runs)) for y, runs in rows.items()})
+
+    def intersection(self, *others):
+        """
+        Returns the intersection with other hex sets.
+        """
+        result = self
+        for other in others:
+            other = RunLengthSet.from_hexset(other)
+            result = RunLengthSet({
+                y: _combine_runs(runs, other.rows[y], np.logical_and)
+                for y, runs in result.rows.items() if y in other.rows
+            })
+        return result
+
+    def difference(self, *others):
+        """
+        Returns the difference to other hex sets.
+        """
+        result = self
+        for other in others:
+            other = RunLengthSet.from_hexset(other)
+            result = RunLengthSet({
+                y: _combine_runs(runs, other.rows[y], lambda in1, in2: in1 & ~in2) if y in other.rows else runs
+                for y, runs in result.rows.items()
+            })
+        return result
+
+    def bbox(self):
+        if len(self.rows) == 0:
+            return np.inf, -np.inf, np.inf, -np.inf
+        x_min = min(int(runs[ 0, 0])     for runs in self.rows.values())
+        x_max = max(int(runs[-1, 1]) - 2 for runs in self.rows.values())
+        return x_min, x_max, min(self.rows.keys()), max(self.rows.keys())
+
+    @functools.cached_property
+    def _flat_runs(self):
+        """
+        All runs of all rows, sorted by the row and the start, as a tuple `keys, ys, stops`.
+        """
+        ys = sorted(self.rows.keys())
+        runs = np.concatenate([self.rows[y] for y in ys]).reshape(-1, 2)
+        run_ys = np.repeat(np.asarray(ys, dtype=int), [len(self.rows[y]) for y in ys])
+        keys = _hash_hex_coordinates(np.stack((run_ys, runs[:, 0]), axis=1))
+        return keys, run_ys, runs[:, 1]
+
+    def __contains__(self, point):
+        check_hex_coordinates(point)
+        return bool(self.contains_many(point)[0])
+
+    def contains_many(self, points):
+        points = np.asarray(points, dtype=int).reshape(-1, 2)
+        assert are_hex_coordinates_many(points).all(), 'hex coordinates are invalid'
+        if len(self.rows) == 0:
+            return np.zeros(len(points), bool)
+        keys, run_ys, stops = self._flat_runs
+        idx = np.searchsorted(keys, _hash_hex_coordinates(points[:, ::-1]), side='right') - 1
+        valid = idx >= 0
+        idx = idx.clip(0)
+        return valid & (run_ys[idx] == points[:, 1]) & (points[:, 0] < stops[idx])
+
+    def explicit(self):
+        if not hasattr(self, '_explicit'):
+            if len(self.rows) == 0:
+                self._explicit = list()
+            else:
+                _, run_ys, stops = self._flat_runs
+                starts = np.concatenate([self.rows[y][:, 0] for y in sorted(self.rows.keys())])
+                counts = (stops - starts) // 2
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                xs = np.repeat(starts, counts) + 2 * offsets
+                ys = np.repeat(run_ys, counts)
+                order = np.lexsort((ys, xs))
+                self._explicit = list(np.stack((xs[order], ys[order]), axis=1))
+        return self._explicit
+
+
+def _hash_hex_coordinates(points):
+    """
+    Maps each of the hex coordinates to a unique integer key.
+    """
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    return points[:, 0] * (1 << 32) + points[:, 1]
+
+
+def neighbor_pairs(points, offsets=HEX_NEIGHBORS):
+    """
+    Finds all pairs of hex fields which are neighbors of each other.
+
+    The coordinates are hashed and the neighbor offsets are probed directly, so the complexity is `O(n log n)`.
+
+    :param points: Array of shape `(n, 2)` with unique hex coordinates.
+    :param offsets: The neighbor offsets to probe (the six adjacent hex fields by default).
+    :return: Tuple `i, j` of index arrays so that `points[j] - points[i]` is one of the offsets.
+    """
+    points = np.asarray(points, dtype=int).reshape(-1, 2)
+    if len(points) == 0:
+        return np.zeros(0, int), np.zeros(0, int)
+    keys  = _hash_hex_coordinates(points)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    I, J = list(), list()
+    for offset in offsets:
+        probes = _hash_hex_coordinates(points + offset)
+        pos = np.searchsorted(sorted_keys, probes).clip(0, len(keys) - 1)
+        found = np.nonzero(sorted_keys[pos] == probes)[0]
+        I.append(found)
+        J.append(order[pos[found]])
+    return np.concatenate(I), np.concatenate(J)
+
+
+def graph_matrix(hexset, dense=False):
     """
     Computes the adjacency graph matrix corresponding to the set of hex fields.
 
-    :return: Tuple `G`, hex_list` where `G` is the matrix and `hex_list` is the list of nodes corresponding to the rows and columns of the matrix.
+    The rows and columns of the matrix correspond to the nodes in the order of `hexset.explicit()`.
+
+    :param dense: Return a dense numpy array instead of a sparse matrix (requires `O(n²)` memory).
+    :return: The adjacency matrix `G` as a `scipy.sparse.csr_matrix` (or numpy array, if `dense` is `True`).
     """
-    hex_list = hexset.explicit()
-    I = {tuple(v): vidx for vidx, v in enumerate(hex_list)}
+    hex_list = np.asarray(hexset.explicit(), dtype=int).reshape(-1, 2)
     n = len(hex_list)
-    G = np.zeros((n, n), int)
+    I, J = neighbor_pairs(hex_list)
+    G = scipy.sparse.csr_matrix((np.ones(len(I), int), (I, J)), shape = (n, n))
+    return G.toarray() if dense else G
 
-    for i in range(n):
-        u = hex_list[i]
-        for v in Intersection([hexset, DistanceSet(u, 1)]).explicit():
-            j = I[tuple(v)]
-            if j <= i: continue
-            G[i,j] = 1
 
-    G = G + G.T
-    return G
+class Clustering:
+    """
+    Density-based clustering of a set of hex fields.
 
+    A hex field is a *core* field if at least `min_samples` hex fields of the set lie within its neighborhood (including itself).
+    Neighboring core fields belong to the same cluster, and each remaining hex field is assigned to the first cluster with a core field in its neighborhood (or labeled -1 if there is none).
+    Clusters are numbered in the order of their first core field in `hexset.explicit()`.
 
-class Clustering:
+    If `dbscan_compatible` is `True`, then the neighborhood comprises all hex fields within a Euclidean distance of 2, so that the labels are identical to those of `sklearn.cluster.DBSCAN(eps=2, min_samples=min_samples)`.
+    Otherwise, the neighborhood comprises the adjacent hex fields, so that `min_samples=1` yields the connected components.
+    """
 
-    def __init__(self, hexset):
+    def __init__(self, hexset, min_samples=7, dbscan_compatible=True):
         self.hexset = hexset
-        clustering = DBSCAN(eps = 2, min_samples = 7).fit(self.hexset.explicit())
-        self.labels = clustering.labels_
+        points = np.asarray(self.hexset.explicit(), dtype=int).reshape(-1, 2)
+        n = len(points)
+        I, J = neighbor_pairs(points, DBSCAN_NEIGHBORS if dbscan_compatible else HEX_NEIGHBORS)
+        is_core = np.bincount(I, minlength = n) + 1 >= min_samples
+
+        # Label the connected components of the core fields (in the order of their first core field)
+        core_edges = is_core[I] & is_core[J]
+        G = scipy.sparse.csr_matrix((np.ones(core_edges.sum(), int), (I[core_edges], J[core_edges])), shape = (n, n))
+        _, components = scipy.sparse.csgraph.connected_components(G, directed = False)
+        core_components = components[is_core]
+        unique_components, first_idx = np.unique(core_components, return_index = True)
+        component_labels = np.empty(components.max(initial = 0) + 1, int)
+        component_labels[unique_components[np.argsort(first_idx)]] = np.arange(len(unique_components))
+        self.labels = np.full(n, -1, int)
+        self.labels[is_core] = component_labels[core_components]
+
+        # Assign the remaining fields to the first cluster of a neighboring core field
+        border_edges = ~is_core[I] & is_core[J]
+        border_labels = np.full(n, n, int)
+        np.minimum.at(border_labels, I[border_edges], self.labels[J[border_edges]])
+        is_border = ~is_core & (border_labels < n)
+        self.labels[is_border] = border_labels[is_border]
 
     def toarray(self):
         """
         Obtains a label map.
         """
-        array  = self.hexset.toarray()
-        result = np.full(array.shape, -1, int)
-        for p in np.ndindex(array.shape):
-            idx = array[p]
-            if idx >= 0:
-                result[p] = self.labels[idx]
-        return result
+        array = self.hexset.toarray()
+        return np.where(array >= 0, self.labels[array], -1)
 
     def text(self):
         """
@@ -0,0 +1,358 @@
+"""
+Implements an append-only journal of the changes of the state of the worlds, and periodic snapshots of the worlds.
+
+The changes made within a tick (or within a request, see `backend.middleware.world`) are collected and written as a single compressed batch (see `JournalEntry`).
+Changes are collected by the signals emitted when objects are saved or deleted, and code which bypasses the signals (e.g., `bulk_create` or `QuerySet.update`) must call `record_saved` or `record_deleted`.
+Changes made outside of ticks and requests (e.g., in the shell) are not journaled, so a snapshot should be taken afterwards.
+
+A world is restored from the latest snapshot and the tail of the journal (see `restore`), and ranges of ticks can be replayed for profiling (see `replay`).
+"""
+
+import contextlib
+import contextvars
+import json
+import time
+import zlib
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import profiling
+
+
+# Models which make up the state of a world, in the order of their dependencies, along with the lookup of their world
+MODELS = (
+    ('world.Sector'       , 'world'),
+    ('game.Empire'        , 'world'),
+    ('game.Blueprint'     , 'empire__world'),
+    ('world.Celestial'    , 'sector__world'),
+    ('world.Movable'      , 'world'),
+    ('game.Construction'  , 'celestial__sector__world'),
+    ('game.Ship'          , 'movable__world'),
+    ('processes.Process'  , 'world'),
+    ('world.Unveiled'     , 'by_whom__world'),
+    ('world.TerritoryCell', 'owner__world'),
+)
+
+# Models whose changes are collected by signals (the others are frequently created and deleted in bulk, which is recorded explicitly)
+SIGNAL_MODELS = ('world.Sector', 'game.Empire', 'game.Blueprint', 'world.Celestial', 'world.Movable', 'game.Construction', 'game.Ship', 'processes.Process')
+
+# Batch of the changes which are currently collected (or `None`), separately per thread (e.g., concurrent requests)
+_current = contextvars.ContextVar('journal_batch', default = None)
+
+# Tick of the latest snapshot by world id (cached, see `maybe_take_snapshot`)
+_snapshot_ticks = dict()
+
+
+def _encode(data):
+    return zlib.compress(json.dumps(data, separators = (',', ':'), default = lambda value: value.item()).encode())
+
+
+def _decode(data):
+    return json.loads(zlib.decompress(data))
+
+
+def _columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+class Batch:
+    """
+    Changes of the state of a world, as a list of operations.
+
+    Consecutive operations of the same kind on the same model are merged:
+    - `['save', label, columns, rows]` creates or replaces the rows (rows without primary keys are only created, if they do not conflict),
+    - `['delete', label, lookups]` deletes the objects which match the lookups.
+    """
+
+    def __init__(self, world, kind):
+        self.world = world
+        self.kind  = kind
+        self.operations = list()
+
+    def save(self, model, objects):
+        label, columns = model._meta.label, _columns(model)
+        rows = [[getattr(obj, column) for column in columns] for obj in objects]
+        if len(rows) == 0:
+            return
+        if len(self.operations) > 0 and self.operations[-1][:3] == ['save', label, columns]:
+            self.operations[-1][3].extend(rows)
+        else:
+            self.operations.append(['save', label, columns, rows])
+
+    def delete(self, model, **lookups):
+        label = model._meta.label
+        previous = self.operations[-1] if len(self.operations) > 0 else None
+        if previous is not None and list(lookups.keys()) == ['id__in'] and previous[:2] == ['delete', label] and list(previous[2].keys()) == ['id__in']:
+            previous[2]['id__in'].extend(lookups['id__in'])
+        else:
+            self.operations.append(['delete', label, lookups])
+
+    def write(self):
+        """
+        Appends the batch to the journal (nothing is written if there are no changes).
+        """
+        from world.models import JournalEntry
+        if len(self.operations) > 0:
+            JournalEntry.objects.create(world_id = self.world.id, tick = self.world.now, kind = self.kind, data = _encode(self.operations))
+
+
+@contextlib.contextmanager
+def recording(world, kind):
+    """
+    Collects the changes of the state of a world, which are appended to the journal afterwards as a single batch.
+
+    :param kind: Either `tick` (changes made by processing ticks) or `action` (changes made by players).
+    """
+    batch = Batch(world, kind)
+    token = _current.set(batch)
+    try:
+        yield batch
+    finally:
+        _current.reset(token)
+    if settings.JOURNAL:
+        batch.write()
+
+
+@contextlib.contextmanager
+def paused():
+    """
+    Suspends the collection of changes (e.g., while restoring a world).
+    """
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def record_saved(model, objects):
+    """
+    Records created or modified objects (required for modifications which bypass the signals).
+    """
+    batch = _current.get()
+    if batch is not None:
+        batch.save(model, objects)
+
+
+def record_deleted(model, **lookups):
+    """
+    Records deleted objects by lookups, e.g. `id__in = [...]` (required for deletions which bypass the signals).
+    """
+    batch = _current.get()
+    if batch is not None:
+        batch.delete(model, **lookups)
+
+
+def take_snapshot(world):
+    """
+    Stores a compressed snapshot of the state of a world, and discards the snapshots and journal entries which are no longer needed (only `settings.JOURNAL_SNAPSHOTS` snapshots are kept).
+    """
+    from world.models import JournalEntry, WorldSnapshot
+    data = dict()
+    for label, world_lookup in MODELS:
+        model = apps.get_model(label)
+        columns = _columns(model)
+        data[label] = [columns, [list(row) for row in model.objects.filter(**{world_lookup: world.id}).order_by('pk').values_list(*columns)]]
+    last_entry_id = JournalEntry.objects.filter(world_id = world.id).order_by('-id').values_list('id', flat = True).first() or 0
+    snapshot = WorldSnapshot.objects.create(world_id = world.id, tick = world.now, last_entry_id = last_entry_id, timestamp = time.time(), data = _encode(data))
+    _snapshot_ticks[world.id] = world.now
+
+    # Discard the oldest snapshots, and the journal entries preceding the oldest remaining snapshot
+    snapshots = WorldSnapshot.objects.filter(world_id = world.id).order_by('-id')
+    oldest = snapshots[settings.JOURNAL_SNAPSHOTS - 1:settings.JOURNAL_SNAPSHOTS].first()
+    if oldest is not None:
+        snapshots.filter(id__lt = oldest.id).delete()
+        JournalEntry.objects.filter(world_id = world.id, id__lte = oldest.last_entry_id).delete()
+    return snapshot
+
+
+def maybe_take_snapshot(world):
+    """
+    Takes a snapshot of a world if `settings.JOURNAL_SNAPSHOT_INTERVAL` ticks passed since the latest one.
+    """
+    from world.models import WorldSnapshot
+    if not settings.JOURNAL or settings.JOURNAL_SNAPSHOT_INTERVAL == 0:
+        return
+    if world.id not in _snapshot_ticks:
+        _snapshot_ticks[world.id] = WorldSnapshot.objects.filter(world_id = world.id).order_by('-tick').values_list('tick', flat = True).first() or 0
+    if world.now >= _snapshot_ticks[world.id] + settings.JOURNAL_SNAPSHOT_INTERVAL:
+        take_snapshot(world)
+
+
+class Changes:
+    """
+    Coalesces the operations of consecutive journal entries, so that each row is written only once (see `restore`).
+
+    Saved and deleted rows are collected by their primary keys, while deletions by other lookups require the collected changes to be applied first.
+    """
+
+    def __init__(self):
+        self.saved   = dict()  ## label -> (columns, primary key -> row)
+        self.created = dict()  ## label -> (columns, rows without primary keys)
+        self.deleted = dict()  ## label -> primary keys
+
+    def add(self, operations):
+        for operation in operations:
+            model = apps.get_model(operation[1])
+            label = model._meta.label
+            if operation[0] == 'save':
+                columns, rows = operation[2:]
+                pk_idx = columns.index(model._meta.pk.attname) if model._meta.pk.attname in columns else None
+                if pk_idx is None or any(row[pk_idx] is None for row in rows):
+                    self.created.setdefault(label, (columns, list()))[1].extend(rows)
+                    continue
+                saved = self._saved(label, columns)
+                for row in rows:
+                    saved[row[pk_idx]] = row
+            elif operation[0] == 'delete':
+                if list(operation[2].keys()) == ['id__in']:
+                    saved = self.saved.get(label, (None, dict()))[1]
+                    for pk in operation[2]['id__in']:
+                        saved.pop(pk, None)
+                    self.deleted.setdefault(label, set()).update(operation[2]['id__in'])
+                else:
+                    self.apply()
+                    model.objects.filter(**operation[2])._raw_delete(model.objects.db)
+            else:
+                raise ValueError(f'invalid journal operation: "{operation[0]}"')
+
+    def _saved(self, label, columns):
+        if label in self.saved and self.saved[label][0] != columns:
+            self.apply()
+        return self.saved.setdefault(label, (columns, dict()))[1]
+
+    def apply(self):
+        """
+        Writes the collected changes to the database (in the order of the dependencies of the models).
+        """
+        for label, _ in MODELS:
+            model = apps.get_model(label)
+            columns, saved = self.saved.get(label, (None, dict()))
+            pks = list(self.deleted.get(label, set()) | saved.keys())
+            for offset in range(0, len(pks), 500):
+                model.objects.filter(pk__in = pks[offset:offset + 500])._raw_delete(model.objects.db)
+            if len(saved) > 0:
+                model.objects.bulk_create([model(**dict(zip(columns, row))) for row in saved.values()], batch_size = 500)
+            if label in self.created:
+                columns, rows = self.created[label]
+                model.objects.bulk_create([model(**dict(zip(columns, row))) for row in rows], batch_size = 500, ignore_conflicts = True)
+        self.saved.clear()
+        self.created.clear()
+        self.deleted.clear()
+
+
+def _apply(operations):
+    changes = Changes()
+    changes.add(operations)
+    changes.apply()
+
+
+def _invalidate_caches(world):
+    from world import spatial
+    from processes import scheduler
+    spatial._indices.pop(world.id, None)
+    scheduler._schedulers.pop(world.id, None)
+
+
+@transaction.atomic
+def restore(world, tick = None, kinds = ('tick', 'action')):
+    """
+    Restores the state of a world from the latest snapshot and the tail of the journal (bypassing the signals).
+
+    The world is restored to the last journaled tick until `tick` (defaults to the latest one), which `world.now` is set to.
+    Ticks which were fast-forwarded at once (see `World.simulate`) are journaled at the last of those ticks.
+
+    :param kinds: The kinds of journal entries which are applied.
+    :return: The number of applied journal entries.
+    """
+    from world.models import JournalEntry, WorldSnapshot
+    snapshots = WorldSnapshot.objects.filter(world_id = world.id).order_by('-tick', '-id')
+    if tick is not None:
+        snapshots = snapshots.filter(tick__lte = tick)
+    snapshot = snapshots.first()
+    if snapshot is None:
+        raise ValueError(f'No snapshot of world {world.id} to restore tick {tick} from')
+
+    with paused():
+
+        # Discard the current state (in the reverse order of the dependencies), and load the snapshot
+        for label, world_lookup in reversed(MODELS):
+            model = apps.get_model(label)
+            model.objects.filter(**{world_lookup: world.id})._raw_delete(model.objects.db)
+        data = _decode(snapshot.data)
+        for label, _ in MODELS:
+            model = apps.get_model(label)
+            columns, rows = data[label]
+            model.objects.bulk_create([model(**dict(zip(columns, row))) for row in rows])
+
+        # Apply the tail of the journal
+        entries = JournalEntry.objects.filter(world_id = world.id, id__gt = snapshot.last_entry_id, kind__in = kinds).order_by('id')
+        if tick is not None:
+            entries = entries.filter(tick__lte = tick)
+        now, changes = snapshot.tick, Changes()
+        for entry in entries:
+            changes.add(_decode(entry.data))
+            now = max((now, entry.tick))
+        changes.apply()
+
+    world.now = now
+    world.last_tick_timestamp = round(time.time())
+    world.save()
+    _invalidate_caches(world)
+    return len(entries)
+
+
+class Rollback(Exception):
+    pass
+
+
+def replay(world, first_tick, last_tick):
+    """
+    Replays the ticks `first_tick` to `last_tick` of a world for profiling, without modifying the database.
+
+    The state before `first_tick` is restored, and then the ticks are processed again (the journaled actions of the players are applied after the ticks they were made in).
+
+    :return: The profiles of the ticks (see `profiling`).
+    """
+    from world.models import JournalEntry
+    actions = dict()
+    for tick, data in JournalEntry.objects.filter(world_id = world.id, kind = 'action', tick__gte = first_tick, tick__lt = last_tick).order_by('id').values_list('tick', 'data'):
+        actions.setdefault(tick, list()).append(data)
+
+    try:
+        with transaction.atomic(), profiling.collecting() as profiles:
+            restore(world, first_tick - 1)
+            while world.now < last_tick:
+                world.tick()
+                for data in actions.get(world.now, list()):
+                    _apply(_decode(data))
+            raise Rollback()
+    except Rollback:
+        pass
+    finally:
+        world.refresh_from_db()
+        _invalidate_caches(world)
+    return profiles
+
+
+@receiver(post_save, sender = 'world.World')
+def forget_snapshot_on_world_created(sender, instance, created, **kwargs):
+    if created:
+        _snapshot_ticks.pop(instance.id, None)
+
+
+def record_saved_by_signal(sender, instance, **kwargs):
+    record_saved(sender, [instance])
+
+
+def record_deleted_by_signal(sender, instance, **kwargs):
+    record_deleted(sender, id__in = [instance.pk])
+
+
+for label in SIGNAL_MODELS:
+    post_save  .connect(record_saved_by_signal  , sender = label, dispatch_uid = f'journal-save-{label}')
+    post_delete.connect(record_deleted_by_signal, sender = label, dispatch_uid = f'journal-delete-{label}')
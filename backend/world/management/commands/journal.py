@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from world import journal
+from world.models import World
+
+
+class Command(BaseCommand):
+    help = 'Takes a snapshot of a world, restores a world from the latest snapshot and the journal, or replays a range of ticks for profiling.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices = ['snapshot', 'restore', 'replay'])
+        parser.add_argument('--world', default = None, help = 'Name of the world (defaults to the default world).')
+        parser.add_argument('--tick' , type = int, default = None, help = 'Tick to restore (defaults to the latest journaled tick).')
+        parser.add_argument('--first', type = int, default = None, help = 'First tick to replay.')
+        parser.add_argument('--last' , type = int, default = None, help = 'Last tick to replay.')
+
+    def handle(self, *args, **options):
+        world = World.objects.get(name = options['world']) if options['world'] is not None else World.objects.order_by('id').first()
+
+        if options['action'] == 'snapshot':
+            snapshot = journal.take_snapshot(world)
+            self.stdout.write(f'Took snapshot of tick {snapshot.tick} ({len(snapshot.data) / 1024:.1f} KiB)')
+
+        elif options['action'] == 'restore':
+            try:
+                num_entries = journal.restore(world, options['tick'])
+            except ValueError as error:
+                raise CommandError(error)
+            self.stdout.write(f'Restored tick {world.now} ({num_entries} journal entries applied)')
+
+        else:
+            if options['first'] is None or options['last'] is None:
+                raise CommandError('Replaying requires --first and --last')
+            profiles = journal.replay(world, options['first'], options['last'])
+            for profile in profiles:
+                self.stdout.write(f'Ticks {profile["first_tick"]}-{profile["last_tick"]}: {profile["wall_seconds"]:.3f} seconds, {profile["queries"]} queries')
+            self.stdout.write(f'Replayed {len(profiles)} tick(s) in {sum(profile["wall_seconds"] for profile in profiles):.3f} seconds')
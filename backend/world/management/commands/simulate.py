@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from world.models import World
+
+
+class Command(BaseCommand):
+    help = 'Advances the world by a number of ticks immediately (e.g., to simulate a week of play for balancing).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ticks', type = int, required = True, help = 'Number of ticks to advance the world by.')
+        parser.add_argument('--world', default = None, help = 'Name of the world (defaults to the default world).')
+
+    def handle(self, *args, **options):
+        world = World.objects.get(name = options['world']) if options['world'] is not None else World.objects.order_by('id').first()
+        t0 = time.perf_counter()
+        if not world.simulate(options['ticks']):
+            raise CommandError('The ticks of the world are being processed by another process')
+        seconds = time.perf_counter() - t0
+        self.stdout.write(f'Simulated {options["ticks"]} tick(s) up to tick {world.now} in {seconds:.3f} seconds ({options["ticks"] / max((seconds, 1e-6)):.1f} ticks per second)')
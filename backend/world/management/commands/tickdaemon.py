@@ -0,0 +1,31 @@
+import logging
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from world.daemon import TickDaemon
+
+
+class Command(BaseCommand):
+    help = 'Runs the tick daemon, which processes the ticks of the worlds on schedule.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-sleep', type = float, default = 60, help = 'Maximum number of seconds between checks of the world (e.g., to pick up tickrate changes).')
+        parser.add_argument('--workers', type = int, default = 0, help = 'Number of worker processes which process the worlds in parallel (0 to process them one after another).')
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level = logging.INFO, format = '%(asctime)s %(name)s %(levelname)s %(message)s')
+        daemon = TickDaemon(max_sleep_seconds = options['max_sleep'], workers = options['workers'])
+        if not daemon.acquire_leadership():
+            raise CommandError(f'Another tick daemon is running (lock held on {daemon.lockfile})')
+
+        # Stop gracefully after the current tick
+        signal.signal(signal.SIGINT , daemon.stop)
+        signal.signal(signal.SIGTERM, daemon.stop)
+
+        self.stdout.write(f'Tick daemon started (lock: {daemon.lockfile})')
+        try:
+            daemon.run()
+        finally:
+            daemon.release_leadership()
+        self.stdout.write('Tick daemon stopped')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from world.models import Sector, Celestial
+
+
+class Command(BaseCommand):
+    help = 'Re-computes the accumulated features of all sectors and the occupied capacities of all celestials (e.g., after migrating an existing database).'
+
+    @transaction.atomic()
+    def handle(self, *args, **options):
+        sectors = Sector.objects.all()
+        for sector in sectors:
+            sector.update_features()
+        celestials = Celestial.objects.all()
+        for celestial in celestials:
+            celestial.update_occupied_capacity()
+        self.stdout.write(f'Updated {len(sectors)} sector(s) and {len(celestials)} celestial(s)')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from world.models import Movable
+
+
+class Command(BaseCommand):
+    help = 'Re-computes the owners and speeds of the ships of all movables (e.g., after migrating an existing database).'
+
+    @transaction.atomic()
+    def handle(self, *args, **options):
+        movables = Movable.objects.all()
+        for movable in movables:
+            movable.update_ships()
+        self.stdout.write(f'Updated {len(movables)} movable(s)')
@@ -1,43 +1,81 @@
+import copy
+import math
 import time
-import multiprocessing
 
+from django.conf import settings
 from django.db import models, transaction
 from django.db.models import CheckConstraint, Q
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 import numpy as np
 
+from . import cache
 from . import hexgrid
 from . import git
+from . import spatial
+from . import profiling
+from . import journal
 
 
-# Lock used to synchronize `world.do_pending_ticks` within a single process (transactions should prevent race conditions across processes)
-_world_lock = multiprocessing.Lock()
+# Maximum number of runs of hex fields per query for the hex fields which are already unveiled (to stay below the limits of the query parameters)
+UNVEIL_QUERY_RUNS = 250
+
+
+def default_world():
+    """
+    Returns the id of the default world (the oldest one), which objects are assigned to unless specified otherwise (or `None`).
+    """
+    return World.objects.order_by('id').values_list('id', flat = True).first()
 
 
 class World(models.Model):
+    """
+    An independent game instance, which is addressed by its name (URL prefix) or host (see `backend.middleware.world`).
+    """
 
-    now = models.PositiveBigIntegerField(default = 0)
+    name = models.SlugField(max_length = 50, unique = True, default = 'default')
+    host = models.CharField(max_length = 200, unique = True, null = True, default = None)
+    now  = models.PositiveBigIntegerField(default = 0)
     last_tick_timestamp = models.PositiveBigIntegerField(null = True)
     tickrate = models.FloatField(default = 0)
     version  = models.JSONField(null = True)
 
-    class Meta:
-        constraints = [
-            models.CheckConstraint(
-                name = 'world_singleton',
-                check = models.Q(id = 1),
-            ),
-        ]
+    # Timestamp when the lease for processing the ticks expires (or `None`, if the lease is not held)
+    tick_lease_expires = models.FloatField(null = True, default = None)
+
+    # Incremented whenever the world is saved, so that cached worlds can be validated cheaply (see `world.cache`)
+    revision = models.PositiveBigIntegerField(default = 0)
+
+    # Incremented whenever the territory of an empire changes, so that derived data can be cached (see `game.models.Empire.pathfinder`)
+    territory_revision = models.PositiveBigIntegerField(default = 0)
+
+    def __str__(self):
+        return self.name
 
     def tick(self):
+        with profiling.profile_ticks(self.now + 1, world_id = self.id), journal.recording(self, 'tick'):
+            self._tick()
+        journal.maybe_take_snapshot(self)
+
+    def _tick(self):
+        from processes.models import Process
+        from processes.scheduler import get_scheduler
+        scheduler = get_scheduler(self.id, self.now)
+
         self.now += 1
         self.last_tick_timestamp = round(time.time())
         self.save()
 
-        from processes.models import Process
-        for process in [process for process in Process.objects.filter(end_tick = self.now)]:
-            process.handler.finish(process)
+        # Finish the due processes in batches, grouped by their handlers (in the order of their first occurrence)
+        # The scheduler determines the due processes, but the database has the final say (e.g., if a process was cancelled by another process)
+        process_ids = scheduler.pop_due(self.now)
+        if len(process_ids) == 0:
+            return
+        batches = dict()
+        for process in Process.objects.filter(id__in = process_ids, world = self, end_tick = self.now).order_by('id'):
+            batches.setdefault(process.handler_id, list()).append(process)
+        for processes in batches.values():
+            processes[0].handler.finish_many(processes)
 
     @property
     def seconds_between_ticks(self):
@@ -49,18 +87,119 @@ class World(models.Model):
 
     @property
     def pending_ticks(self):
+        if self.tickrate == 0:
+            return 0
         pending_ticks = self.seconds_passed_since_last_tick // self.seconds_between_ticks
         assert isinstance(pending_ticks, int)
         return pending_ticks
 
-    @transaction.atomic()
+    @property
+    def overdue_seconds(self):
+        """
+        The number of seconds passed since the next tick was due (or 0, if no tick is due).
+        """
+        if self.pending_ticks == 0:
+            return 0
+        return self.seconds_passed_since_last_tick - self.seconds_between_ticks
+
     def do_pending_ticks(self):
-        _world_lock.acquire()
+        """
+        Processes the pending ticks, unless another process is already doing so (then the world is refreshed from the database instead).
+
+        :return: `True` if the ticks were processed by this process.
+        """
+        if self.pending_ticks == 0:
+            return False
+        return self._simulate_leased(None)
+
+    def simulate(self, ticks):
+        """
+        Advances the world by `ticks` ticks, with the same outcome as calling `tick` repeatedly (but much faster).
+
+        :return: `True` if the world was advanced, or `False` if another process is processing the ticks.
+        """
+        assert ticks >= 0
+        return self._simulate_leased(ticks)
+
+    def acquire_tick_lease(self):
+        """
+        Tries to acquire the lease for processing the ticks (compare-and-set on `now` and `last_tick_timestamp`, so that exactly one process advances the world).
+
+        Fails if another process holds the lease, or if the world was advanced since it was loaded (then the world is refreshed from the database).
+
+        :return: `True` if the lease was acquired.
+        """
+        lease = time.time() + settings.TICK_LEASE_SECONDS
+        worlds = World.objects.filter(
+            Q(tick_lease_expires__isnull = True) | Q(tick_lease_expires__lt = time.time()),
+            id  = self.id,
+            now = self.now,
+            last_tick_timestamp = self.last_tick_timestamp)
+
+        # Check before writing, so that other processes return immediately instead of waiting for the database lock of the lease holder
+        if worlds.exists() and worlds.update(tick_lease_expires = lease) == 1:
+            self.tick_lease_expires = lease
+            return True
+        self.refresh_from_db()
+        return False
+
+    def release_tick_lease(self):
+        World.objects.filter(id = self.id, tick_lease_expires = self.tick_lease_expires).update(tick_lease_expires = None)
+        self.tick_lease_expires = None
+
+    def _simulate_leased(self, ticks):
+        """
+        Advances the world by `ticks` ticks (or the pending ticks, if `None`) while holding the tick lease.
+        """
+        if not self.acquire_tick_lease():
+            return False
         try:
-            for _ in range(self.pending_ticks):
-                self.tick()
+            with transaction.atomic():
+
+                # Verify the lease within the transaction (this also acquires the database lock first), in case it expired and the world was advanced meanwhile
+                leased = World.objects.filter(id = self.id, now = self.now, tick_lease_expires = self.tick_lease_expires).update(tick_lease_expires = self.tick_lease_expires) == 1
+                if leased:
+                    self._simulate(self.pending_ticks if ticks is None else ticks)
         finally:
-            _world_lock.release()
+            self.release_tick_lease()
+        if not leased:
+            self.refresh_from_db()
+        return leased
+
+    def _simulate(self, ticks):
+        from processes.models import Process, MovementHandler
+        from processes.scheduler import get_scheduler
+        processes = Process.objects.filter(world = self)
+        movements = processes.filter(handler_id = MovementHandler.__qualname__)
+        target = self.now + ticks
+        while self.now < target:
+
+            # Determine the next tick when a process other than a movement finishes (movements are independent of each other otherwise)
+            next_tick = processes.exclude(handler_id = MovementHandler.__qualname__).filter(end_tick__gt = self.now, end_tick__lte = target).aggregate(models.Min('end_tick'))['end_tick__min']
+            until = target if next_tick is None else next_tick - 1
+
+            # Advance the movements in memory until then, and do that tick regularly
+            if until > self.now:
+                with profiling.profile_ticks(self.now + 1, until, world_id = self.id), journal.recording(self, 'tick'):
+                    due_movements = list(movements.filter(end_tick__gt = self.now, end_tick__lte = until).order_by('id'))
+                    if len(due_movements) > 0:
+                        MovementHandler().advance_many(due_movements, until)
+                    get_scheduler(self.id, self.now).pop_due(until)
+                    self.now = until
+            if next_tick is not None:
+                self.tick()
+
+        self.last_tick_timestamp = round(time.time())
+        self.save()
+        journal.maybe_take_snapshot(self)
+
+    @property
+    def next_event_tick(self):
+        """
+        The next tick when a process finishes (or `None`).
+        """
+        from processes.scheduler import get_scheduler
+        return get_scheduler(self.id, self.now).next_event_tick()
 
     @property
     def remaining_seconds(self):
@@ -70,7 +209,17 @@ class World(models.Model):
         assert self.seconds_between_ticks > 1
 
         is_newly_created = (self.now < 1)
-        super(World, self).save(*args, **kwargs)
+
+        # The revisions are incremented in the database, so that stale instances can neither overwrite nor re-use them
+        if self._state.adding:
+            self.revision += 1
+            super(World, self).save(*args, **kwargs)
+        else:
+            if 'update_fields' not in kwargs:
+                kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'territory_revision']
+            self.revision = models.F('revision') + 1
+            super(World, self).save(*args, **kwargs)
+            self.refresh_from_db(fields = ['revision'])
 
         # If the world is newly created, then do an initial tick to initialize the fields
         if is_newly_created:
@@ -101,12 +250,29 @@ class Positionable(models.Model):
 
 
 class Movable(Positionable):
+    """
+    A group of ships.
 
+    A moving movable follows the route planned at its departure (see `processes.models.MovementHandler`), with one move each `move_ticks` ticks.
+    Its current position is derived from the route (see `position_at`), while `position_x` and `position_y` keep the position of the departure until the movement stops.
+    """
+
+    world = models.ForeignKey('World', on_delete = models.CASCADE, related_name = 'movables', default = default_world)
     destination_x = models.IntegerField(null = True)
     destination_y = models.IntegerField(null = True)
 
     custom_speed = models.FloatField(null = True, default = None)
     name = models.CharField(max_length = 50, default = 'Unnamed');
+    avoid_foreign_territory = models.BooleanField(default = False)
+
+    # Denormalized from the ships (see `update_ships`)
+    owner      = models.ForeignKey('game.Empire', on_delete = models.SET_NULL, related_name = '+', null = True, default = None)
+    ship_speed = models.FloatField(null = True, default = None)  ## speed of the slowest ship
+
+    # Movement along the planned route (`None`, unless the movable is moving)
+    departure_tick = models.PositiveBigIntegerField(null = True, default = None)
+    move_ticks     = models.PositiveIntegerField(null = True, default = None)
+    route          = models.JSONField(null = True, default = None)  ## positions after each move
 
     class Meta:
         constraints = [
@@ -117,9 +283,12 @@ class Movable(Positionable):
 
     def set_position(self, position):
         """
-        Immediately changes the position of this object.
+        Immediately changes the position of this object (the planned route is discarded).
         """
         Positionable.set_position(self, position)
+        self.departure_tick = None
+        self.move_ticks = None
+        self.route = None
 
         if (self.position == self.destination).all():
             self.destination_x = None
@@ -128,28 +297,77 @@ class Movable(Positionable):
         self.save()
 
         # Unveil the neighborhood
-        if self.owner is not None:
+        if self.owner_id is not None:
             Unveiled.unveil(self.owner, self.position, 1)
 
-    def move_to(self, destination):
+    def move_to(self, destination, avoid_foreign_territory = False):
         hexgrid.check_hex_coordinates(destination)
+        from processes.models import MovementHandler
+        now = cache.get_world(self.world_id).now
+
+        # Stop at the current position first, if moving
+        MovementHandler.stop(self, now)
 
         self.destination_x = destination[0]
         self.destination_y = destination[1]
-        self.save()
+        self.avoid_foreign_territory = avoid_foreign_territory
+        return MovementHandler.create_process(now, self)
 
-        from processes.models import MovementHandler
-        return MovementHandler.create_process(World.objects.get().now, self)
+    @property
+    def is_moving(self):
+        return self.departure_tick is not None
+
+    def moves_at(self, tick):
+        """
+        The number of moves along the planned route which are completed at `tick`.
+        """
+        if not self.is_moving:
+            return 0
+        return min((max((0, (tick - self.departure_tick) // self.move_ticks)), len(self.route)))
+
+    def position_at(self, tick):
+        """
+        The position at `tick`, derived from the planned route (without queries).
+        """
+        moves = self.moves_at(tick)
+        if moves == 0:
+            return super().position
+        return np.asarray(self.route[moves - 1], dtype=int)
+
+    @property
+    def position(self):
+        """
+        The position at the current tick of the world.
+        """
+        if not self.is_moving:
+            return super().position
+        return self.position_at(cache.get_world(self.world_id).now)
 
     @property
     def speed(self):
         if self.custom_speed is None:
-            assert self.ship_set.count() > 0
-            slowest_ship = self.ship_set.order_by('blueprint__data__speed')[0]
-            return slowest_ship.blueprint.data['speed']
+            assert self.ship_speed is not None
+            return self.ship_speed
         else:
             return self.custom_speed
 
+    def update_ships(self):
+        """
+        Re-computes the owner and the speed of the slowest ship from the ships of this movable (e.g., after ships were added or removed).
+
+        If the speed of a moving movable changes, then its route is re-planned.
+        """
+        ships = list(self.ship_set.order_by('id').values_list('blueprint__empire', 'blueprint__data__speed'))
+        previous_speed  = self.ship_speed
+        self.owner_id   = ships[0][0] if len(ships) > 0 else None
+        self.ship_speed = min((speed for _, speed in ships)) if len(ships) > 0 else None
+        self.save(update_fields = ['owner', 'ship_speed'])
+
+        # The route of a moving movable is planned for its speed, so it must be re-planned if the speed changes
+        if self.is_moving and self.custom_speed is None and self.ship_speed is not None and self.ship_speed != previous_speed:
+            from processes.models import MovementHandler
+            MovementHandler.replan([self], cache.get_world(self.world_id).now)
+
     @property
     def destination(self):
         if self.destination_x is None or self.destination_y is None:
@@ -157,24 +375,67 @@ class Movable(Positionable):
         else:
             return np.asarray((self.destination_x, self.destination_y), dtype=int)
 
+    @property
+    def path(self):
+        """
+        The path of single steps towards the destination (routed around the territory of other empires, if requested and possible).
+        """
+        if self.avoid_foreign_territory and self.owner_id is not None:
+            path = self.owner.pathfinder.find_path(self.position, self.destination)
+            if path is not None:
+                return path
+        return hexgrid.get_path_towards(self.position, self.destination)
+
     @property
     def next_position(self):
-        return hexgrid.get_next_position_towards(self.position, self.destination, self.speed)
+        trajectory = self.trajectory
+        return self.position if len(trajectory) == 0 else trajectory[0].copy()
+
+    def passes_by(self, cells, tick):
+        """
+        Tells whether the remaining route at `tick` passes by any of the hex fields `cells`.
+
+        The single steps of the moves are not stored with the route, so the hex fields within `ceil(speed)` steps of the route are considered as passed by (this also includes detours along the border of a territory).
+        """
+        if not self.is_moving:
+            return False
+        positions = [self.position_at(tick).tolist()] + self.route[self.moves_at(tick):]
+        return bool((hexgrid.pairwise_distances(positions, cells) <= math.ceil(self.speed)).any())
 
     @property
-    def trajectory(self):
-        return hexgrid.get_trajectory_towards(self.position, self.destination, self.speed)
+    def next_move_tick(self):
+        """
+        The tick of the next move (or `None`, if the movable is not moving).
+        """
+        if not self.is_moving:
+            return None
+        moves = self.moves_at(cache.get_world(self.world_id).now)
+        return None if moves == len(self.route) else self.departure_tick + (moves + 1) * self.move_ticks
 
     @property
-    def owner(self):
-        if self.ship_set.count() == 0: return None
-        return self.ship_set.all()[0].owner
+    def trajectory(self):
+        """
+        The positions after each of the remaining moves.
+        """
+        if self.is_moving:
+            return np.asarray(self.route[self.moves_at(cache.get_world(self.world_id).now):], dtype=int).reshape(-1, 2)
+        else:
+            return self.plan_trajectory()
+
+    def plan_trajectory(self):
+        """
+        Computes the positions after each move from the current position towards the destination.
+        """
+        if self.avoid_foreign_territory:
+            return hexgrid.get_trajectory_along(self.path, self.speed)
+        else:
+            return hexgrid.get_trajectory_towards(self.position, self.destination, self.speed)
 
     @property
     def process(self):
         from processes.models import Process
         try:
-            return Process.objects.get(data__movable_id = self.id)
+            return Process.objects.get(movable = self)
         except Process.DoesNotExist:
             return None
 
@@ -182,16 +443,51 @@ class Movable(Positionable):
     def delete_if_empty(sender, instance, **kwargs):
         if instance.movable.ship_set.count() == 0:
             instance.movable.delete()
+        else:
+            instance.movable.update_ships()
 
 
 class Sector(Positionable):
 
-    name = models.CharField(max_length = 50, unique = True)
+    # Accumulations of the numeric features of the celestials, which are stored with the sectors (see `update_features`)
+    ACCUMULATIONS = dict(sum = sum, min = min, max = max)
+
+    world = models.ForeignKey('World', on_delete = models.CASCADE, related_name = 'sectors', default = default_world)
+    name  = models.CharField(max_length = 50)
+
+    # Accumulated features of the celestials, e.g. `{"capacity": {"sum": 12, "min": 2, "max": 10}}`
+    features = models.JSONField(default = dict)
+
+    class Meta:
+        unique_together = ('world', 'name')
 
     def feature(self, feature_name, accumulation='sum'):
-        values = [c.features[feature_name] for c in self.celestial_set.all() if feature_name in c.features]
-        acc_func = eval(accumulation)
-        return acc_func(values)
+        assert accumulation in Sector.ACCUMULATIONS, accumulation
+        if feature_name in self.features:
+            return self.features[feature_name][accumulation]
+        else:
+            return Sector.ACCUMULATIONS[accumulation](list())  ## e.g., `sum` of no values is 0, but `min` raises an error
+
+    @staticmethod
+    def accumulate_features(celestial_features):
+        """
+        Accumulates the numeric features of celestials.
+
+        :param celestial_features: The features of the celestials (dictionaries).
+        """
+        values = dict()
+        for features in celestial_features:
+            for feature_name, value in features.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values.setdefault(feature_name, list()).append(value)
+        return {feature_name: {accumulation: acc_func(values[feature_name]) for accumulation, acc_func in Sector.ACCUMULATIONS.items()} for feature_name in sorted(values.keys())}
+
+    def update_features(self):
+        """
+        Re-computes the accumulated features from the celestials of this sector (e.g., after celestials were added or removed).
+        """
+        self.features = Sector.accumulate_features(self.celestial_set.values_list('features', flat = True))
+        self.save(update_fields = ['features'])
 
     def __str__(self):
         return f'{self.name} (x={self.position_x} y={self.position_y}, capacity: {self.feature("capacity")})'
@@ -199,7 +495,7 @@ class Sector(Positionable):
     @property
     def process(self):
         from processes.models import Process
-        processes = Process.objects.filter(data__celestial_id__in = self.celestial_set.values_list('id', flat=True))
+        processes = Process.objects.filter(celestial__sector = self)
         if processes.count() == 1:
             return processes[0]
         else:
@@ -213,18 +509,82 @@ class Celestial(models.Model):
     features = models.JSONField()
     habitated_by = models.ForeignKey('game.Empire', on_delete = models.SET_NULL, related_name = 'habitat', null = True, default = None)
 
+    # Total size of the constructions (see `update_occupied_capacity`)
+    occupied_capacity = models.PositiveIntegerField(default = 0)
+
     @property
     def capacity(self):
         return self.features.get('capacity', 0)
 
     @property
     def remaining_capacity(self):
-        occupied_capacity = sum((c.blueprint.data.get('size') for c in self.construction_set.all()))
-        return self.capacity - occupied_capacity
+        return self.capacity - self.occupied_capacity
+
+    def update_occupied_capacity(self):
+        """
+        Re-computes the occupied capacity from the constructions on this celestial (e.g., after constructions were added or removed).
+        """
+        self.occupied_capacity = sum(self.construction_set.values_list('blueprint__data__size', flat = True))
+        self.save(update_fields = ['occupied_capacity'])
 
     def colonize(self, empire, movable):
         from processes.models import ColonizationHandler
-        return ColonizationHandler.create_process(World.objects.get().now, empire, self, movable)
+        return ColonizationHandler.create_process(cache.get_world(self.sector.world_id).now, empire, self, movable)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Celestial, cls).from_db(db, field_names, values)
+        instance._habitated_by_id_db = instance.__dict__.get('habitated_by_id')
+        instance._features_db = copy.deepcopy(instance.__dict__.get('features'))  ## copy, since the features might be modified in-place
+        return instance
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        super(Celestial, self).save(*args, **kwargs)
+
+        # If the features changed, then update the accumulated features of the sector
+        if getattr(self, '_features_db', None) != self.features:
+            self.sector.update_features()
+            self._features_db = copy.deepcopy(self.features)
+
+        # If the habitation changed, then update the territories of the involved empires
+        previous_habitated_by_id = getattr(self, '_habitated_by_id_db', None)
+        if previous_habitated_by_id != self.habitated_by_id:
+            from game.models import Empire
+            for empire in Empire.objects.filter(id__in = [previous_habitated_by_id, self.habitated_by_id]):
+                empire.update_territory()
+            self._habitated_by_id_db = self.habitated_by_id
+
+    @receiver(post_delete, sender = 'world.Celestial')
+    def update_territory_on_delete(sender, instance, **kwargs):
+        from game.models import Empire
+        if instance.habitated_by_id is not None:
+            for empire in Empire.objects.filter(id = instance.habitated_by_id):
+                empire.update_territory()
+
+        for sector in Sector.objects.filter(id = instance.sector_id):
+            sector.update_features()
+
+
+class TerritoryCell(Positionable):
+    """
+    Hex field within the territory of an empire (materialized from the sectors habitated by the empire).
+    """
+
+    owner = models.ForeignKey('game.Empire', on_delete = models.CASCADE, related_name = 'territory_cells')
+
+    class Meta:
+        unique_together = ('position_x', 'position_y', 'owner')
+
+    @staticmethod
+    def owners_at(position, world = None):
+        """
+        Returns the ids of the empires whose territory contains the hex field.
+
+        :param world: The world (or its id), or `None` for the default world.
+        """
+        cells = TerritoryCell.objects.filter(position_x = position[0], position_y = position[1], owner__world = world or default_world())
+        return frozenset(cells.values_list('owner', flat = True))
 
 
 class Unveiled(Positionable):
@@ -236,9 +596,91 @@ class Unveiled(Positionable):
 
     @staticmethod
     def unveil(empire, center, radius):
-        ds = hexgrid.DistanceSet(center, radius)
-        for c in ds.explicit():
-            Unveiled.objects.update_or_create(
-                position_x = c[0],
-                position_y = c[1],
-                by_whom = empire)
+        """
+        Unveils the hex fields within the distance `radius` to `center`.
+
+        Only the hex fields which were not unveiled by the empire yet are written (using a single bulk insert).
+
+        :param center: Hex coordinates, or an array of shape `(n, 2)` to unveil the neighborhoods of multiple centers at once.
+        :return: The number of newly unveiled hex fields.
+        """
+        centers = np.asarray(center, dtype=int).reshape(-1, 2)
+        region = hexgrid.RunLengthSet.from_hexset(hexgrid.Union([hexgrid.DistanceSet(c, radius) for c in centers]))
+        if len(region) == 0:
+            return 0
+
+        # Determine the hex fields which were not unveiled yet
+        region = region.difference(hexgrid.RunLengthSet.from_points(Unveiled.unveiled_within(region, by_whom = empire)))
+
+        if len(region) > 0:
+            unveiled = [Unveiled(position_x = c[0], position_y = c[1], by_whom = empire) for c in region.explicit()]
+            Unveiled.objects.bulk_create(unveiled, ignore_conflicts = True)
+            journal.record_saved(Unveiled, unveiled)
+        return len(region)
+
+    @staticmethod
+    def unveiled_within(region, **filters):
+        """
+        Returns the unveiled hex fields within a `RunLengthSet` (filtered by `filters`, e.g. `by_whom = empire`).
+
+        The runs of the region are queried (instead of its bounding box), in batches of `UNVEIL_QUERY_RUNS` runs per query.
+        """
+        runs = [(y, int(start), int(stop) - 2) for y, row in sorted(region.rows.items()) for start, stop in row]
+        unveiled = list()
+        for i in range(0, len(runs), UNVEIL_QUERY_RUNS):
+            query = Q()
+            for y, x_first, x_last in runs[i : i + UNVEIL_QUERY_RUNS]:
+                query |= Q(position_y = y, position_x__range = (x_first, x_last))
+            unveiled += Unveiled.objects.filter(query, **filters).values_list('position_x', 'position_y')
+        return unveiled
+
+
+class TickProfile(models.Model):
+    """
+    Profile of one or more consecutive ticks (see `profiling`).
+    """
+
+    world      = models.ForeignKey('World', on_delete = models.CASCADE, null = True)
+    first_tick = models.PositiveBigIntegerField()
+    last_tick  = models.PositiveBigIntegerField()
+    timestamp  = models.FloatField()
+    data       = models.JSONField()
+
+    @staticmethod
+    def store(data):
+        """
+        Stores a profile, keeping only the most recent `settings.TICK_PROFILE_SIZE` profiles of each world (like a ring buffer).
+        """
+        TickProfile.objects.create(world_id = data.get('world'), first_tick = data['first_tick'], last_tick = data['last_tick'], timestamp = time.time(), data = data)
+        profiles = TickProfile.objects.filter(world_id = data.get('world'))
+        oldest_id = profiles.order_by('-id').values_list('id', flat = True)[settings.TICK_PROFILE_SIZE - 1:settings.TICK_PROFILE_SIZE].first()
+        if oldest_id is not None:
+            profiles.filter(id__lt = oldest_id).delete()
+
+
+class JournalEntry(models.Model):
+    """
+    Batch of the changes of the state of a world, made within a tick or a request (see `journal`).
+    """
+
+    world = models.ForeignKey('World', on_delete = models.CASCADE)
+    tick  = models.PositiveBigIntegerField()
+    kind  = models.CharField(max_length = 10)  ## `tick` or `action`
+    data  = models.BinaryField()  ## compressed
+
+    class Meta:
+        indexes = [models.Index(fields = ['world', 'tick'])]
+
+
+class WorldSnapshot(models.Model):
+    """
+    Compressed snapshot of the state of a world (see `journal`).
+    """
+
+    world     = models.ForeignKey('World', on_delete = models.CASCADE)
+    tick      = models.PositiveBigIntegerField()
+    timestamp = models.FloatField()
+    data      = models.BinaryField()
+
+    # Id of the latest journal entry of the world which is included in the snapshot
+    last_entry_id = models.PositiveBigIntegerField(default = 0)
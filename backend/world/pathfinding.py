@@ -0,0 +1,216 @@
+"""
+Implements path finding on the hexagon map with per-hex field costs.
+
+The cost of a path is the sum of the costs of the hex fields it enters (i.e. excluding the first hex field).
+"""
+
+import collections
+import heapq
+import itertools
+
+import numpy as np
+
+from . import hexgrid
+
+
+class CostMap:
+    """
+    Costs of entering the hex fields, stored as a numpy array over a bounding box.
+
+    Hex fields outside of the bounding box have the default cost.
+    A cost of `np.inf` marks a hex field as blocked.
+    Each modification increments the `version` of the cost map.
+    """
+
+    def __init__(self, bbox, default=1):
+        x_min, x_max, y_min, y_max = bbox
+        assert default > 0
+        self.x_min, self.y_min = x_min, y_min
+        self.costs = np.full((y_max - y_min + 1, x_max - x_min + 1), float(default))
+        self.default = float(default)
+        self.version = 0
+
+    def bbox(self):
+        """
+        Returns the bounding box of the cost map.
+
+        :return: `(x_min, x_max, y_min, y_max)`
+        """
+        return self.x_min, self.x_min + self.costs.shape[1] - 1, self.y_min, self.y_min + self.costs.shape[0] - 1
+
+    def _indices(self, points):
+        points = np.asarray(points, dtype=int).reshape(-1, 2)
+        rows = points[:, 1] - self.y_min
+        cols = points[:, 0] - self.x_min
+        inside = (rows >= 0) & (rows < self.costs.shape[0]) & (cols >= 0) & (cols < self.costs.shape[1])
+        return rows, cols, inside
+
+    def set_costs(self, points, cost):
+        """
+        Sets the cost of the hex fields (points outside of the bounding box are ignored).
+
+        :param points: Array of shape `(n, 2)` or a `HexSet`.
+        """
+        if isinstance(points, hexgrid.HexSet):
+            points = points.explicit()
+        assert cost > 0
+        rows, cols, inside = self._indices(points)
+        self.costs[rows[inside], cols[inside]] = cost
+        self.version += 1
+
+    def costs_many(self, points):
+        """
+        Returns the costs of the hex fields.
+
+        :param points: Array of shape `(n, 2)`.
+        :return: Array of shape `(n,)`.
+        """
+        rows, cols, inside = self._indices(points)
+        result = np.full(len(rows), self.default)
+        result[inside] = self.costs[rows[inside], cols[inside]]
+        return result
+
+    def cost(self, point):
+        return float(self.costs_many(point)[0])
+
+    @property
+    def min_cost(self):
+        return min((self.default, float(self.costs.min(initial = np.inf))))
+
+
+class PathFinder:
+    """
+    Finds cheapest paths using A* search (with the hex distance heuristic) or bidirectional Dijkstra search.
+
+    The search is confined to the bounding box of the cost map and of the start and goal (extended by one ring of hex fields).
+    Found paths are cached until the cost map is modified.
+    """
+
+    def __init__(self, cost_map, cache_size=1024):
+        self.cost_map = cost_map
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._cache_version = cost_map.version
+
+    def _search_bbox(self, start, goal):
+        x_min, x_max, y_min, y_max = self.cost_map.bbox()
+        x_min = min((x_min, start[0], goal[0])) - 2
+        x_max = max((x_max, start[0], goal[0])) + 2
+        y_min = min((y_min, start[1], goal[1])) - 1
+        y_max = max((y_max, start[1], goal[1])) + 1
+        return x_min, x_max, y_min, y_max
+
+    def _neighbors(self, u, bbox):
+        x_min, x_max, y_min, y_max = bbox
+        for dx, dy in hexgrid.HEX_NEIGHBORS:
+            v = (u[0] + int(dx), u[1] + int(dy))
+            if x_min <= v[0] <= x_max and y_min <= v[1] <= y_max:
+                yield v
+
+    def _cost(self, u):
+        x, y = u[0] - self.cost_map.x_min, u[1] - self.cost_map.y_min
+        if 0 <= y < self.cost_map.costs.shape[0] and 0 <= x < self.cost_map.costs.shape[1]:
+            return self.cost_map.costs[y, x]
+        else:
+            return self.cost_map.default
+
+    @staticmethod
+    def _reconstruct(parents, u):
+        path = list()
+        while u is not None:
+            path.append(u)
+            u = parents[u]
+        return path[::-1]
+
+    def _astar(self, start, goal):
+        bbox = self._search_bbox(start, goal)
+        min_cost = self.cost_map.min_cost
+        def h(u):
+            dx, dy = abs(u[0] - goal[0]), abs(u[1] - goal[1])
+            return min_cost * max((dy, (dx + dy) // 2))
+        counter = itertools.count()
+        queue = [(h(start), next(counter), start)]
+        g = {start: 0.}
+        parents = {start: None}
+        closed = set()
+        while len(queue) > 0:
+            _, _, u = heapq.heappop(queue)
+            if u == goal:
+                return self._reconstruct(parents, goal)
+            if u in closed: continue
+            closed.add(u)
+            for v in self._neighbors(u, bbox):
+                g_v = g[u] + self._cost(v)
+                if g_v < g.get(v, np.inf):
+                    g[v] = g_v
+                    parents[v] = u
+                    heapq.heappush(queue, (g_v + h(v), next(counter), v))
+        return None
+
+    def _bidirectional(self, start, goal):
+        bbox = self._search_bbox(start, goal)
+        counter = itertools.count()
+
+        # The forward search enters `v` from `u` at the cost of `v`, the backward search leaves `v` towards `u` at the cost of `v`
+        dist = [{start: 0.}, {goal: 0.}]
+        parents = [{start: None}, {goal: None}]
+        queues = [[(0., next(counter), start)], [(0., next(counter), goal)]]
+        settled = [set(), set()]
+        best, meeting = (0., start) if start == goal else (np.inf, None)
+        while len(queues[0]) > 0 and len(queues[1]) > 0:
+            if queues[0][0][0] + queues[1][0][0] >= best:
+                break
+            side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+            d_u, _, u = heapq.heappop(queues[side])
+            if u in settled[side]: continue
+            settled[side].add(u)
+            for v in self._neighbors(u, bbox):
+                d_v = d_u + (self._cost(v) if side == 0 else self._cost(u))
+                if d_v < dist[side].get(v, np.inf):
+                    dist[side][v] = d_v
+                    parents[side][v] = u
+                    heapq.heappush(queues[side], (d_v, next(counter), v))
+                    if v in dist[1 - side] and d_v + dist[1 - side][v] < best:
+                        best, meeting = d_v + dist[1 - side][v], v
+        if meeting is None:
+            return None
+        path_forward  = self._reconstruct(parents[0], meeting)
+        path_backward = self._reconstruct(parents[1], meeting)[::-1]
+        return path_forward + path_backward[1:]
+
+    def find_path(self, start, goal, bidirectional=False):
+        """
+        Finds a cheapest path between two hex fields.
+
+        :return: Read-only array of shape `(n, 2)` with the visited hex fields, excluding `start` and including `goal` (or `None` if the goal is unreachable).
+        """
+        hexgrid.check_hex_coordinates(start)
+        hexgrid.check_hex_coordinates(goal)
+        start = tuple(int(c) for c in start)
+        goal  = tuple(int(c) for c in goal)
+
+        # Invalidate the cache if the cost map was modified
+        if self._cache_version != self.cost_map.version:
+            self._cache.clear()
+            self._cache_version = self.cost_map.version
+
+        key = (start, goal, bidirectional)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        path = self._bidirectional(start, goal) if bidirectional else self._astar(start, goal)
+        if path is not None:
+            path = np.array(path[1:], dtype=int).reshape(-1, 2)
+            path.flags.writeable = False
+
+        self._cache[key] = path
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last = False)
+        return path
+
+    def path_cost(self, path):
+        """
+        Computes the cost of a path (as returned by `find_path`).
+        """
+        return float(np.sum(self.cost_map.costs_many(path)))
@@ -0,0 +1,158 @@
+"""
+Implements the profiling of the ticks, i.e. measuring the wall time, the number of database queries, and the database time of the ticks and of the handlers involved.
+
+The profiles of the ticks are logged as JSON, and the most recent `settings.TICK_PROFILE_SIZE` profiles are kept in the database (see `TickProfile`).
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+# Profile of the ticks which are currently processed (or `None`), separately per thread (e.g., ticks of different worlds)
+_current = contextvars.ContextVar('tick_profile', default = None)
+
+# Lists which collect the profiles of the ticks (see `collecting`)
+_collectors = list()
+
+
+class Measurement:
+    """
+    Measures the wall time, the number of database queries, and the database time.
+    """
+
+    def __init__(self):
+        self.wall_seconds = 0.
+        self.queries = 0
+        self.db_seconds = 0.
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - t0
+
+    @contextlib.contextmanager
+    def measure(self):
+        t0 = time.perf_counter()
+        with connection.execute_wrapper(self):
+            try:
+                yield self
+            finally:
+                self.wall_seconds += time.perf_counter() - t0
+
+    def todict(self):
+        return dict(wall_seconds = self.wall_seconds, queries = self.queries, db_seconds = self.db_seconds)
+
+
+class Profile:
+    """
+    Profile of one or more consecutive ticks, with the measurements aggregated per handler type and per empire.
+
+    The measurements of a handler are attributed to the empires in proportion to the number of their processes.
+    """
+
+    def __init__(self, first_tick, last_tick, world_id = None):
+        self.world_id   = world_id
+        self.first_tick = first_tick
+        self.last_tick  = last_tick
+        self.total = Measurement()
+        self.handlers = dict()
+        self.empires  = dict()
+        self.in_handler = False
+
+    def add(self, handler_id, measurement, processes):
+        stats = self.handlers.setdefault(handler_id, dict(calls = 0, processes = 0, wall_seconds = 0., queries = 0, db_seconds = 0.))
+        stats['calls'] += 1
+        stats['processes'] += len(processes)
+        for key, value in measurement.todict().items():
+            stats[key] += value
+
+        for process in processes:
+            stats = self.empires.setdefault(process.owner_id, dict(processes = 0, wall_seconds = 0., queries = 0, db_seconds = 0.))
+            stats['processes'] += 1
+            for key, value in measurement.todict().items():
+                stats[key] += value / len(processes)
+
+    def todict(self):
+        return dict(
+            world      = self.world_id,
+            first_tick = self.first_tick,
+            last_tick  = self.last_tick,
+            **self.total.todict(),
+            handlers = self.handlers,
+            empires  = {str(empire_id): stats for empire_id, stats in self.empires.items()})
+
+
+@contextlib.contextmanager
+def profile_ticks(first_tick, last_tick = None, world_id = None):
+    """
+    Profiles the processing of the ticks `first_tick` to `last_tick` (defaults to `first_tick`) of a world.
+
+    Afterwards, the profile is logged and stored.
+    """
+    profile = Profile(first_tick, first_tick if last_tick is None else last_tick, world_id)
+    token = _current.set(profile)
+    try:
+        with profile.total.measure():
+            yield profile
+    finally:
+        _current.reset(token)
+
+    data = profile.todict()
+    for collector in _collectors:
+        collector.append(data)
+    logger.info(json.dumps(dict(event = 'tick', **data)))
+    if settings.TICK_PROFILE_SIZE > 0:
+        from world.models import TickProfile
+        TickProfile.store(data)
+
+
+@contextlib.contextmanager
+def collecting():
+    """
+    Collects the profiles of the ticks which are processed within the block (as dictionaries).
+    """
+    profiles = list()
+    _collectors.append(profiles)
+    try:
+        yield profiles
+    finally:
+        _collectors.remove(profiles)
+
+
+def instrument(method):
+    """
+    Decorates a method of a handler, so that its calls are measured as part of the profile of the current ticks (or logged, if no ticks are processed).
+
+    Nested calls (e.g., `finish_many` calling `finish`) are only measured once.
+    The first positional argument of the method must be a process, or a list of processes.
+    """
+    @functools.wraps(method)
+    def wrapper(self, processes, *args, **kwargs):
+        profile = _current.get()
+        if profile is not None and profile.in_handler:
+            return method(self, processes, *args, **kwargs)
+        if profile is not None:
+            profile.in_handler = True
+        measurement = Measurement()
+        try:
+            with measurement.measure():
+                return method(self, processes, *args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.in_handler = False
+                profile.add(type(self).__qualname__, measurement, processes if isinstance(processes, list) else [processes])
+            else:
+                logger.debug(json.dumps(dict(event = 'handler', handler = type(self).__qualname__, method = method.__name__, **measurement.todict())))
+    return wrapper
@@ -0,0 +1,156 @@
+"""
+Implements a per-process spatial index of the sectors and movables, one per world.
+
+The index maps hex fields to the ids of the sectors and movables located there (the positions of moving movables are derived for the tick the index was built for).
+It is built from the database once per tick (or when a new world is created), and kept up to date by the signals emitted when sectors and movables are saved or deleted within this process.
+Since modifications made by other processes are only picked up with the next tick, the results should be treated as candidates (e.g., for `filter(id__in = ...)`), not as authoritative state.
+
+It is used to look up the positions of moving movables (e.g., for their visibility, see `restapi.serializers.movables_unveiled_by`), which are otherwise derived from their routes.
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+import numpy as np
+
+
+class SpatialIndex:
+
+    def __init__(self, world_id):
+        self.world_id = world_id
+        self.now = None
+        self.sectors  = dict()  ## hex field -> sector id
+        self.movables = dict()  ## hex field -> set of movable ids
+        self.movable_positions = dict()  ## movable id -> hex field
+
+    @property
+    def is_built(self):
+        return self.now is not None
+
+    def build(self, now):
+        """
+        Builds the index from the database (two queries).
+        """
+        from world.models import Movable, Sector
+        self.sectors.clear()
+        self.movables.clear()
+        self.movable_positions.clear()
+        for sector_id, x, y in Sector.objects.filter(world = self.world_id).values_list('id', 'position_x', 'position_y'):
+            self.sectors[(x, y)] = sector_id
+        for movable in Movable.objects.filter(world = self.world_id).only('id', 'position_x', 'position_y', 'departure_tick', 'move_ticks', 'route'):
+            self.set_movable(movable.id, movable.position_at(now))
+        self.now = now
+
+    def invalidate(self):
+        self.now = None
+
+    def set_movable(self, movable_id, position):
+        position = (int(position[0]), int(position[1]))
+        self.remove_movable(movable_id)
+        self.movables.setdefault(position, set()).add(movable_id)
+        self.movable_positions[movable_id] = position
+
+    def remove_movable(self, movable_id):
+        position = self.movable_positions.pop(movable_id, None)
+        if position is not None:
+            self.movables[position].discard(movable_id)
+            if len(self.movables[position]) == 0:
+                del self.movables[position]
+
+    def set_sector(self, sector_id, position):
+        self.remove_sector(sector_id)
+        self.sectors[(int(position[0]), int(position[1]))] = sector_id
+
+    def remove_sector(self, sector_id):
+        for position in [position for position, s_id in self.sectors.items() if s_id == sector_id]:
+            del self.sectors[position]
+
+    def sector_at(self, position):
+        """
+        Returns the id of the sector located at a hex field (or `None`).
+        """
+        return self.sectors.get((int(position[0]), int(position[1])))
+
+    def movables_at(self, position):
+        """
+        Returns the ids of the movables located at a hex field.
+        """
+        return frozenset(self.movables.get((int(position[0]), int(position[1])), frozenset()))
+
+    def _query(self, buckets, hexset):
+        if len(buckets) == 0:
+            return list()
+        x_min, x_max, y_min, y_max = hexset.bbox()
+        bbox_size = max((0, x_max - x_min + 1)) * max((0, y_max - y_min + 1)) / 2
+
+        # Enumerate the hex fields of small sets, otherwise test all occupied hex fields
+        if bbox_size <= len(buckets):
+            positions = [tuple(c) for c in hexset.explicit()]
+            return [buckets[p] for p in positions if p in buckets]
+        else:
+            positions = list(buckets.keys())
+            mask = hexset.contains_many(np.array(positions, dtype=int))
+            return [buckets[p] for p, contained in zip(positions, mask) if contained]
+
+    def sectors_in(self, hexset):
+        """
+        Returns the ids of the sectors located within a `HexSet`.
+        """
+        return self._query(self.sectors, hexset)
+
+    def movables_in(self, hexset):
+        """
+        Returns the ids of the movables located within a `HexSet`.
+        """
+        return [movable_id for ids in self._query(self.movables, hexset) for movable_id in ids]
+
+
+_indices = dict()  ## world id -> spatial index
+
+
+def get_index(world_id, now):
+    """
+    Returns the spatial index of a world, which is (re-)built if it is not valid for the tick `now`.
+    """
+    index = _indices.setdefault(world_id, SpatialIndex(world_id))
+    if index.now != now:
+        index.build(now)
+    return index
+
+
+def _get_built_index(world_id):
+    index = _indices.get(world_id)
+    return index if index is not None and index.is_built else None
+
+
+@receiver(post_save, sender = 'world.World')
+def invalidate_on_world_created(sender, instance, created, **kwargs):
+    if created:
+        _indices.pop(instance.id, None)
+
+
+@receiver(post_save, sender = 'world.Movable')
+def update_movable(sender, instance, **kwargs):
+    index = _get_built_index(instance.world_id)
+    if index is not None:
+        index.set_movable(instance.id, instance.position_at(index.now))
+
+
+@receiver(post_delete, sender = 'world.Movable')
+def remove_movable(sender, instance, **kwargs):
+    index = _get_built_index(instance.world_id)
+    if index is not None:
+        index.remove_movable(instance.id)
+
+
+@receiver(post_save, sender = 'world.Sector')
+def update_sector(sender, instance, **kwargs):
+    index = _get_built_index(instance.world_id)
+    if index is not None:
+        index.set_sector(instance.id, (instance.position_x, instance.position_y))
+
+
+@receiver(post_delete, sender = 'world.Sector')
+def remove_sector(sender, instance, **kwargs):
+    index = _get_built_index(instance.world_id)
+    if index is not None:
+        index.remove_sector(instance.id)
@@ -1,5 +1,7 @@
+import json
+
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 import numpy as np
 
 from world.models import (
@@ -8,7 +10,9 @@ from world.models import (
     Sector,
     Celestial,
     Unveiled,
+    cache,
     hexgrid,
+    spatial,
 )
 from processes.models import (
     Process,
@@ -55,6 +59,70 @@ class MovableTest(TestCase):
             movable   = movable)
         self.assertEqual(movable.speed, blueprint.data['speed'])
 
+        # The speed and the owner are stored with the movable
+        movable = Movable.objects.get(id = movable.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(movable.speed, blueprint.data['speed'])
+            self.assertEqual(movable.owner_id, empire.id)
+
+    def test_ships_changed(self):
+        from game.models import Empire, Blueprint, Ship
+        player    = User.objects.create(username = 'testuser', password = 'password')
+        empire    = Empire.objects.create(name = 'Foos', player = player, origin_x = 0, origin_y = 0, color_hue = 0)
+        blueprint = Blueprint.objects.get(empire = empire, base_id = 'ships/colony-ship')
+        fast_blueprint = Blueprint.objects.create(empire = empire, base_id = 'ships/colony-ship', data = dict(blueprint.data, speed = 2 * blueprint.data['speed']))
+        movable   = Movable.objects.create(position_x = 0, position_y = 0)
+        ships = [
+            Ship.objects.create(blueprint = fast_blueprint, movable = movable),
+            Ship.objects.create(blueprint = blueprint, movable = movable)]
+        self.assertEqual(movable.speed, blueprint.data['speed'])
+
+        # Transfer the slower ship to another movable
+        other_movable = Movable.objects.create(position_x = 0, position_y = 0)
+        ship = Ship.objects.get(id = ships[1].id)
+        ship.movable = other_movable
+        ship.save()
+        movable.refresh_from_db()
+        self.assertEqual(movable.speed, fast_blueprint.data['speed'])
+        self.assertEqual(other_movable.speed, blueprint.data['speed'])
+        self.assertEqual(other_movable.owner_id, empire.id)
+
+        # Delete the faster ship (the empty movable is deleted)
+        ships[0].delete()
+        self.assertFalse(Movable.objects.filter(id = movable.id).exists())
+
+        # Delete one of two ships
+        Ship.objects.create(blueprint = fast_blueprint, movable = other_movable)
+        ship.delete()
+        other_movable.refresh_from_db()
+        self.assertEqual(other_movable.speed, fast_blueprint.data['speed'])
+        self.assertEqual(other_movable.owner_id, empire.id)
+
+    def test_ships_changed_moving(self):
+        from game.models import Empire, Blueprint, Ship
+        player    = User.objects.create(username = 'testuser', password = 'password')
+        empire    = Empire.objects.create(name = 'Foos', player = player, origin_x = 0, origin_y = 0, color_hue = 0)
+        blueprint = Blueprint.objects.get(empire = empire, base_id = 'ships/colony-ship')
+        slow_blueprint = Blueprint.objects.create(empire = empire, base_id = 'ships/colony-ship', data = dict(blueprint.data, speed = blueprint.data['speed'] / 2))
+        movable   = Movable.objects.create(position_x = 0, position_y = 0)
+        Ship.objects.create(blueprint = blueprint, movable = movable)
+        slow_ship = Ship.objects.create(blueprint = slow_blueprint, movable = movable)
+        movable.refresh_from_db()
+        movable.move_to((20, 0))
+        self.assertEqual(movable.move_ticks, 2)
+        for _ in range(2):
+            self.world.tick()
+
+        # Deleting the slowest ship of a moving movable re-plans its route for the new speed
+        slow_ship.delete()
+        movable.refresh_from_db()
+        self.assertEqual(movable.move_ticks, 1)
+        self.assertEqual(movable.position.tolist(), [2, 0])
+        for _ in range(3):
+            self.world.tick()
+        movable.refresh_from_db()
+        self.assertEqual(movable.position.tolist(), [8, 0])
+
     def test_move_to_speed1(self):
         self.movable.custom_speed = 1
         self.movable.save()
@@ -135,6 +203,37 @@ class MovableTest(TestCase):
         actual = [(c.position_x, c.position_y) for c in Unveiled.objects.filter(by_whom = empire)]
         self.assertEqual(frozenset(actual), frozenset(expected))
 
+    def test_move_to_avoid_foreign_territory(self):
+        from game.models import Empire, Blueprint, Ship
+        player1 = User.objects.create(username = 'testuser1', password = 'password')
+        player2 = User.objects.create(username = 'testuser2', password = 'password')
+        empire1 = Empire.objects.create(name = 'Foos', player = player1, origin_x = 0, origin_y = 0, color_hue = 0)
+        empire2 = Empire.objects.create(name = 'Bars', player = player2, origin_x = 0, origin_y = 0, color_hue = 0)
+        Ship.objects.create(movable = self.movable, blueprint = Blueprint.objects.get(empire = empire1, base_id = 'ships/colony-ship'))
+        self.movable.set_position((-6,0))
+
+        # Let empire2 habitate a sector in between
+        sector = Sector.objects.create(position_x = 0, position_y = 0, name = 'S')
+        Celestial.objects.create(sector = sector, position = 0, features = dict(), habitated_by = empire2)
+
+        # Check that the trajectory avoids the territory of empire2
+        self.movable.move_to((6,0), avoid_foreign_territory = True)
+        self.assertEqual(self.movable.trajectory[-1].tolist(), [6,0])
+        self.assertFalse(any(tuple(c) in empire2.territory for c in self.movable.trajectory))
+        self.assertEqual(self.movable.next_position.tolist(), self.movable.trajectory[0].tolist())
+
+        # Check that the movement follows the trajectory
+        trajectory = self.movable.trajectory.tolist()
+        for expected in trajectory:
+            self.world.tick()
+            self.movable.refresh_from_db()
+            self.assertEqual(self.movable.position.tolist(), expected)
+        self.assertEqual(len(Process.objects.all()), 0)
+
+        # Check that the straight trajectory is used otherwise
+        self.movable.move_to((-6,0))
+        self.assertEqual(self.movable.trajectory.tolist(), hexgrid.get_trajectory_towards((6,0), (-6,0), 1).tolist())
+
     def test_move_to_speed2(self):
         self.movable.custom_speed = 2
         self.movable.save()
@@ -163,6 +262,700 @@ class MovableTest(TestCase):
         self.assertEqual(len(Process.objects.all()), 0)
 
 
+class generate_test_world_Test(TestCase):
+
+    def test_empire2(self):
+        from game.models import Empire
+        from world.generator import generate_test_world
+        generate_test_world(radius = 10, density = 0.5, seed = 0, empire2 = True)
+        empire1 = Empire.objects.get(name = 'Foos')
+        empire2 = Empire.objects.get(name = 'Bars')
+
+        # The second empire is located at the closest habitable celestial of a different sector
+        candidates = Celestial.objects.exclude(sector__position_x = empire1.origin_x, sector__position_y = empire1.origin_y).filter(features__capacity__gte = 1)
+        distances = [hexgrid.hex_distance(empire1.origin, c.sector.position) for c in candidates]
+        self.assertEqual(hexgrid.hex_distance(empire1.origin, empire2.origin), min(distances))
+
+
+class SimulateTest(TestCase):
+
+    def setUp(self):
+        from game.models import Empire, Blueprint, Construction
+        self.world = World.objects.create()
+        player1 = User.objects.create(username = 'testuser1', password = 'password')
+        player2 = User.objects.create(username = 'testuser2', password = 'password')
+        self.empire1 = Empire.objects.create(name = 'Foos', player = player1, origin_x = 0, origin_y = 0, color_hue = 0)
+        self.empire2 = Empire.objects.create(name = 'Bars', player = player2, origin_x = 0, origin_y = 0, color_hue = 0)
+
+        # Let empire1 build a ship and a construction
+        sector1 = Sector.objects.create(position_x = 0, position_y = 0, name = 'S1')
+        sector2 = Sector.objects.create(position_x = 4, position_y = 0, name = 'S2')
+        celestial1 = Celestial.objects.create(sector = sector1, position = 0, features = dict(capacity = 10), habitated_by = self.empire1)
+        celestial2 = Celestial.objects.create(sector = sector2, position = 0, features = dict(capacity = 10), habitated_by = self.empire1)
+        Construction.objects.create(blueprint = Blueprint.objects.get(empire = self.empire1, base_id = 'constructions/shipyard'), celestial = celestial1)
+        Blueprint.objects.get(empire = self.empire1, base_id = 'ships/colony-ship').build(celestial1)
+        Blueprint.objects.get(empire = self.empire1, base_id = 'constructions/digital-cave').build(celestial2)
+
+        # Let empire1 colonize a sector, which is in the way of a movable of empire2 routed around foreign territory
+        sector3 = Sector.objects.create(position_x = 20, position_y = 0, name = 'S3')
+        celestial3 = Celestial.objects.create(sector = sector3, position = 0, features = dict(capacity = 1))
+        celestial3.colonize(self.empire1, self.create_movable(self.empire1, (20, 0)))
+        self.create_movable(self.empire2, (20, -8)).move_to((20, 8), avoid_foreign_territory = True)
+
+        # Add movables with different speeds and owners
+        rng = np.random.default_rng(0)
+        for idx in range(12):
+            position, destination = rng.integers(-12, 12, size = (2, 2))
+            position[0]    += np.sum(position)    % 2
+            destination[0] += np.sum(destination) % 2
+            empire = [self.empire1, self.empire2, None][idx % 3]
+            speed  = [None, 0.3, 0.5, 2.5][idx % 4] if empire is not None else 1.5
+            self.create_movable(empire, position, speed = speed).move_to(destination)
+
+    def create_movable(self, empire, position, speed = None):
+        from game.models import Blueprint, Ship
+        movable = Movable.objects.create(position_x = position[0], position_y = position[1], custom_speed = speed)
+        if empire is not None:
+            Ship.objects.create(movable = movable, blueprint = Blueprint.objects.get(empire = empire, base_id = 'ships/colony-ship'))
+        return movable
+
+    def snapshot(self):
+        from game.models import Construction, Ship
+        from world.models import TerritoryCell
+        return dict(
+            now           = World.objects.get().now,
+            movables      = sorted(Movable.objects.values_list('position_x', 'position_y', 'destination_x', 'destination_y', 'custom_speed')),
+            processes     = sorted(Process.objects.values_list('id', 'start_tick', 'end_tick')),
+            unveiled      = frozenset(Unveiled.objects.values_list('position_x', 'position_y', 'by_whom')),
+            territory     = frozenset(TerritoryCell.objects.values_list('position_x', 'position_y', 'owner')),
+            habitated     = sorted(Celestial.objects.values_list('id', 'habitated_by')),
+            constructions = sorted(Construction.objects.values_list('blueprint', 'celestial')),
+            ships         = sorted(Ship.objects.values_list('blueprint', 'movable__position_x', 'movable__position_y')),
+        )
+
+    def test_equivalence(self):
+        from django.db import transaction
+        for ticks in (1, 2, 15, 40):
+            savepoint = transaction.savepoint()
+            for _ in range(ticks):
+                self.world.tick()
+            expected = self.snapshot()
+            transaction.savepoint_rollback(savepoint)
+            spatial._indices.clear()
+
+            savepoint = transaction.savepoint()
+            self.world.refresh_from_db()
+            self.world.simulate(ticks)
+            self.assertEqual(self.snapshot(), expected)
+            transaction.savepoint_rollback(savepoint)
+            spatial._indices.clear()
+            self.world.refresh_from_db()
+
+    def test_num_queries(self):
+        from django.db import connection, transaction
+        from django.test.utils import CaptureQueriesContext
+        savepoint = transaction.savepoint()
+        with CaptureQueriesContext(connection) as ctx_ticks:
+            for _ in range(100):
+                self.world.tick()
+        transaction.savepoint_rollback(savepoint)
+        spatial._indices.clear()
+        self.world.refresh_from_db()
+
+        with CaptureQueriesContext(connection) as ctx_simulate:
+            self.world.simulate(100)
+        self.assertLess(3 * len(ctx_simulate.captured_queries), len(ctx_ticks.captured_queries))
+
+
+class JournalTest(TestCase):
+
+    setUp = SimulateTest.setUp
+    create_movable = SimulateTest.create_movable
+
+    def state(self):
+        from game.models import Construction, Ship
+        from world.models import TerritoryCell
+        return dict(
+            now           = World.objects.get().now,
+            movables      = list(Movable.objects.order_by('id').values_list('id', 'position_x', 'position_y', 'destination_x', 'destination_y', 'custom_speed')),
+            processes     = list(Process.objects.order_by('id').values_list('id', 'start_tick', 'end_tick', 'movable', 'celestial')),
+            unveiled      = frozenset(Unveiled.objects.values_list('position_x', 'position_y', 'by_whom')),
+            territory     = frozenset(TerritoryCell.objects.values_list('position_x', 'position_y', 'owner')),
+            habitated     = list(Celestial.objects.order_by('id').values_list('id', 'habitated_by')),
+            constructions = list(Construction.objects.order_by('id').values_list('id', 'blueprint', 'celestial')),
+            ships         = list(Ship.objects.order_by('id').values_list('id', 'blueprint', 'movable')),
+        )
+
+    def test_restore(self):
+        from world import journal
+        journal.take_snapshot(self.world)
+        states = dict()
+        for _ in range(15):
+            self.world.tick()
+            states[self.world.now] = self.state()
+
+        # The changes made by the players and by fast-forwarding are journaled as well
+        with journal.recording(self.world, 'action'):
+            Movable.objects.filter(custom_speed = 1.5)[0].move_to((0, 0))
+        self.world.simulate(10)
+        expected = self.state()
+
+        Process.objects.all().delete()
+        Unveiled.objects.all().delete()
+        self.assertGreater(journal.restore(self.world), 0)
+        self.assertEqual(self.state(), expected)
+
+        # Earlier ticks can be restored as well
+        journal.restore(self.world, 7)
+        self.assertEqual(self.world.now, 7)
+        self.assertEqual(self.state(), states[7])
+        journal.restore(self.world)
+        self.assertEqual(self.state(), expected)
+
+    def test_replay(self):
+        from world import journal
+        journal.take_snapshot(self.world)
+        for _ in range(10):
+            self.world.tick()
+        expected = self.state()
+
+        # The ticks are processed again, but the database is not modified
+        profiles = journal.replay(self.world, 4, 8)
+        self.assertEqual([profile['first_tick'] for profile in profiles], [4, 5, 6, 7, 8])
+        self.assertEqual(self.state(), expected)
+
+    def test_snapshots(self):
+        from django.test import override_settings
+        from world.models import JournalEntry, WorldSnapshot
+        with override_settings(JOURNAL_SNAPSHOT_INTERVAL = 5, JOURNAL_SNAPSHOTS = 2):
+            for _ in range(12):
+                self.world.tick()
+        snapshots = list(WorldSnapshot.objects.order_by('id'))
+        self.assertEqual([snapshot.tick for snapshot in snapshots], [5, 10])
+
+        # The journal is kept since the oldest snapshot
+        self.assertGreater(JournalEntry.objects.count(), 0)
+        self.assertFalse(JournalEntry.objects.filter(id__lte = snapshots[0].last_entry_id).exists())
+
+    def test_concurrent_recordings(self):
+        """
+        The changes are collected separately per thread (e.g., for concurrent requests to different worlds).
+        """
+        import threading
+        from django.test import override_settings
+        from world import journal
+        barrier, entered = threading.Barrier(2), threading.Event()
+        batches = dict()
+        def record(world_id, first):
+            if not first: entered.wait(timeout = 10)  ## enter after the first thread
+            with journal.recording(World(id = world_id), 'action') as batch:
+                entered.set()
+                barrier.wait(timeout = 10)
+                if first: journal.record_saved(Sector, [Sector(id = world_id, world_id = world_id, position_x = 0, position_y = 0, name = 'S')])
+                barrier.wait(timeout = 10)
+                if not first:
+                    barrier.wait(timeout = 10)  ## record after the first thread left
+                    journal.record_saved(Sector, [Sector(id = world_id, world_id = world_id, position_x = 0, position_y = 0, name = 'S')])
+            if first: barrier.wait(timeout = 10)
+            batches[world_id] = batch
+        with override_settings(JOURNAL = False):
+            threads = [threading.Thread(target = record, args = (world_id, world_id == 1)) for world_id in (1, 2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout = 10)
+        self.assertEqual(sorted(batches.keys()), [1, 2])
+        for world_id, batch in batches.items():
+            self.assertEqual([operation[3][0][0] for operation in batch.operations], [world_id])
+
+
+class TickProfileTest(TestCase):
+
+    def setUp(self):
+        self.world = World.objects.create()
+        self.movable = Movable.objects.create(position_x = 0, position_y = 0, custom_speed = 1)
+
+    def test_profile(self):
+        from world.models import TickProfile
+        self.movable.move_to((4, 0))
+        self.world.tick()
+        with self.assertLogs('world.profiling', level = 'INFO') as logs:
+            self.world.tick()  ## arrival
+        profile = TickProfile.objects.order_by('-id')[0]
+        self.assertEqual((profile.first_tick, profile.last_tick), (3, 3))
+        self.assertEqual(json.loads(logs.records[-1].getMessage()), dict(event = 'tick', **profile.data))
+
+        handler = profile.data['handlers']['MovementHandler']
+        self.assertEqual((handler['calls'], handler['processes']), (1, 1))
+        self.assertGreater(handler['queries'], 0)
+        self.assertLessEqual(handler['queries'], profile.data['queries'])
+        self.assertLessEqual(handler['wall_seconds'], profile.data['wall_seconds'])
+        self.assertEqual(profile.data['empires']['None']['processes'], 1)
+
+    def test_ring_buffer(self):
+        from django.test import override_settings
+        from world.models import TickProfile
+        with override_settings(TICK_PROFILE_SIZE = 3):
+            for _ in range(5):
+                self.world.tick()
+        self.assertEqual(list(TickProfile.objects.order_by('id').values_list('last_tick', flat = True)), [4, 5, 6])
+
+        with override_settings(TICK_PROFILE_SIZE = 0):
+            self.world.tick()
+        self.assertEqual(TickProfile.objects.count(), 3)
+
+        # The profiles of another world do not evict these
+        world2 = World.objects.create(name = 'speed')
+        with override_settings(TICK_PROFILE_SIZE = 3):
+            for _ in range(5):
+                world2.tick()
+        self.assertEqual(TickProfile.objects.filter(world = self.world).count(), 3)
+        self.assertEqual(TickProfile.objects.filter(world = world2).count(), 3)
+
+    def test_concurrent_profiles(self):
+        """
+        The handlers are measured as part of the profile of the ticks processed by the same thread (e.g., ticks of different worlds).
+        """
+        import threading
+        from types import SimpleNamespace
+        from django.test import override_settings
+        from world import profiling
+        barrier, entered = threading.Barrier(2), threading.Event()
+        class Handler:
+            @profiling.instrument
+            def finish_many(self, processes):
+                barrier.wait(timeout = 10)  ## both threads are measuring at once
+        with override_settings(TICK_PROFILE_SIZE = 0), profiling.collecting() as profiles:
+            def tick(world_id, num_processes):
+                if world_id == 2: entered.wait(timeout = 10)  ## start the ticks after the first thread
+                with profiling.profile_ticks(1, world_id = world_id):
+                    entered.set()
+                    barrier.wait(timeout = 10)
+                    Handler().finish_many([SimpleNamespace(owner_id = None)] * num_processes)
+            threads = [threading.Thread(target = tick, args = (world_id, world_id)) for world_id in (1, 2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout = 10)
+        processes = {profile['world']: profile['handlers'][Handler.__qualname__]['processes'] for profile in profiles}
+        self.assertEqual(processes, {1: 1, 2: 2})
+
+    def test_simulate(self):
+        from world.models import TickProfile
+        self.movable.move_to((8, 0))
+        self.world.simulate(10)
+        profile = TickProfile.objects.order_by('-id')[0]
+        self.assertEqual((profile.first_tick, profile.last_tick), (2, 11))
+        self.assertEqual(profile.data['handlers']['MovementHandler']['processes'], 1)
+
+
+class UnveiledTest(TestCase):
+
+    def setUp(self):
+        from game.models import Empire
+        self.world  = World.objects.create()
+        self.player = User.objects.create(username = 'testuser', password = 'password')
+        self.empire = Empire.objects.create(name = 'Foos', player = self.player, origin_x = 0, origin_y = 0, color_hue = 0)
+
+    def get_unveiled(self):
+        return frozenset((c.position_x, c.position_y) for c in Unveiled.objects.filter(by_whom = self.empire))
+
+    def test_unveil(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(Unveiled.unveil(self.empire, (0,0), 1), 7)
+        self.assertEqual(self.get_unveiled(), frozenset(map(tuple, hexgrid.DistanceSet((0,0), 1).explicit())))
+
+        # Only the newly revealed hex fields are written
+        with self.assertNumQueries(2):
+            self.assertEqual(Unveiled.unveil(self.empire, (2,0), 1), 3)
+
+        # Nothing is written if nothing new is revealed
+        with self.assertNumQueries(1):
+            self.assertEqual(Unveiled.unveil(self.empire, (1,1), 0), 0)
+
+    def test_unveil_many(self):
+        centers = [(0,0), (20,0), (0,20)]
+        with self.assertNumQueries(2):
+            self.assertEqual(Unveiled.unveil(self.empire, centers, 3), 3 * 37)
+        expected = hexgrid.Union([hexgrid.DistanceSet(c, 3) for c in centers]).explicit()
+        self.assertEqual(self.get_unveiled(), frozenset(map(tuple, expected)))
+
+    def test_unveil_runs(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from world.models import UNVEIL_QUERY_RUNS
+
+        # Only the runs of the region are queried (not the hex fields between the centers), in batches
+        Unveiled.unveil(self.empire, [(10,0), (2,0)], 0)
+        centers = [(0,0), (20,0)] + [(0, y) for y in range(4, 4 * UNVEIL_QUERY_RUNS // 3 + 8, 4)]
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(Unveiled.unveil(self.empire, centers, 1), len(centers) * 7 - 1)
+        self.assertEqual(len([q for q in context.captured_queries if q['sql'].startswith('SELECT')]), 2)
+        expected = hexgrid.Union([hexgrid.DistanceSet(c, 1) for c in centers]).explicit()
+        self.assertEqual(self.get_unveiled(), frozenset(map(tuple, expected)) | {(10,0)})
+
+
+class TickDaemonTest(TestCase):
+
+    def setUp(self):
+        import tempfile
+        from world.daemon import TickDaemon
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.lockfile = f'{self.tempdir.name}/tickdaemon.lock'
+        self.daemon = TickDaemon(lockfile = self.lockfile, max_sleep_seconds = 60)
+        self.world = World.objects.create(tickrate = 60)
+
+    def tearDown(self):
+        self.daemon.release_leadership()
+        self.tempdir.cleanup()
+
+    def set_overdue(self, seconds):
+        self.world.last_tick_timestamp -= self.world.seconds_between_ticks + seconds
+        self.world.save()
+
+    def test_leadership(self):
+        from world.daemon import TickDaemon
+        daemon2 = TickDaemon(lockfile = self.lockfile)
+        self.assertTrue(self.daemon.acquire_leadership())
+        self.assertFalse(daemon2.acquire_leadership())
+        self.daemon.release_leadership()
+        self.assertTrue(daemon2.acquire_leadership())
+        daemon2.release_leadership()
+
+    def test_run_once(self):
+        self.assertGreater(self.daemon.run_once(), 55)
+        self.world.refresh_from_db()
+        self.assertEqual(self.world.now, 1)
+
+        self.set_overdue(self.world.seconds_between_ticks + 5)
+        self.assertLessEqual(self.daemon.run_once(), 60)
+        self.world.refresh_from_db()
+        self.assertEqual(self.world.now, 3)
+        self.assertEqual(self.world.pending_ticks, 0)
+
+    def test_run_once_next_tick(self):
+        from world.daemon import TickDaemon
+        daemon = TickDaemon(lockfile = self.lockfile, max_sleep_seconds = 1000)
+
+        # Sleep until the next tick is due, even if no process finishes then
+        self.assertAlmostEqual(daemon.run_once(), self.world.seconds_between_ticks, delta = 2)
+        movable = Movable.objects.create(position_x = 0, position_y = 0, custom_speed = 0.25)
+        movable.move_to((2, 0))
+        self.assertEqual(self.world.next_event_tick, 5)
+        self.assertAlmostEqual(daemon.run_once(), self.world.seconds_between_ticks, delta = 2)
+
+    def test_run_stop(self):
+        import threading
+        self.daemon.run_once = lambda: 60  ## the thread cannot access the test database
+        thread = threading.Thread(target = self.daemon.run)
+        thread.start()
+        self.daemon.stop()
+        thread.join(timeout = 10)
+        self.assertFalse(thread.is_alive())
+
+    def test_stale_instance(self):
+        from django.db.models import F
+        stale = World.objects.get(id = self.world.id)
+
+        # The revision is incremented in the database (e.g., by a territory update), and then a stale instance is saved (which must not re-use the revision)
+        World.objects.filter(id = self.world.id).update(revision = F('revision') + 1)
+        self.world.refresh_from_db()
+        stale.save()
+        self.assertEqual(stale.revision, self.world.revision + 1)
+        self.assertEqual(World.objects.get(id = self.world.id).revision, stale.revision)
+
+    def test_middleware(self):
+        from django.test import RequestFactory, override_settings
+        from backend.middleware.world import WorldTickMiddleware
+        middleware = WorldTickMiddleware(lambda request: None)
+        request = RequestFactory().get('/')
+
+        # Pending ticks within the grace period are left to the daemon
+        self.set_overdue(5)
+        with override_settings(TICK_DAEMON = True, TICK_DAEMON_GRACE_SECONDS = 10):
+            middleware(request)
+        self.world.refresh_from_db()
+        self.assertEqual(self.world.now, 1)
+
+        # Pending ticks are processed if the daemon is not responsible
+        with override_settings(TICK_DAEMON = False):
+            middleware(request)
+        self.world.refresh_from_db()
+        self.assertEqual(self.world.now, 2)
+
+        # Pending ticks are processed if overdue for too long
+        self.set_overdue(15)
+        with override_settings(TICK_DAEMON = True, TICK_DAEMON_GRACE_SECONDS = 10):
+            middleware(request)
+        self.world.refresh_from_db()
+        self.assertEqual(self.world.now, 3)
+
+
+class TickLeaseTest(TestCase):
+
+    def setUp(self):
+        self.world = World.objects.create(tickrate = 60)
+        self.world.last_tick_timestamp -= 3 * self.world.seconds_between_ticks
+        self.world.save()
+
+    def test_lease(self):
+        world2 = World.objects.get(id = self.world.id)
+        self.assertTrue(self.world.acquire_tick_lease())
+        self.assertFalse(world2.acquire_tick_lease())
+        self.assertFalse(world2.do_pending_ticks())
+        self.world.release_tick_lease()
+
+        # Stale instances fail to acquire the lease, and are refreshed instead
+        self.assertTrue(self.world.do_pending_ticks())
+        self.assertEqual(self.world.now, 4)
+        world2.last_tick_timestamp -= world2.seconds_between_ticks
+        self.assertFalse(world2.acquire_tick_lease())
+        self.assertEqual(world2.now, 4)
+
+    def test_expired_lease(self):
+        from django.test import override_settings
+        world2 = World.objects.get(id = self.world.id)
+        with override_settings(TICK_LEASE_SECONDS = -1):
+            self.assertTrue(self.world.acquire_tick_lease())
+        self.assertTrue(world2.do_pending_ticks())
+        self.assertEqual(world2.now, 4)
+
+        # The lease of the other process is not released by the previous holder
+        self.assertTrue(world2.acquire_tick_lease())
+        self.world.release_tick_lease()
+        self.assertFalse(World.objects.get(id = self.world.id).acquire_tick_lease())
+
+
+def _use_database(path):
+    """
+    Lets a forked process use another database (the inherited connection is discarded without closing it).
+    """
+    from django.db import connection
+    connection.connection = None
+    connection.settings_dict['NAME'] = path
+
+
+def _setup_tick_lease_database(path, pending_ticks):
+    from django.core.management import call_command
+    _use_database(path)
+    call_command('migrate', run_syncdb = True, verbosity = 0)
+    world = World.objects.create(tickrate = 60)
+    Movable.objects.create(position_x = 0, position_y = 0, custom_speed = 1).move_to((2 * pending_ticks, 0))
+    world.last_tick_timestamp -= pending_ticks * world.seconds_between_ticks
+    world.save()
+
+
+def _hammer_tick_path(path, start, iterations, results):
+    _use_database(path)
+    start.wait()
+    advanced, errors = 0, list()
+    for _ in range(iterations):
+        try:
+            advanced += World.objects.get().do_pending_ticks()
+        except Exception as error:
+            errors.append(repr(error))
+    results.put((advanced, errors))
+
+
+class TickLeaseConcurrencyTest(SimpleTestCase):
+
+    databases = {'default'}  ## used by the forked processes (with another database)
+
+    def test_concurrent_ticks(self):
+        """
+        Several processes process the pending ticks at once, but each tick is only processed once.
+        """
+        import multiprocessing
+        import sqlite3
+        import tempfile
+        context = multiprocessing.get_context('fork')
+        pending_ticks, num_processes = 20, 6
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = f'{tempdir}/db.sqlite3'
+            process = context.Process(target = _setup_tick_lease_database, args = (path, pending_ticks))
+            process.start()
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+            start, results = context.Event(), context.Queue()
+            processes = [context.Process(target = _hammer_tick_path, args = (path, start, 10, results)) for _ in range(num_processes)]
+            for process in processes:
+                process.start()
+            start.set()
+            outcomes = [results.get(timeout = 60) for _ in processes]
+            for process in processes:
+                process.join()
+
+            # Exactly one process advanced the world, the others returned without errors
+            self.assertEqual([errors for _, errors in outcomes], [list()] * num_processes)
+            self.assertEqual(sum(advanced for advanced, _ in outcomes), 1)
+            with sqlite3.connect(path) as db:
+                self.assertEqual(db.execute('SELECT now, tick_lease_expires FROM world_world').fetchall(), [(1 + pending_ticks, None)])
+                self.assertEqual(db.execute('SELECT position_x, departure_tick FROM world_movable').fetchall(), [(2 * pending_ticks, None)])
+                self.assertEqual(db.execute('SELECT COUNT(*) FROM processes_process').fetchall(), [(0,)])
+
+
+class SpatialIndexTest(TestCase):
+
+    def setUp(self):
+        self.world = World.objects.create()
+        self.sector1 = Sector.objects.create(position_x = 0, position_y = 0, name = 'S1')
+        self.sector2 = Sector.objects.create(position_x = 6, position_y = 0, name = 'S2')
+        self.movable1 = Movable.objects.create(position_x = 0, position_y = 0)
+        self.movable2 = Movable.objects.create(position_x = 0, position_y = 0)
+        self.index = spatial.get_index(self.world.id, self.world.now)
+
+    def test_lookup(self):
+        self.assertEqual(self.index.sector_at((0,0)), self.sector1.id)
+        self.assertEqual(self.index.sector_at((6,0)), self.sector2.id)
+        self.assertIsNone(self.index.sector_at((2,0)))
+        self.assertEqual(self.index.movables_at((0,0)), {self.movable1.id, self.movable2.id})
+
+    def test_updates(self):
+        # Movement
+        self.movable1.set_position((2,0))
+        self.assertEqual(self.index.movables_at((0,0)), {self.movable2.id})
+        self.assertEqual(self.index.movables_at((2,0)), {self.movable1.id})
+
+        # Creation and deletion
+        sector3 = Sector.objects.create(position_x = 3, position_y = 1, name = 'S3')
+        self.assertEqual(self.index.sector_at((3,1)), sector3.id)
+        self.movable2.delete()
+        self.assertEqual(self.index.movables_at((0,0)), frozenset())
+        with self.assertNumQueries(0):
+            spatial.get_index(self.world.id, self.world.now)
+
+    def test_range_queries(self):
+        self.movable2.set_position((4,0))
+        small = hexgrid.DistanceSet((0,0), 1)
+        large = hexgrid.DistanceSet((0,0), 20)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.sectors_in(small), [self.sector1.id])
+            self.assertEqual(sorted(self.index.sectors_in(large)), sorted([self.sector1.id, self.sector2.id]))
+            self.assertEqual(self.index.movables_in(small), [self.movable1.id])
+            self.assertEqual(sorted(self.index.movables_in(large)), sorted([self.movable1.id, self.movable2.id]))
+
+    def test_rebuild(self):
+        # Modifications which bypass the signals are picked up with the next tick
+        Movable.objects.filter(id = self.movable1.id).update(position_x = 6)
+        self.assertEqual(self.index.movables_at((6,0)), frozenset())
+        self.world.tick()
+        self.assertEqual(spatial.get_index(self.world.id, self.world.now).movables_at((6,0)), {self.movable1.id})
+
+
+class MultipleWorldsTest(TestCase):
+
+    def setUp(self):
+        self.world1 = World.objects.create(name = 'default', tickrate = 60)
+        self.world2 = World.objects.create(name = 'speed', host = 'speed.example.com', tickrate = 600)
+        self.sector1 = Sector.objects.create(world = self.world1, position_x = 0, position_y = 0, name = 'S')
+        self.sector2 = Sector.objects.create(world = self.world2, position_x = 0, position_y = 0, name = 'S')  ## names are unique per world
+        self.movable1 = Movable.objects.create(world = self.world1, position_x = 0, position_y = 0, custom_speed = 1)
+        self.movable2 = Movable.objects.create(world = self.world2, position_x = 0, position_y = 0, custom_speed = 1)
+
+    def test_default_world(self):
+        self.assertEqual(Movable.objects.create(position_x = 0, position_y = 0).world_id, self.world1.id)
+
+    def test_independent_ticks(self):
+        process1 = self.movable1.move_to((4, 0))
+        process2 = self.movable2.move_to((4, 0))
+        self.assertEqual((process1.world_id, process2.world_id), (self.world1.id, self.world2.id))
+
+        # Only the processes of the ticked world are finished
+        self.world2.tick()
+        self.world2.tick()
+        for movable in (self.movable1, self.movable2):
+            movable.refresh_from_db()
+        self.assertEqual(self.movable1.position.tolist(), [0, 0])
+        self.assertEqual(self.movable2.position.tolist(), [4, 0])
+        self.assertEqual(self.world1.next_event_tick, 3)  ## arrival
+        self.assertIsNone(self.world2.next_event_tick)
+
+        # The spatial indices are separate
+        self.assertEqual(spatial.get_index(self.world1.id, self.world1.now).movables_at((0, 0)), {self.movable1.id})
+        self.assertEqual(spatial.get_index(self.world2.id, self.world2.now).sector_at((0, 0)), self.sector2.id)
+
+    def test_daemon(self):
+        import tempfile
+        from world.daemon import TickDaemon
+        for world in (self.world1, self.world2):
+            world.last_tick_timestamp -= world.seconds_between_ticks
+            world.save()
+        with tempfile.TemporaryDirectory() as tempdir:
+            TickDaemon(lockfile = f'{tempdir}/tickdaemon.lock').run_once()
+        for world in (self.world1, self.world2):
+            world.refresh_from_db()
+            self.assertEqual(world.now, 2)
+
+    def test_routing(self):
+        from django.http import Http404
+        from django.test import RequestFactory
+        from django.urls import reverse
+        from backend.middleware.world import WorldTickMiddleware
+        def get_response(request):
+            return request.world, request.path_info, reverse('world-list')
+        middleware = WorldTickMiddleware(get_response)
+
+        # By URL prefix (which is stripped from the path, and added to generated URLs)
+        request = RequestFactory().get('/worlds/speed/api/worlds/')
+        self.assertEqual(middleware(request), (self.world2, '/api/worlds/', '/worlds/speed/api/worlds/'))
+        self.assertEqual(reverse('world-list'), '/api/worlds/')
+        with self.assertRaises(Http404):
+            middleware(RequestFactory().get('/worlds/unknown/api/worlds/'))
+
+        # By host, or the default world
+        self.assertEqual(middleware(RequestFactory().get('/api/worlds/', HTTP_HOST = 'speed.example.com'))[0], self.world2)
+        self.assertEqual(middleware(RequestFactory().get('/api/worlds/'))[0], self.world1)
+
+
+
+class WorldCacheTest(TestCase):
+
+    def setUp(self):
+        self.world = World.objects.create(tickrate = 60)
+
+    def test_get_world(self):
+        self.assertEqual(cache.get_world(self.world.id).now, self.world.now)
+        with self.assertNumQueries(0):
+            world = cache.get_world(self.world.id)
+        self.assertEqual(world.now, self.world.now)
+
+        # Modifying the returned world does not affect the cache
+        world.now += 10
+        self.assertEqual(cache.get_world(self.world.id).now, self.world.now)
+
+        # Saving the world evicts it from the cache
+        self.world.tick()
+        self.assertEqual(cache.get_world(self.world.id).now, self.world.now)
+
+    def test_validation(self):
+        from django.db.models import F
+        from django.test import override_settings
+        cache.get_world(self.world.id)
+
+        # Another process advances the world (the cached world is trusted until it is validated)
+        World.objects.filter(id = self.world.id).update(now = F('now') + 1, revision = F('revision') + 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get_world(self.world.id).now, self.world.now)
+        with override_settings(WORLD_CACHE_SECONDS = 0):
+            self.assertEqual(cache.get_world(self.world.id).now, self.world.now + 1)
+
+        # The cached world is validated if a tick is due by the clock (a single query, if the world was not changed)
+        cache._worlds[self.world.id][0].last_tick_timestamp -= self.world.seconds_between_ticks
+        with self.assertNumQueries(1):
+            cache.get_world(self.world.id)
+
+    def test_middleware(self):
+        from django.test import RequestFactory
+        from backend.middleware.world import WorldTickMiddleware
+        middleware = WorldTickMiddleware(lambda request: request.world)
+        self.assertEqual(middleware(RequestFactory().get('/')), self.world)
+
+        # No queries are required if no tick is due
+        with self.assertNumQueries(0):
+            self.assertEqual(middleware(RequestFactory().get('/')).now, self.world.now)
+
+
 class CelestialTest(TestCase):
 
     def setUp(self):
@@ -280,6 +1073,37 @@ class CelestialTest(TestCase):
         self.assertRaises(AssertionError, lambda: self.celestial1.colonize(empire2, self.ship.movable))
 
 
+    def test_sector_features(self):
+        Celestial.objects.create(sector = self.sector, position = 0, features = dict(type = 'star', variant = 'red-giant'))
+        sector = Sector.objects.get(id = self.sector.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(sector.feature('capacity'), 20)
+            self.assertEqual(sector.feature('capacity', 'max'), 10)
+            self.assertEqual(sector.feature('mass'), 0)
+        self.assertRaises(AssertionError, lambda: sector.feature('capacity', 'len'))
+
+        # Modify and delete celestials
+        self.celestial1.features['capacity'] = 4
+        self.celestial1.save()
+        self.sector.refresh_from_db()
+        self.assertEqual(self.sector.feature('capacity', 'min'), 4)
+        self.celestial2.delete()
+        self.sector.refresh_from_db()
+        self.assertEqual(self.sector.feature('capacity'), 4)
+
+    def test_occupied_capacity(self):
+        from game.models import Blueprint, Construction
+        blueprint = Blueprint.objects.get(empire = self.empire, base_id = 'constructions/digital-cave')
+        constructions = [Construction.objects.create(blueprint = blueprint, celestial = self.celestial1) for _ in range(3)]
+        celestial = Celestial.objects.get(id = self.celestial1.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(celestial.remaining_capacity, 10 - 3 * blueprint.data['size'])
+
+        constructions[0].delete()
+        celestial.refresh_from_db()
+        self.assertEqual(celestial.remaining_capacity, 10 - 2 * blueprint.data['size'])
+
+
 class HexSetTest(TestCase):
 
     def test_text(self):
@@ -349,6 +1173,108 @@ class DistanceSetTest(TestCase):
         self.assertSequenceEqual(order_tuple_list(hexgrid.DistanceSet((0,0), 2).explicit()), D2)
         self.assertSequenceEqual(order_tuple_list(hexgrid.DistanceSet((0,0), 3).explicit()), D3)
 
+    def test_contains_many(self):
+        ds = hexgrid.DistanceSet((1,1), 2)
+        points = hexgrid.bbox_hex_coordinates((-5, 7, -3, 5))
+        expected = [p in ds for p in points]
+        self.assertEqual(ds.contains_many(points).tolist(), expected)
+
+
+class hex_distance_Test(TestCase):
+
+    def test_hex_distance(self):
+        for radius in range(4):
+            ring = frozenset(map(tuple, hexgrid.DistanceSet((1,1), radius).explicit())) - frozenset(map(tuple, hexgrid.DistanceSet((1,1), radius - 1).explicit())) if radius > 0 else {(1,1)}
+            for c in ring:
+                self.assertEqual(hexgrid.hex_distance((1,1), c), radius)
+
+    def test_pairwise_distances(self):
+        A = [(0,0), (2,0), (-1,1)]
+        B = [(0,0), (3,3), (-4,0), (0,2)]
+        D = hexgrid.pairwise_distances(A, B)
+        self.assertEqual(D.shape, (3, 4))
+        self.assertEqual(D.tolist(), [[hexgrid.hex_distance(a, b) for b in B] for a in A])
+        self.assertEqual(D[0].tolist(), [0, 3, 2, 2])
+
+    def test_nearest(self):
+        self.assertEqual(hexgrid.nearest((0,0), [(6,0), (3,1), (0,4), (-3,1)]), (1, 2))
+
+
+class trajectory_Test(TestCase):
+
+    @staticmethod
+    def get_next_position_stepwise(position, destination, speed):
+        u = np.array(position)
+        for _ in range(int(np.ceil(speed))):
+            d = np.subtract(destination, u).clip(-2, +2)
+            if abs(d[1]) >= 1:
+                d = d.clip(-1, +1)
+                if np.sum(u + d) % 2 == 1: d[0] -= 1
+            u += d
+        return u
+
+    def test_stepwise_equivalence(self):
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            position, destination = rng.integers(-12, 12, size = (2, 2))
+            position[0]    += np.sum(position)    % 2
+            destination[0] += np.sum(destination) % 2
+            speed = rng.choice([0.5, 1, 1.5, 2, 3])
+
+            expected = list()
+            pos = position
+            while (pos != destination).any():
+                pos = self.get_next_position_stepwise(pos, destination, speed)
+                expected.append(pos.tolist())
+
+            trajectory = hexgrid.get_trajectory_towards(position, destination, speed)
+            self.assertEqual(trajectory.tolist(), expected)
+            self.assertEqual(hexgrid.get_next_position_towards(position, destination, speed).tolist(), expected[0] if len(expected) > 0 else position.tolist())
+            self.assertEqual(len(hexgrid.get_path_towards(position, destination)), hexgrid.hex_distance(position, destination))
+
+    def test_next_position_moves(self):
+        self.assertEqual(hexgrid.get_next_position_towards((0,0), (8,0), 1, moves = 0).tolist(), [0,0])
+        self.assertEqual(hexgrid.get_next_position_towards((0,0), (8,0), 1, moves = 3).tolist(), [6,0])
+        self.assertEqual(hexgrid.get_next_position_towards((0,0), (8,0), 1, moves = 9).tolist(), [8,0])
+
+    def test_read_only(self):
+        trajectory = hexgrid.get_trajectory_towards((0,0), (0,4), 1)
+        self.assertEqual(trajectory.tolist(), [[-1,1], [0,2], [-1,3], [0,4]])
+        self.assertFalse(trajectory.flags.writeable)
+
+
+class PathFinderTest(TestCase):
+
+    def setUp(self):
+        from world.pathfinding import CostMap, PathFinder
+        self.cost_map = CostMap((-10, 10, -5, 5))
+        self.cost_map.set_costs(hexgrid.DistanceSet((0, 0), 2), 10)
+        self.pathfinder = PathFinder(self.cost_map)
+
+    def test_find_path(self):
+        for bidirectional in (False, True):
+            path = self.pathfinder.find_path((-6, 0), (6, 0), bidirectional = bidirectional)
+            self.assertEqual(path[-1].tolist(), [6, 0])
+            self.assertTrue((hexgrid.hex_distance(path[1:], path[:-1]) == 1).all())
+            self.assertEqual(hexgrid.hex_distance(path[0], (-6, 0)), 1)
+            self.assertEqual(self.pathfinder.path_cost(path), 9)
+        self.assertEqual(len(self.pathfinder.find_path((0, 0), (0, 0))), 0)
+
+    def test_blocked(self):
+        self.cost_map.set_costs(hexgrid.DistanceSet((0, 0), 1), np.inf)
+        self.assertIsNone(self.pathfinder.find_path((-6, 0), (0, 0)))
+        self.assertIsNone(self.pathfinder.find_path((-6, 0), (0, 0), bidirectional = True))
+
+    def test_cache(self):
+        path1 = self.pathfinder.find_path((-6, 0), (6, 0))
+        self.assertIs(self.pathfinder.find_path((-6, 0), (6, 0)), path1)
+
+        # Modifying the cost map invalidates the cache
+        self.cost_map.set_costs(hexgrid.DistanceSet((0, 0), 2), 1)
+        path2 = self.pathfinder.find_path((-6, 0), (6, 0))
+        self.assertEqual(len(path2), 6)
+        self.assertEqual(self.pathfinder.path_cost(path2), 6)
+
 
 class UnionTest(TestCase):
 
@@ -363,6 +1289,15 @@ class UnionTest(TestCase):
         expected = order_tuple_list(make_set(self.set1.explicit()) | make_set(self.set2.explicit()))
         self.assertSequenceEqual(actual, expected)
 
+    def test_contains_many(self):
+        union_set = hexgrid.Union([self.set1, self.set2])
+        points = hexgrid.bbox_hex_coordinates((-6, 4, -4, 3))
+        expected = [p in union_set for p in points]
+        self.assertEqual(union_set.contains_many(points).tolist(), expected)
+
+    def test_explicit_empty(self):
+        self.assertEqual(len(hexgrid.Union([]).explicit()), 0)
+
 
 class IntersectionTest(TestCase):
 
@@ -377,6 +1312,61 @@ class IntersectionTest(TestCase):
         expected = order_tuple_list(make_set(self.set1.explicit()) & make_set(self.set2.explicit()))
         self.assertSequenceEqual(actual, expected)
 
+    def test_contains_many(self):
+        intersection_set = hexgrid.Intersection([self.set1, self.set2])
+        points = hexgrid.bbox_hex_coordinates((-6, 4, -4, 3))
+        expected = [p in intersection_set for p in points]
+        self.assertEqual(intersection_set.contains_many(points).tolist(), expected)
+
+
+class RunLengthSetTest(TestCase):
+
+    def setUp(self):
+        self.set1 = hexgrid.DistanceSet(( 1, 1), 1)
+        self.set2 = hexgrid.DistanceSet((-1,-1), 2)
+        self.set3 = hexgrid.DistanceSet(( 8, 0), 1)
+
+    def test_from_hexset(self):
+        for hexset in (self.set1, hexgrid.Union([self.set1, self.set2, self.set3]), hexgrid.Intersection([self.set1, self.set2])):
+            rls = hexgrid.RunLengthSet.from_hexset(hexset)
+            self.assertEqual([tuple(c) for c in rls.explicit()], [tuple(c) for c in hexset.explicit()])
+            self.assertEqual(len(rls), len(hexset.explicit()))
+
+        rls = hexgrid.RunLengthSet.from_hexset(hexgrid.Union([self.set1, self.set2]))
+        self.assertEqual(rls.bbox(), hexgrid.Union([self.set1, self.set2]).bbox())
+
+    def test_from_points(self):
+        rls = hexgrid.RunLengthSet.from_points([(0,0), (2,0), (6,0), (1,1)])
+        self.assertEqual(rls.num_runs, 3)
+        self.assertEqual(rls.rows[0].tolist(), [[0, 4], [6, 8]])
+        self.assertEqual(rls.rows[1].tolist(), [[1, 3]])
+
+    def test_set_operations(self):
+        make_set = lambda items: frozenset([tuple(item) for item in items])
+        rls1 = hexgrid.RunLengthSet.from_hexset(hexgrid.Union([self.set1, self.set3]))
+        rls2 = hexgrid.RunLengthSet.from_hexset(self.set2)
+        expected1 = make_set(self.set1.explicit()) | make_set(self.set3.explicit())
+        expected2 = make_set(self.set2.explicit())
+        self.assertEqual(make_set(rls1.union(rls2)), expected1 | expected2)
+        self.assertEqual(make_set(rls1.intersection(rls2)), expected1 & expected2)
+        self.assertEqual(make_set(rls1.difference(rls2)), expected1 - expected2)
+        self.assertEqual(make_set(rls1.difference(self.set2)), expected1 - expected2)
+
+    def test_contains(self):
+        union_set = hexgrid.Union([self.set1, self.set2, self.set3])
+        rls = hexgrid.RunLengthSet.from_hexset(union_set)
+        points = hexgrid.bbox_hex_coordinates((-6, 10, -4, 3))
+        self.assertEqual(rls.contains_many(points).tolist(), union_set.contains_many(points).tolist())
+        self.assertIn((8, 0), rls)
+        self.assertNotIn((4, 0), rls)
+
+    def test_empty(self):
+        rls = hexgrid.RunLengthSet()
+        self.assertEqual(len(rls), 0)
+        self.assertEqual(rls.explicit(), list())
+        self.assertNotIn((0, 0), rls)
+        self.assertEqual(len(rls.union(self.set1)), 7)
+
 
 class graph_matrix_Test(TestCase):
 
@@ -385,6 +1375,7 @@ class graph_matrix_Test(TestCase):
 
     def test_graph_matrix(self):
         G_actual = hexgrid.graph_matrix(self.set)
+        self.assertEqual(G_actual.nnz, 2 * 12)
         hex_list = self.set.explicit()
         n = len(hex_list)
         I = {tuple(u): uidx for uidx, u in enumerate(hex_list)}
@@ -415,7 +1406,15 @@ class graph_matrix_Test(TestCase):
         G_expected[I[(-1,-1)], I[(-2, 0)]] = 1
 
         G_expected = (G_expected + G_expected.T).clip(0, 1) ## this is to add the reverse edges to (0,0)
-        self.assertEqual(G_actual.tolist(), G_expected.tolist())
+        self.assertEqual(G_actual.toarray().tolist(), G_expected.tolist())
+        self.assertEqual(hexgrid.graph_matrix(self.set, dense = True).tolist(), G_expected.tolist())
+
+    def test_graph_matrix_union(self):
+        union_set = hexgrid.Union([hexgrid.DistanceSet((-2, 0), 2), hexgrid.DistanceSet((7, 1), 3)])
+        hex_list = union_set.explicit()
+        G_actual = hexgrid.graph_matrix(union_set)
+        G_expected = np.array([[int(hexgrid.hex_distance(u, v) == 1) for v in hex_list] for u in hex_list])
+        self.assertEqual(G_actual.toarray().tolist(), G_expected.tolist())
 
 
 class ClusteringTest(TestCase):
@@ -465,3 +1464,29 @@ class ClusteringTest(TestCase):
            1 1 1
 """
         self.assertEqual(normalize_hexset_text(c.text()), normalize_hexset_text(expected))
+
+    def test_connected_components(self):
+        # The weakly connected set is a single connected component
+        set1 = hexgrid.DistanceSet((-2, 0), 1)
+        set2 = hexgrid.DistanceSet(( 4, 0), 1)
+        c = hexgrid.Clustering(hexgrid.Union([set1, set2]), min_samples = 1, dbscan_compatible = False)
+        expected = \
+"""
+ 0 0   0 0 
+0 0 0 0 0 0
+ 0 0   0 0
+"""
+        self.assertEqual(normalize_hexset_text(c.text()), normalize_hexset_text(expected))
+
+        # The disconnected set consists of two connected components
+        set1 = hexgrid.DistanceSet((-2, 0), 1)
+        set2 = hexgrid.DistanceSet(( 6, 0), 1)
+        c = hexgrid.Clustering(hexgrid.Union([set1, set2]), min_samples = 1, dbscan_compatible = False)
+        self.assertEqual(sorted(set(c.labels.tolist())), [0, 1])
+
+    def test_density_rule(self):
+        # Only the center of a hexagon of radius 1 has all six neighbors
+        c = hexgrid.Clustering(hexgrid.DistanceSet((0, 0), 1), min_samples = 7, dbscan_compatible = False)
+        self.assertEqual(c.labels.tolist(), [0] * 7)
+        c = hexgrid.Clustering(hexgrid.RunLengthSet.from_points([(0, 0), (2, 0), (6, 0)]), min_samples = 2, dbscan_compatible = False)
+        self.assertEqual(c.labels.tolist(), [0, 0, -1])
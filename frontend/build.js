@@ -157,14 +157,12 @@ function build( api, world, blueprints )
 
                 /* Create constructions list.
                  */
-                const constructions = [];
                 if( celestial.constructions.length )
                 {
                     $( '#buildscreen .constructions-list li:not(#construction-template)' ).remove();
                     for( const construction of celestial.constructions )
                     {
                         const blueprint = blueprints.get( construction.blueprint );
-                        constructions.push( blueprint.base_id );
 
                         const constructionView = $( '#construction-template' ).clone();
                         constructionView.attr( 'id', '' );
@@ -175,55 +173,60 @@ function build( api, world, blueprints )
                     }
                 }
 
-                /* Create build options.
+                /* Create build options (which blueprints can be built on which celestials is determined by the server).
                  */
-                if( world.game.empire.blueprint_set.length )
-                {
-                    $( '#buildscreen .build-options-list li:not(#build-option-template)' ).remove();
-                    for( const blueprintUrl of world.game.empire.blueprint_set )
+                $.get( api.url + '/blueprints/eligibility',
+                    function( eligibility )
                     {
-                        const blueprint = blueprints.get( blueprintUrl );
-                        const requirements = blueprint.requirements.map( blueprints.resolveBaseIdToName ).join( ', ' );
-                        const requirementsOk = blueprint.requirements.every( ( requirement ) => constructions.includes( requirement ) );
-
-                        const buildOption = $( '#build-option-template' ).clone();
-                        buildOption.attr( 'id', '' );
-                        buildOption.attr( 'url', blueprint.url );
-                        buildOption.find( '.build-option-name' ).text( blueprint.data.name );
-                        buildOption.find( '.build-option-cost' ).text( blueprint.data.cost );
-                        if( !requirementsOk )
-                        {
-                            buildOption.addClass( 'requirements-not-satisfied' );
-                        }
-                        if( blueprint.data.size )
-                        {
-                            buildOption.find( '.build-option-size' ).text( blueprint.data.size );
-                        }
-                        else
-                        {
-                            buildOption.find( '.build-option-size' ).remove();
-                        }
-                        if( requirements.length )
-                        {
-                            buildOption.find( '.build-option-requirements' ).text( requirements );
-                        }
-                        else
+                        if( world.game.empire.blueprint_set.length )
                         {
-                            buildOption.find( '.build-option-requirements' ).remove();
-                        }
-                        buildOption.appendTo( $( '#buildscreen .build-options-list' ) );
+                            $( '#buildscreen .build-options-list li:not(#build-option-template)' ).remove();
+                            for( const blueprintUrl of world.game.empire.blueprint_set )
+                            {
+                                const blueprint = blueprints.get( blueprintUrl );
+                                const requirements = blueprint.requirements.map( blueprints.resolveBaseIdToName ).join( ', ' );
+                                const requirementsOk = ( eligibility[ celestial.url ] || {} )[ blueprint.url ] === true;
+
+                                const buildOption = $( '#build-option-template' ).clone();
+                                buildOption.attr( 'id', '' );
+                                buildOption.attr( 'url', blueprint.url );
+                                buildOption.find( '.build-option-name' ).text( blueprint.data.name );
+                                buildOption.find( '.build-option-cost' ).text( blueprint.data.cost );
+                                if( !requirementsOk )
+                                {
+                                    buildOption.addClass( 'requirements-not-satisfied' );
+                                }
+                                if( blueprint.data.size )
+                                {
+                                    buildOption.find( '.build-option-size' ).text( blueprint.data.size );
+                                }
+                                else
+                                {
+                                    buildOption.find( '.build-option-size' ).remove();
+                                }
+                                if( requirements.length )
+                                {
+                                    buildOption.find( '.build-option-requirements' ).text( requirements );
+                                }
+                                else
+                                {
+                                    buildOption.find( '.build-option-requirements' ).remove();
+                                }
+                                buildOption.appendTo( $( '#buildscreen .build-options-list' ) );
 
-                        if( requirementsOk )
-                        {
-                            buildOption.on( 'click',
-                                function()
+                                if( requirementsOk )
                                 {
-                                    build( sector, celestial, blueprint );
+                                    buildOption.on( 'click',
+                                        function()
+                                        {
+                                            build( sector, celestial, blueprint );
+                                        }
+                                    );
                                 }
-                            );
+                            }
                         }
                     }
-                }
+                );
 
                 /* Show the build screen.
                  */
@@ -179,6 +179,8 @@ function movables( api, world )
                     {
 
                     case 'MovementHandler':
+                        turns = movable.next_move_tick - world.game.tick;
+                        turns = turns == 1 ? `${ turns } turn` : `${ turns } turns`;
                         const destination = world.getHexField( movable.destination[ 0 ], movable.destination[ 1 ] ).attr( 'name' );
                         movableView.find( '.movable-status' ).html( `<span class="movable-status-line">Heading to <b>${ destination }</b>.</span> <span class="movable-status-line">Next jump in <b>${ turns }</b>.</span>` );
                         break;